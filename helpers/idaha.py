@@ -5,9 +5,30 @@
 
 import os
 import datetime
+import errno
 import random
+import stat
 import string
 import argparse
+import sys
+import time
+
+from xscan import XattrIndex, walk, make_stats, SYMLINKS_SKIP, SYMLINKS_FOLLOW, SYMLINK_POLICIES
+
+
+# The CFID is stored as this key (plus the namespace prefix):
+KEY = "aha.id"
+PREFIX = "user."
+
+# Random string added to a CFID that collides with one already assigned
+# (if -r is shorter):
+COLLISION_RANDOM_LENGTH = 6
+# Give up finding an unused CFID for a file after this many attempts:
+MAX_ATTEMPTS = 100
+
+
+def utf8_length(s):
+    return len(s.encode('utf-8', 'surrogateescape'))
 
 class CFIDGenerator:
 
@@ -15,11 +36,11 @@ class CFIDGenerator:
     HEART = "❤️"
 
     def __init__(self, args):
-        self.file_path = args.file_path
         self.precision = args.t
         self.context_length = args.c
         self.random_length = args.r
         self.max_total_length = args.m
+        self.max_total_bytes = args.b
         self.charset = args.s
         self.replace_whitespace = args.w
         self.format_json = args.j
@@ -30,7 +51,12 @@ class CFIDGenerator:
         Get the creation timestamp of a file using st_birthtime.
         This function is designed for ZFS on Linux.
         """
-        stat = os.stat(file_path)
+        return self.stat_timestamp(os.stat(file_path))
+
+    def stat_timestamp(self, stat):
+        """
+        Get the creation timestamp from an os.stat() result.
+        """
         try:
             return stat.st_birthtime
         except AttributeError:
@@ -80,28 +106,76 @@ class CFIDGenerator:
         """
         return s[:max_length]
 
-    def mkCFID(self):
+    def trim_bytes(self, s, max_bytes):
+        """
+        Trim a string to a maximum length in UTF-8 bytes, without cutting a character in half.
+
+        :param s: The string to trim
+        :param max_bytes: The maximum number of bytes of the string in UTF-8
+        :return: Trimmed string
+        """
+        data = s.encode('utf-8', 'surrogateescape')
+        if len(data) <= max_bytes:
+            return s
+        # Go back to the start of the character at the cut (at most 3 bytes):
+        while max_bytes > 0 and (data[max_bytes] & 0xC0) == 0x80:
+            max_bytes -= 1
+        return data[:max_bytes].decode('utf-8', 'surrogateescape')
+
+    def cfid_length(self, parts, length):
+        """
+        Get the length of the ID that `parts` (timestamp, context, random string) make up.
+
+        :param length: Function returning the length of a string (e.g. len)
+        """
+        total = length(self.STAR) + length(self.HEART) + length(parts[0])
+        for part in parts[1:]:
+            if part:
+                total += 1 + length(part)   # with "-"
+        return total
+
+    def fit_parts(self, parts, max_length, length, trim):
+        """
+        Shorten the parts of an ID, so the whole ID is at most `max_length` long.
+
+        The timestamp is shortened first, then the context, then the random
+        string. Each is cut once, by as much as needed; empty parts lose
+        their separator, too. If even the ⭐️❤️ don't fit, all parts are empty.
+
+        :param parts: List of timestamp, context and random string
+        :param max_length: Maximum length of the ID
+        :param length: Function returning the length of a string (len, or utf8_length)
+        :param trim: Function to trim a string to a length (trim_string, or trim_bytes)
+        :return: List of the shortened parts
+        """
+        parts = list(parts)
+        for i, part in enumerate(parts):
+            over = self.cfid_length(parts, length) - max_length
+            if over <= 0:
+                break
+            parts[i] = trim(part, max(length(part) - over, 0))
+        return parts
+
+    def mkCFID(self, file_path, timestamp=None, random_length=None):
         """
         Generate an ID for a given file based on its creation timestamp, context, and optional random string.
 
         :param file_path: Path to the file
-        :param precision: Precision level for the timestamp
-        :param context_length: Maximum length of the context
-        :param random_length: Length of the random string
-        :param max_total_length: Maximum total length of the ID
-        :param charset: Character set to use for the random string
+        :param timestamp: Creation timestamp of the file (None: stat the file)
+        :param random_length: Length of the random string (None: as configured)
         :return: Generated ID in the format ⭐️$TIMESTAMP-$CONTEXT-$RANDOM❤️
         """
 
-        file_path = self.file_path
         precision = self.precision
         context_length = self.context_length
-        random_length = self.random_length
+        if random_length is None:
+            random_length = self.random_length
         max_total_length = self.max_total_length
         charset = self.charset
 
         # Get the creation timestamp
-        timestamp = self.get_creation_timestamp(file_path)
+        if timestamp is None:
+            timestamp = self.get_creation_timestamp(file_path)
         timestamp_str = self.format_timestamp(timestamp, precision)
 
         # Get the context (parent folder and filename)
@@ -113,7 +187,13 @@ class CFIDGenerator:
         # Generate the random string if random_length is greater than 0
         random_str = self.generate_random_string(random_length, charset) if random_length > 0 else ""
 
-        # Initial ID construction
+        # Shorten the parts so the ID fits, and put it together once:
+        timestamp_str, context, random_str = self.fit_parts(
+                [timestamp_str, context, random_str], max_total_length, len, self.trim_string)
+        if self.max_total_bytes is not None:
+            timestamp_str, context, random_str = self.fit_parts(
+                    [timestamp_str, context, random_str], self.max_total_bytes, utf8_length, self.trim_bytes)
+
         cfid_parts = [f"{self.STAR}{timestamp_str}"]
         if context:
             cfid_parts.append(context)
@@ -121,49 +201,209 @@ class CFIDGenerator:
             cfid_parts.append(random_str)
         cfid = "-".join(cfid_parts) + self.HEART
 
-        # Trim the ID to fit within the maximum total length
-        while len(cfid) > max_total_length:
-            if len(timestamp_str) > 0:
-                timestamp_str = self.trim_string(timestamp_str, len(timestamp_str) - 1)
-            elif context and len(context) > 0:
-                context = self.trim_string(context, len(context) - 1)
-            elif random_str and len(random_str) > 0:
-                random_str = self.trim_string(random_str, len(random_str) - 1)
-            cfid_parts = [f"{self.STAR}{timestamp_str}"]
-            if context:
-                cfid_parts.append(context)
-            if random_str:
-                cfid_parts.append(random_str)
-            cfid = "-".join(cfid_parts) + self.HEART
-
         return cfid
 
+    def uniqueCFID(self, file_path, seen, timestamp=None):
+        """
+        Generate an ID for a given file that is not in `seen` yet, and add it there.
+
+        Files with the same creation timestamp and context (e.g. copies
+        with the same name in different folders) get the same ID. Then a
+        random string is added (or rolled again) until the ID is unique.
+
+        :param file_path: Path to the file
+        :param seen: Set of IDs (bytes) already assigned
+        :param timestamp: Creation timestamp of the file (None: stat the file)
+        :return: Tuple (ID, number of collisions resolved)
+        """
+        cfid = self.mkCFID(file_path, timestamp)
+        random_length = max(self.random_length, COLLISION_RANDOM_LENGTH)
+        collisions = 0
+        while os.fsencode(cfid) in seen:
+            collisions += 1
+            if collisions > MAX_ATTEMPTS:
+                raise ValueError("no unique ID after {} attempts (maximum length too short?)".format(MAX_ATTEMPTS))
+            cfid = self.mkCFID(file_path, timestamp, random_length)
+        seen.add(os.fsencode(cfid))
+        return cfid, collisions
+
+
+# --- Tree mode:
+
+def new_stats():
+    return make_stats(
+            'files',            # objects found in the trees
+            'assigned',         # new ID generated (and written)
+            'skipped',          # already had an ID
+            'collisions',       # IDs that had to be made unique
+            )
+
+def assign_tree(cfid_gen, roots, key=PREFIX + KEY, seen=None, write=True,
+        include=(), exclude=(), symlinks=SYMLINKS_SKIP, folders=False, stats=None):
+    """
+    Generate IDs for all files in the trees `roots` which don't have the
+    xattr `key` yet, and write them as `key`.
+
+    The trees are walked first, collecting the IDs already there, so new
+    IDs can't collide with them. Then the new ones are generated, with the
+    creation timestamps from that walk (no second stat()).
+
+    :param cfid_gen: CFIDGenerator to use
+    :param roots: List of paths to walk
+    :param seen: Set of IDs (bytes) already assigned elsewhere (e.g. from an index)
+    :param write: If False, only generate the IDs (dry run)
+    :param folders: Also assign IDs to folders (including `roots`)
+    :return: Generator of (path, ID) tuples, for new IDs
+    """
+    if stats is None:
+        stats = new_stats()
+    if seen is None:
+        seen = set()
+    follow = (symlinks == SYMLINKS_FOLLOW)
+
+    pending = []
+    for root in roots:
+        for path, st in walk(root, include, exclude, symlinks):
+            if stat.S_ISDIR(st.st_mode) and not folders:
+                # No new ID, but don't collide with one it already has:
+                try:
+                    seen.add(os.getxattr(path, key, follow_symlinks=follow))
+                except OSError:
+                    pass
+                continue
+
+            stats['files'] += 1
+            try:
+                seen.add(os.getxattr(path, key, follow_symlinks=follow))
+                stats['skipped'] += 1
+            except OSError as e:
+                if e.errno == errno.ENODATA:
+                    pending.append((path, cfid_gen.stat_timestamp(st)))
+                else:
+                    stats['errors'] += 1
+                    print("ERROR: cannot read ID of '{}': {}".format(path, e), file=sys.stderr)
+
+    for path, timestamp in pending:
+        try:
+            cfid, collisions = cfid_gen.uniqueCFID(path, seen, timestamp)
+            if write:
+                # XATTR_CREATE: never replace an ID set meanwhile.
+                os.setxattr(path, key, os.fsencode(cfid), os.XATTR_CREATE, follow_symlinks=follow)
+        except FileExistsError:
+            stats['skipped'] += 1
+            continue
+        except (OSError, ValueError) as e:
+            stats['errors'] += 1
+            print("ERROR: cannot assign ID to '{}': {}".format(path, e), file=sys.stderr)
+            continue
+        stats['assigned'] += 1
+        stats['collisions'] += collisions
+        yield path, cfid
+
+    stats['seconds'] = time.monotonic() - stats['start']
+
+def read_index_ids(filename, key):
+    """
+    Get the IDs already assigned in an xattr index (see xscan).
+
+    :return: Set of IDs (bytes)
+    """
+    index = XattrIndex(filename)
+    try:
+        return set(index.values(key))
+    finally:
+        index.close()
+
+def benchmark(cfid_gen, paths, count):
+    """
+    Measure how long generating an ID takes, in bulk (like tree mode:
+    timestamps already known, no stat()).
+
+    :param count: Number of IDs to generate per path
+    :return: Tuple (number of IDs, seconds)
+    """
+    timestamps = [cfid_gen.get_creation_timestamp(path) for path in paths]
+    start = time.perf_counter()
+    for path, timestamp in zip(paths, timestamps):
+        for _ in range(count):
+            cfid_gen.mkCFID(path, timestamp)
+    return count * len(paths), time.perf_counter() - start
+
+def show_stats(stats):
+    seconds = max(stats['seconds'], 1e-9)
+    print("found {} objects, assigned {} IDs ({} collisions resolved), skipped {} with an ID in {:.2f}s: {:.0f} files/s. {} errors.".format(
+        stats['files'],
+        stats['assigned'],
+        stats['collisions'],
+        stats['skipped'],
+        stats['seconds'],
+        stats['files'] / seconds,
+        stats['errors']
+        ), file=sys.stderr)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Generate a CFID for a file. The CFID is constructed using the file's creation timestamp, context (parent folder and filename), and an optional random string. The ID is wrapped in ⭐️ and ❤️ and can be configured to fit within a maximum total length."
         )
 
-    parser.add_argument("file_path", help="Path to the file")
+    parser.add_argument("paths", nargs="+", help="Path to the file (or files, or with -R: directories)")
     parser.add_argument("-t", type=int, choices=range(1, 7), default=6, help="Precision level for the timestamp (1=year, 2=year+month, 3=year+month+day, etc.)")
     parser.add_argument("-c", type=int, default=100, help="Maximum length of the context")
     parser.add_argument("-r", type=int, default=0, help="Length of the random string")
     parser.add_argument("-m", type=int, default=127, help="Maximum total length of the ID")
+    parser.add_argument("-b", type=int, default=None, help="Maximum total length of the ID in bytes (UTF-8), e.g. for filesystem limits")
     parser.add_argument("-s", type=str, default=string.ascii_letters + string.digits, help="Character set to use for the random string")
     parser.add_argument("-w", action="store_true", help="Replace whitespace with underscore characters in the context")
     parser.add_argument("-j", action="store_true", help="Format the output as key/value JSON")
+    parser.add_argument("-R", "--recursive", action="store_true", help="Tree mode: walk the directories, and write a CFID as xattr to every file that has none yet")
+    parser.add_argument("-F", "--folders", action="store_true", help="Tree mode: also write CFIDs to folders")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="Tree mode: only print the CFIDs, don't write them")
+    parser.add_argument("-p", "--prefix", type=str, default=PREFIX, help="Tree mode: namespace prefix of the '{}' xattr (default: {})".format(KEY, PREFIX))
+    parser.add_argument("-i", "--index", type=str, help="Tree mode: also avoid CFIDs already assigned in this xattr index (see xscan)")
+    parser.add_argument("-ex", "--exclude", type=str, action="append", default=[], help="Tree mode: skip files and folders matching this glob pattern. Can be given multiple times.")
+    parser.add_argument("--symlinks", type=str, choices=SYMLINK_POLICIES, default=SYMLINKS_SKIP, help="Tree mode: how to handle symbolic links (default: skip)")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Generate N IDs per path (not written), and show how long one takes")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Tree mode: don't print the CFIDs and the summary")
 
 
     args = parser.parse_args()
 
     cfid_gen = CFIDGenerator(args)
-    cfid = cfid_gen.mkCFID()
 
-    if args.j:
-        print(f'{{"aha.id":"{cfid}"}}')
-    else:
-        print(f"{cfid}")
+    if args.benchmark:
+        ids, seconds = benchmark(cfid_gen, args.paths, args.benchmark)
+        print("generated {} IDs in {:.3f}s: {:.2f} µs per ID, {:.0f} IDs/s.".format(
+            ids, seconds, seconds / max(ids, 1) * 1e6, ids / max(seconds, 1e-9)))
+        return
+
+    if args.recursive:
+        key = args.prefix + KEY
+        stats = new_stats()
+        seen = read_index_ids(args.index, key) if args.index else set()
+        for path, cfid in assign_tree(cfid_gen, args.paths, key, seen,
+                write=not args.dry_run,
+                exclude=args.exclude,
+                symlinks=args.symlinks,
+                folders=args.folders,
+                stats=stats):
+            if not args.quiet:
+                print(f"{cfid}  {path}")
+        if not args.quiet:
+            show_stats(stats)
+        if stats['errors']:
+            sys.exit(1)
+        return
+
+    seen = set()
+    for path in args.paths:
+        cfid, _ = cfid_gen.uniqueCFID(path, seen)
+
+        if args.j:
+            print(f'{{"{KEY}":"{cfid}"}}')
+        else:
+            print(f"{cfid}")
 
 
 if __name__ == "__main__":
     main()
-
@@ -10,11 +10,19 @@
 # extended attributes (xattrs).
 
 import argparse
+import errno
 import json
 import sys
 import os
+import re
 import traceback
 import time
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import io
+import itertools
 
 
 # --- Commandline parameters:
@@ -35,15 +43,38 @@ def parse_args():
             )
     parser.add_argument('-t', '--target',
             type=str,
-            required=True,
-            help='A filename to write xattrs to.'
+            help='A filename to write xattrs to. Required unless --bulk is used.'
             )
     parser.add_argument('-j', '--json',
             type=str,
-            required=True,
             default='-',
             help='A filename containing JSON data to write as xattrs, or - to read JSON data from standard input.'
             )
+    parser.add_argument('-b', '--bulk',
+            type=str,
+            default=None,
+            help='Bulk mode: A filename containing newline-delimited JSON records ({"target": ..., "attrs": {...}}) or a JSON array of them, or - to read them from standard input. Replaces --target and --json.'
+            )
+    parser.add_argument('-f', '--format',
+            type=str,
+            choices=MEDIA_FORMATS,
+            default=None,
+            help='Input is the JSON output of `exiftool -json` (an array, with "SourceFile") or `ffprobe -print_format json -show_format` (one or more objects), or auto-detect that per record. Nested objects are flattened to dotted keys, and each record is written to its own file, unless --target is given.'
+            )
+    parser.add_argument('-ns', '--namespace',
+            type=str,
+            action='append',
+            default=[],
+            help='With --format: Key namespace (after --prefix) for a format, as FORMAT=NAMESPACE (e.g. "exiftool=exif."), or NAMESPACE for all formats. (default: {})'.format(
+                ", ".join("{}={}".format(name, namespace) for name, namespace in MEDIA_NAMESPACES.items()))
+            )
+    parser.add_argument('--map',
+            type=str,
+            nargs=2,
+            metavar=('SOURCE', 'TARGET'),
+            default=None,
+            help='With --format: Write the metadata of files below SOURCE to the same path below TARGET instead (e.g. a thin copy).'
+            )
     parser.add_argument('-p', '--prefix',
             type=str,
             default='user.',
@@ -74,11 +105,46 @@ def parse_args():
             action='store_true',
             help='By default, empty values will NOT be written to target. Use this to write empty values.'
             )
+    parser.add_argument('--on_error',
+            type=str,
+            choices=XattrWriter.ERROR_POLICIES,
+            default=XattrWriter.FAIL,
+            help='What to do if a key cannot be written: fail (stop right away), skip (collect error and continue), retry (with exponential backoff). (default: fail)'
+            )
+    parser.add_argument('--retries',
+            type=int,
+            default=3,
+            help='Number of retries per key with --on_error=retry. (default: 3)'
+            )
+    parser.add_argument('--backoff',
+            type=float,
+            default=0.05,
+            help='Seconds to wait before the first retry. Doubles with every further retry. (default: 0.05)'
+            )
+    parser.add_argument('-w', '--workers',
+            type=int,
+            default=1,
+            help='Bulk mode: Number of threads writing xattrs in parallel. Helps a lot on network filesystems. (default: 1)'
+            )
+    parser.add_argument('-u', '--unordered',
+            default=False,
+            action='store_true',
+            help='Bulk mode: Report results as they complete, instead of in input order.'
+            )
+    parser.add_argument('-m', '--max_inflight',
+            type=int,
+            default=None,
+            help='Bulk mode: Max. number of records queued for the workers at once. (default: 4 x workers)'
+            )
 
     return parser
 
 def handle_args(args):
     # TODO: args.json: check if file exists.
+    if (not args.target) and (not args.bulk) and (not args.format):
+        print("Either --target, --bulk or --format is required. Exiting...")
+        sys.exit(2)
+
     if (args.verbose > 0) and (not args.quiet):
         print("\nVerbosity: {}".format(args.verbose))
 
@@ -86,11 +152,15 @@ def handle_args(args):
             print("Used configuration:")
             print("------------------------")
             print("Target:          {}".format(args.target))
+            print("Bulk input:      {}".format(args.bulk))
+            print("Input format:    {}".format(args.format))
+            print("Workers:         {}".format(args.workers))
             print("Default prefix:  {}".format(args.prefix))
             print("Lowercase key:   {}".format(args.lower_key))
             print("Lowercase value: {}".format(args.lower_value))
             print("Clear first:     {}".format(args.clear_first))
             print("Empty values:    {}".format(args.empty_values))
+            print("On error:        {}".format(args.on_error))
             print("------------------------")
 
         print("\n")
@@ -107,9 +177,106 @@ def convert_bytes(num, step_unit=1024.0):
 
 # --- handling JSON data:
 
+# JSON input is read in chunks this big (more for values bigger than that):
+CHUNK_SIZE = 64 * 1024
+
+JSON_WHITESPACE = ' \t\n\r'
+SKIP_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# What may follow a complete number (otherwise, it may go on in the next chunk):
+JSON_NUMBER_END = JSON_WHITESPACE + ',]'
+
+# A single value (e.g. one file's metadata) may be at most this big:
+MAX_VALUE_SIZE = 64 * 1024 * 1024
+# Parse errors this close to the end of what was read may just be a value
+# cut off by the chunk boundary (e.g. "tru", "\u00"). Earlier ones are real:
+ERROR_SLACK = 16
+
+# Parses JSON from `stream` incrementally, and yields one value at a time:
+# the elements of a top-level array, or each top-level value (one object,
+# or NDJSON). Only the value being parsed is held in memory, not the whole
+# document, so huge exports (e.g. `exiftool -json` of a whole archive) can
+# be processed with flat memory.
+# `buffer` is text already read from `stream`.
+# Raises json.JSONDecodeError as soon as the input can't be valid anymore,
+# or if a single value gets bigger than `max_size` characters.
+def iter_json(stream, chunk_size=CHUNK_SIZE, buffer='', max_size=MAX_VALUE_SIZE):
+    decoder = json.JSONDecoder()
+    pos = 0
+    eof = False
+    size = chunk_size
+    in_array = None     # not known until the first character
+    expect = 'value'    # array: 'value', 'first' (value or ']'), 'next' (',' or ']')
+
+    while True:
+        # Skip whitespace, reading more if needed:
+        pos = SKIP_WHITESPACE.match(buffer, pos).end()
+        if pos >= len(buffer):
+            if eof:
+                if in_array:
+                    raise json.JSONDecodeError("Expecting ',' or ']'", buffer, pos)
+                return
+            data = stream.read(size)
+            eof = not data
+            buffer = buffer[pos:] + data
+            pos = 0
+            continue
+
+        char = buffer[pos]
+        if in_array is None:
+            in_array = (char == '[')
+            if in_array:
+                pos += 1
+                expect = 'first'
+                continue
+        elif in_array and expect != 'value':
+            if char == ']':
+                return
+            if expect == 'next':
+                if char != ',':
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+                pos += 1
+                expect = 'value'
+                continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+            complete = True
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                # "2." of "2.5e3" is parsed as 2: check that the number ends here.
+                complete = eof or (end < len(buffer) and buffer[end] in JSON_NUMBER_END)
+        except json.JSONDecodeError as e:
+            # Cut off by the chunk boundary, or just invalid?
+            if eof or not (e.msg.startswith('Unterminated string') or e.pos >= len(buffer) - ERROR_SLACK):
+                raise
+            complete = False
+
+        if not complete:
+            if len(buffer) - pos > max_size:
+                raise json.JSONDecodeError("Value bigger than {} characters".format(max_size), buffer, pos)
+            # Read more. At least as much as there is, so a big value
+            # isn't parsed again for every chunk:
+            size = max(size, len(buffer) - pos)
+            data = stream.read(size)
+            eof = not data
+            buffer = buffer[pos:] + data
+            pos = 0
+            continue
+
+        pos = end
+        size = chunk_size
+        expect = 'next'
+        yield value
+
+# Returns the first JSON value in `stream` (the first element, if it's an
+# array), without reading the rest. None if there is no data.
+def read_json_first(stream):
+    for value in iter_json(stream):
+        return value
+    return None
+
 def read_json_file(filename):
     with open(filename, 'r') as f:
-        data = json.load(f)
+        data = read_json_first(f)
     return data
 
 def read_json_stdin():
@@ -119,18 +286,18 @@ def read_json_stdin():
     if sys.stdin.isatty():
         print("sys.stdin is a TTY? Strange. Exiting...")
         sys.exit(1)
-    elif not sys.stdin:
-        print("Empty, No JSON data provided in standard input. Exiting...")
-        sys.exit(2)
 
     try:
-        data = json.load(sys.stdin)
+        data = read_json_first(sys.stdin)
     except json.JSONDecodeError as e:
         print("Invalid JSON data provided in standard input. Exiting...")
         print(sys.stdin)
         raise e
         sys.exit(2) # this line should never be reached.
     else:
+        if data is None:
+            print("Empty, No JSON data provided in standard input. Exiting...")
+            sys.exit(2)
         if (args.quiet):
             # print dots to show activity, but keep visual noise low:
             print('.', end='')
@@ -140,158 +307,498 @@ def read_json_stdin():
     return data
 
 def show_json(json):
-    for key, value in json[0].items():
+    for key, value in json.items():
         print("{} = {}".format(key, value))
 
 # --- handling extended attributes:
 
-def clean_key(key):
-    global args
-
-    out = str(key).strip()
-    if (not args.archive and args.lower_key):
-        out = out.lower()
-    return out
-
-def clean_value(value):
-    out = str(value).strip()
-    if (not args.archive and args.lower_value):
-        out = out.lower()
-    return out
-
-def write_xattrs_list(target, data, prefix=None, archive=True):
-    if not isinstance(data, list):
-        raise ValueError("data must be a list")
+class XattrWriter:
+    """
+    Writes key/value data as xattrs to filesystem objects.
+
+    All options are carried by the writer itself (no module globals), so it
+    can be used as a library, e.g. by services writing at a high rate.
+
+    Error policies (`on_error`):
+      - "fail":  raise on the first key that can't be written (default).
+      - "skip":  skip that key, collect the error and continue.
+      - "retry": retry `retries` times with exponential backoff, starting at
+                 `backoff` seconds. Raises if all attempts failed. Only
+                 transient errors (TRANSIENT_ERRNOS) are retried, others
+                 (e.g. a missing file) raise right away.
+    """
+
+    FAIL = "fail"
+    SKIP = "skip"
+    RETRY = "retry"
+    ERROR_POLICIES = (FAIL, SKIP, RETRY)
+
+    # Errors worth trying again (e.g. busy or flaky network filesystems):
+    TRANSIENT_ERRNOS = (errno.EAGAIN, errno.EINTR, errno.EBUSY, errno.EIO)
+
+    def __init__(self, prefix='user.', archive=False, lower_key=False,
+            lower_value=False, empty_values=False, clear_first=False,
+            on_error=FAIL, retries=3, backoff=0.05, verbose=0, quiet=True):
+        if on_error not in self.ERROR_POLICIES:
+            raise ValueError("on_error must be one of: {}".format(", ".join(self.ERROR_POLICIES)))
+
+        self.prefix = prefix
+        self.archive = archive
+        self.lower_key = lower_key
+        self.lower_value = lower_value
+        self.empty_values = empty_values
+        self.clear_first = clear_first
+        self.on_error = on_error
+        self.retries = retries
+        self.backoff = backoff
+        self.verbose = verbose
+        self.quiet = quiet
+
+        # (target, key, exception) of every key skipped by the "skip" policy:
+        self.errors = []
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Create a writer configured by commandline arguments.
+
+        :param args: Parsed arguments, as returned by parse_args().parse_args()
+        :return: XattrWriter
+        """
+        return cls(
+                prefix=args.prefix,
+                archive=args.archive,
+                lower_key=args.lower_key,
+                lower_value=args.lower_value,
+                empty_values=args.empty_values,
+                clear_first=args.clear_first,
+                on_error=args.on_error,
+                retries=args.retries,
+                backoff=args.backoff,
+                verbose=args.verbose,
+                quiet=args.quiet
+                )
+
+    def clean_key(self, key):
+        out = str(key).strip()
+        if (not self.archive and self.lower_key):
+            out = out.lower()
+        return out
+
+    def clean_value(self, value):
+        out = str(value).strip()
+        if (not self.archive and self.lower_value):
+            out = out.lower()
+        return out
+
+    # Stores a list or dict of key/value pairs as xattrs to `target`.
+    def write_xattrs(self, target, data, report=True):
+        if isinstance(data, dict):
+            items = data.items()
+        elif isinstance(data, list):
+            items = data
+        else:
+            raise ValueError("data must be a dictionary or a list.")
 
-    for key, value in data.items():
-        try:
-            written = write_xattr(target, key, value, prefix, archive)
-        except Exception as e:
-            print("ERROR: could not write '{} = {}'.".format(key, value))
-            print(e)
-            time.sleep(1)
-            raise(e)
-            break
+        if self.clear_first:
+            clear_xattrs(target)
 
-    return written
+        total = {}
+        total['keys'] = 0
+        total['values'] = 0
+        total['errors'] = []
 
-def write_xattrs_dict(target, data, prefix=None, archive=True):
-    global args
+        for key, value in items:
+            try:
+                written = self.write_xattr_policy(target, key, value)
+            except Exception as e:
+                if not self.quiet:
+                    print("ERROR: could not write '{} = {}': {}".format(key, value, e), file=sys.stderr)
 
-    if not isinstance(data, dict):
-        raise ValueError("data must be a dictionary")
+                if self.on_error != self.SKIP:
+                    raise
 
-    total = {}
-    total['keys'] = 0
-    total['values'] = 0
+                total['errors'].append((key, e))
+                self.errors.append((target, key, e))
+                continue
 
-    for key, value in data.items():
-        try:
-            written = write_xattr(target, key, value, prefix, archive)
             # Add byte sizes:
             total['keys'] += written['keys']
             total['values'] += written['values']
 
-            if (args.verbose > 1):
-                #print("current: {} +{}".format(total['keys'], total['values']))
-                pass
+        total['sum'] = total['keys'] + total['values']
+
+        if report:
+            self.show_written(target, total, data)
+
+        return total
+
+    # Kept for callers that already know their data is a dict:
+    def write_xattrs_dict(self, target, data, report=True):
+        if not isinstance(data, dict):
+            raise ValueError("data must be a dictionary")
+        return self.write_xattrs(target, data, report)
+
+    # A list of [key, value] pairs, like AHAlodeck's metadata.
+    def write_xattrs_list(self, target, data, report=True):
+        if not isinstance(data, list):
+            raise ValueError("data must be a list")
+        return self.write_xattrs(target, data, report)
+
+    # Calls write_xattr() according to the error policy.
+    def write_xattr_policy(self, target, key, value):
+        if self.on_error != self.RETRY:
+            return self.write_xattr(target, key, value)
+
+        attempt = 0
+        while True:
+            try:
+                return self.write_xattr(target, key, value)
+            except OSError as e:
+                if (e.errno not in self.TRANSIENT_ERRNOS) or (attempt >= self.retries):
+                    raise
+                time.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+
+    # Prints what write_xattrs() has written to `target`.
+    def show_written(self, target, total, data):
+        if (self.verbose > 0):
+            if (self.quiet):
+                print(".", end='')
+            else:
+                print() # linebreak if verbose
+
+        if (not self.quiet):
+            print("wrote {} ({} +{}) / {} as attributes on '{}'.".format(
+                convert_bytes(total['sum']),
+                total['keys'], total['values'],
+                convert_bytes(sys.getsizeof(data)),
+                target
+                ))
 
-        except Exception as e:
-            print("ERROR: could not write '{} = {}'.".format(key, value))
-            #traceback.print_exc()
-            print(e)
-            time.sleep(1)
-            raise(e)
+    # Store a single xattr, but possibly preprocess/sanitize/normalize key/values
+    # before writing it.
+    def write_xattr(self, target, key, value):
+        # Count bytes written as attributes:
+        written = {}
+        written['keys'] = 0
+        written['values'] = 0
+
+        if self.archive:
+            # preserve:
+            strkey = key
+            strval = value
+        else:
+            # clean/strip:
+            strkey = self.clean_key(key)
+            strval = self.clean_value(value)
 
-    total['sum'] = total['keys'] + total['values']
+        # Skip empty values (unless allowed).
+        if (not strval) and (not self.empty_values):
+            return written
 
-    if (args.verbose > 0):
-        if (args.quiet):
-            print(".", end='')
-        else:
-            print() # linebreak if verbose
-
-    if (not args.quiet):
-        print("wrote {} ({} +{}) / {} as attributes on '{}'.".format(
-            convert_bytes(total['sum']),
-            total['keys'], total['values'],
-            convert_bytes(sys.getsizeof(data)),
-            target
-            ))
-
-    return written
-
-# Stores a list or dict of key/value pairs as xattrs to `target`.
-def write_xattrs(target, data, prefix=None, archive=True):
-    written = {}
-    if isinstance(data, dict):
-        written = write_xattrs_dict(target, data, prefix, archive)
-    elif isinstance(data, list):
-        written = write_xattrs_list(target, data, prefix, archive)
+        if (self.verbose > 2):
+            print("{} = '{}'".format(strkey.ljust(30), strval)) #debug
+
+        # We may want to change that when binary data comes in?
+        strval = str(strval).encode() # I have type-doubts and had issues already.
+        strkey = (self.prefix + strkey).encode() # now it's offical ;P
+
+        try:
+            # This is where things get written for real:
+            os.setxattr(target, strkey, strval, flags=os.XATTR_CREATE)
+
+            if (self.verbose > 3):
+                # Show information about current key/value set:
+                print("current: {} +{} - '{}' = '{}'".format(
+                    len(strkey),
+                    len(strval),
+                    strkey.decode(),
+                    strval.decode()
+                    ))
+
+            written['keys'] += len(strkey)
+            written['values'] += len(strval)
+        except FileExistsError:
+            if (self.verbose == 1) and (not self.quiet):
+                print('*', end='')
+            if (self.verbose > 4):
+                print("exists: {} = '{}'".format(strkey.ljust(30), strval))
+
+        # Brag how much we've made:
+        return written
+
+# --- Bulk mode:
+
+# Applies a single record of bulk input: an NDJSON line (parsed here), or
+# an already parsed element of a JSON array. `convert` turns other JSON
+# (e.g. exiftool's) into a record (see media_record()).
+# Runs in a worker thread when --workers > 1, so it must not print the
+# per-target result itself: that's done by write_bulk() in input order.
+# Returns a tuple: (lineno, target, data, written, error)
+def read_record(line, convert=None):
+    if isinstance(line, str):
+        record = json.loads(line)
     else:
-        raise ValueError("data must be a dictionary or a list.")
+        record = line
+    if convert is not None:
+        record = convert(record)
+    return record
 
-    return written
+def apply_record(writer, lineno, line, convert=None):
+    target = None
+    data = None
+    try:
+        record = read_record(line, convert)
+        target = record['target']
+        data = record['attrs']
 
-# Store a single xattr, but possibly preprocess/sanitize/normalize key/values
-# before writing it.
-def write_xattr(target, key, value, prefix=None, archive=True):
-    global args
+        written = writer.write_xattrs(target, data, report=False)
+    except Exception as e:
+        return (lineno, target, data, None, e)
+
+    return (lineno, target, data, written, None)
+
+# Yields (number, record) of bulk input: the (unparsed) lines of NDJSON, or
+# the elements of a JSON array, parsed as they stream in (see iter_json()).
+# `stream` is a file object, or any iterable of lines.
+def bulk_records(stream):
+    head = ''
+    if hasattr(stream, 'read'):
+        # Peek at the first character:
+        while True:
+            char = stream.read(1)
+            head += char
+            if char not in JSON_WHITESPACE or not char:
+                break
+        if char == '[':
+            yield from enumerate(iter_json(stream, buffer=head), start=1)
+            return
+        stream = itertools.chain(io.StringIO(head + stream.readline()), stream)
+
+    for lineno, line in enumerate(stream, start=1):
+        if line.strip():
+            yield lineno, line.strip()
+
+# Reads JSON records from `stream` (see bulk_records()) and writes each
+# record's "attrs" to its "target". Errors are reported per record, and
+# processing continues with the next one.
+#
+# With `convert`, the input is any JSON (see iter_json()), and each value is
+# turned into a record by convert(value) (see media_record()).
+#
+# With `workers` > 1, records are written by `workers` threads. All records
+# for the same target go to the same thread, so they're written one after
+# another, in input order (e.g. `-c` clearing can't race with another
+# record's writes). At most `max_inflight` records are queued at once, so
+# memory stays flat regardless of input size. If `ordered` is set, results
+# are reported in input order.
+#
+# Returns a summary dict with record counts and bytes written.
+def write_bulk(writer, stream, workers=1, ordered=True, max_inflight=None, convert=None):
+    summary = {}
+    summary['records'] = 0
+    summary['failed'] = 0
+    summary['keys'] = 0
+    summary['values'] = 0
+
+    def collect(result):
+        lineno, target, data, written, error = result
+        if error is not None:
+            summary['failed'] += 1
+            print("ERROR: record {} failed: {}".format(lineno, error), file=sys.stderr)
+            return
+
+        writer.show_written(target, written, data)
+        summary['keys'] += written['keys']
+        summary['values'] += written['values']
+
+    if convert is not None:
+        records = enumerate(iter_json(stream), start=1)
+    else:
+        records = bulk_records(stream)
 
-    # Count bytes written as attributes:
-    written = {}
-    written['keys'] = 0
-    written['values'] = 0
+    if workers <= 1:
+        for lineno, line in records:
+            summary['records'] += 1
+            collect(apply_record(writer, lineno, line, convert))
+    else:
+        if not max_inflight:
+            max_inflight = workers * 4
+
+        with contextlib.ExitStack() as stack:
+            pools = [stack.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers=1))
+                    for _ in range(workers)]
+            if ordered:
+                pending = collections.deque()
+            else:
+                pending = set()
+
+            for lineno, line in records:
+                summary['records'] += 1
+
+                # Wait for room in the queue:
+                while len(pending) >= max_inflight:
+                    if ordered:
+                        collect(pending.popleft().result())
+                    else:
+                        done, _ = concurrent.futures.wait(
+                                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in done:
+                            pending.remove(future)
+                            collect(future.result())
+
+                # Parsed here, to know the target (json holds the GIL anyway):
+                try:
+                    record = read_record(line, convert)
+                    pool = pools[hash(os.path.abspath(record['target'])) % workers]
+                except Exception:
+                    # apply_record() reports the error:
+                    future = pools[0].submit(apply_record, writer, lineno, line, convert)
+                else:
+                    future = pool.submit(apply_record, writer, lineno, record)
+                if ordered:
+                    pending.append(future)
+                else:
+                    pending.add(future)
+
+            # Drain what's left:
+            if ordered:
+                while pending:
+                    collect(pending.popleft().result())
+            else:
+                for future in concurrent.futures.as_completed(pending):
+                    collect(future.result())
+
+    summary['sum'] = summary['keys'] + summary['values']
+    return summary
+
+def show_bulk_summary(summary):
+    print("bulk: {} records, {} failed. wrote {} ({} +{}) as attributes.".format(
+        summary['records'],
+        summary['failed'],
+        convert_bytes(summary['sum']),
+        summary['keys'], summary['values']
+        ))
+
+def run_bulk(writer, source, convert=None):
+    global args
 
-    if archive:
-        # preserve:
-        strkey = key
-        strval = value
+    options = {
+            'workers': args.workers,
+            'ordered': not args.unordered,
+            'max_inflight': args.max_inflight,
+            'convert': convert
+            }
+
+    if source == '-':
+        if sys.stdin.isatty():
+            print("sys.stdin is a TTY? Strange. Exiting...")
+            sys.exit(1)
+        stream = sys.stdin
     else:
-        # clean/strip:
-        strkey = clean_key(key)
-        strval = clean_value(value)
+        stream = open(source, 'r')
 
-    # Skip empty values (unless allowed).
-    if (not strval) and (not args.empty_values):
-        return written
+    try:
+        summary = write_bulk(writer, stream, **options)
+    except json.JSONDecodeError as e:
+        # A JSON array can't be continued after an error (NDJSON can):
+        print("ERROR: invalid JSON input: {}".format(e), file=sys.stderr)
+        sys.exit(2)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
 
-    if (args.verbose > 2):
-        print("{} = '{}'".format(strkey.ljust(30), strval)) #debug
+    if (not args.quiet) or summary['failed']:
+        show_bulk_summary(summary)
 
-    # We may want to change that when binary data comes in?
-    strval = str(strval).encode() # I have type-doubts and had issues already.
-    strkey = (prefix + strkey).encode() # now it's offical ;P
+    return summary
 
-    try:
-        #print(".", end='')
-        # This is where things get written for real:
-        os.setxattr(target, strkey, strval, flags=os.XATTR_CREATE)
-
-        if (args.verbose > 3):
-            # Show information about current key/value set:
-            print("current: {} +{} - '{}' = '{}'".format(
-                len(strkey),
-                len(strval),
-                strkey.decode(),
-                strval.decode()
-                ))
 
-            print("blip!")
-        written['keys'] += len(strkey)
-        written['values'] += len(strval)
-    except FileExistsError:
-        if (args.verbose == 1) and (not args.quiet):
-            print('*', end='')
-        if (args.verbose > 4):
-            print("exists: {} = '{}'".format(strkey.ljust(30), strval))
+# --- exiftool / ffprobe output:
 
-    except Exception as e:
-        print("ouch.")
-        raise(e)
+EXIFTOOL = 'exiftool'
+FFPROBE = 'ffprobe'
+AUTO = 'auto'
+MEDIA_FORMATS = (EXIFTOOL, FFPROBE, AUTO)
+
+# Keys of each format are written below these namespaces (after the prefix):
+MEDIA_NAMESPACES = {
+        EXIFTOOL: 'exiftool.',
+        FFPROBE: 'ffprobe.'
+        }
+
+# Yields (key, value) pairs of nested JSON objects, with dotted keys:
+# {"format": {"tags": {"title": "x"}}} -> ("format.tags.title", "x").
+# Lists of objects (e.g. ffprobe's "streams") are numbered: "streams.0.codec_name".
+# Other lists are values (as before).
+def flatten(data, prefix=''):
+    for key, value in data.items():
+        key = prefix + str(key)
+        if isinstance(value, dict):
+            yield from flatten(value, key + '.')
+        elif isinstance(value, list) and any(isinstance(item, dict) for item in value):
+            for i, item in enumerate(value):
+                if isinstance(item, dict):
+                    yield from flatten(item, "{}.{}.".format(key, i))
+                else:
+                    yield "{}.{}".format(key, i), item
+        else:
+            yield key, value
+
+# Guesses the format of a single JSON value (one file's metadata).
+def media_format(value):
+    if isinstance(value, dict):
+        if 'SourceFile' in value:
+            return EXIFTOOL
+        if 'format' in value or 'streams' in value:
+            return FFPROBE
+    raise ValueError("neither exiftool nor ffprobe output")
+
+# Parses --namespace options into a dict of format -> namespace.
+def media_namespaces(options):
+    namespaces = dict(MEDIA_NAMESPACES)
+    for option in options:
+        name, sep, namespace = option.partition('=')
+        if not sep:
+            namespaces = dict.fromkeys(namespaces, option)
+        elif name in namespaces:
+            namespaces[name] = namespace
+        else:
+            raise ValueError("unknown format in namespace '{}'".format(option))
+    return namespaces
+
+# Replaces `source` at the start of `path` by `target`.
+def map_path(path, source, target):
+    if path == source:
+        return target
+    source = source.rstrip(os.sep) + os.sep
+    if path.startswith(source):
+        return os.path.join(target, path[len(source):])
+    return path
+
+# Turns one file's exiftool or ffprobe JSON into a bulk record: the target
+# is the file it describes ("SourceFile", or "format.filename"), unless
+# `target` is given. `mapping` is a (source, target) tuple for map_path().
+def media_record(value, fmt=AUTO, namespaces=MEDIA_NAMESPACES, target=None, mapping=None):
+    if fmt == AUTO:
+        fmt = media_format(value)
+
+    if target is None:
+        if fmt == EXIFTOOL:
+            target = value.get('SourceFile')
+        else:
+            target = value.get('format', {}).get('filename')
+        if not target:
+            raise ValueError("{} output without {}".format(
+                fmt, 'SourceFile' if fmt == EXIFTOOL else 'format.filename (use -show_format)'))
+        if mapping:
+            target = map_path(target, *mapping)
+
+    namespace = namespaces.get(fmt, '')
+    attrs = [(namespace + key, value) for key, value in flatten(value)]
+    return {'target': target, 'attrs': attrs}
 
-    # Brag how much we've made:
-    return written
 
 def read_xattrs(target):
     xattrs = os.listxattr(target)
@@ -322,37 +829,56 @@ def main():
         print("parsed args fine.")
 
     # Shortcut variables for popular options:
-    prefix = args.prefix
     target = args.target
+    writer = XattrWriter.from_args(args)
+
+    if args.bulk:
+        summary = run_bulk(writer, args.bulk)
+        if summary['failed']:
+            sys.exit(1)
+        return
+
+    if args.format:
+        # All records in one pass, each to its own file:
+        try:
+            namespaces = media_namespaces(args.namespace)
+        except ValueError as e:
+            print("ERROR: {}".format(e), file=sys.stderr)
+            sys.exit(2)
+        convert = functools.partial(media_record,
+                fmt=args.format,
+                namespaces=namespaces,
+                target=target,
+                mapping=args.map
+                )
+        summary = run_bulk(writer, args.json, convert)
+        if summary['failed']:
+            sys.exit(1)
+        return
 
     if args.json == '-':
         json_data = read_json_stdin()
     else:
         json_data = read_json_file(args.json)
 
-    if isinstance(json_data, list):
-        metadata = json_data[0];
-    else:
-        metadata = json_data;
+    # Only the first element of an array is used, the rest isn't even parsed:
+    metadata = json_data
 
     if (args.verbose > 4):
         # Very noisy, but useful for debugging:
         #print("read json.\n")
-        show_json(json_data)
+        show_json(metadata)
 
 
     if (args.verbose > 3):
         show_xattr_limits()    # nice, but verbose
 
-    if (args.clear_first):
-        if (args.verbose > 0):
-            print("Removing existing xattrs from {}...".format(target))
-        clear_xattrs(target)
+    if (args.clear_first) and (args.verbose > 0):
+        print("Removing existing xattrs from {}...".format(target))
 
     # Use the JSON input as metadata to write:
-    #metadata = json_data[0]
     try:
-        written = write_xattrs(target, metadata, prefix=prefix, archive=args.archive)
+        written = writer.write_xattrs(target, metadata)
     except Exception as e:
         print("Failed.")
         raise(e)
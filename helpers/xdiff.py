@@ -0,0 +1,373 @@
+#!/usr/bin/python3
+# @date: 2026-10-18
+
+# This program compares the extended attributes (xattrs) of two trees:
+# two live trees, a tree and a snapshot (see xsnap), or two snapshots.
+# It reports the files only on one side, and the keys added, removed or
+# changed per file - e.g. to verify that a copy tool didn't drop metadata.
+#
+# Both sides are read in path order and compared as they go, so memory
+# stays bounded no matter the size of the trees. Files whose xattr
+# fingerprints match are skipped without looking at their values.
+#
+# A side is given as:
+#   - a folder (or file):           music/
+#   - a snapshot file:              backup.xsnap        (its first, topmost path)
+#   - a folder inside a snapshot:   backup.xsnap/home/user/music
+
+import argparse
+import os
+import re
+import stat
+import sys
+import time
+
+from xscan import matches, read_xattrs, fingerprint, add_filter_args, make_stats, SYMLINKS_SKIP, SYMLINKS_NOFOLLOW, SYMLINKS_FOLLOW
+from xsnap import Snapshot, is_snapshot, split_path
+from xdump import encode_value
+
+
+# Kinds of differences:
+ADDED = "added"         # file only on the second side
+REMOVED = "removed"     # file only on the first side
+CHANGED = "changed"     # file on both sides, with different xattrs
+
+
+# --- Commandline parameters:
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+            description='XDIFF: Compare the xattrs of two trees or snapshots. (part of ⭐️-AHAlodeck-❤️)'
+            )
+    parser.add_argument('old',
+            help='First tree, snapshot file, or folder in a snapshot (snapshot.xsnap/path).'
+            )
+    parser.add_argument('new',
+            help='Second tree, snapshot file, or folder in a snapshot (snapshot.xsnap/path).'
+            )
+    parser.add_argument('-m', '--match',
+            type=str,
+            default=None,
+            help='Only compare keys matching this regular expression, e.g. "^user\\." (default: all keys)'
+            )
+    add_filter_args(parser, 'compare')
+    parser.add_argument('-b', '--brief',
+            action='store_true',
+            default=False,
+            help='Only list the files that differ, not the keys.'
+            )
+    parser.add_argument('-v', '--verbose',
+            action='count',
+            default=0,
+            help='Increase verbosity level: show the values of changed keys.'
+            )
+    parser.add_argument('-q', '--quiet',
+            action='store_true',
+            default=False,
+            help='Be as quiet as possible with text output: no summary.'
+            )
+
+    return parser
+
+
+# --- Reading both sides:
+
+def walk_sorted(root, exclude=(), symlinks=SYMLINKS_SKIP):
+    """
+    Like xscan.walk(), but in the order of the (byte-wise sorted) relative
+    paths - the order of snapshots. Only one listing per folder level is
+    kept in memory.
+
+    :return: Generator of (relative path ("" for `root`), path) tuples
+    """
+    root = os.path.abspath(root)
+    root_stat = os.stat(root)
+    yield '', root
+    if not stat.S_ISDIR(root_stat.st_mode):
+        return
+
+    follow = (symlinks == SYMLINKS_FOLLOW)
+    visited = {(root_stat.st_dev, root_stat.st_ino)}
+
+    def listing(folder, relative):
+        # A folder is listed twice: itself under its name, its contents
+        # under name + "/". Sorting these keys gives the order of the full
+        # paths: "a" < "a.txt" < "a/b" < "ab".
+        items = []
+        try:
+            entries = list(os.scandir(folder))
+        except OSError as e:
+            print("WARNING: cannot read folder '{}': {}".format(folder, e), file=sys.stderr)
+            return items
+
+        for entry in entries:
+            path = os.path.join(relative, entry.name) if relative else entry.name
+            if exclude and matches(exclude, entry.name, path):
+                continue
+            if entry.is_symlink() and symlinks == SYMLINKS_SKIP:
+                continue
+            try:
+                st = entry.stat(follow_symlinks=follow)
+            except OSError:
+                continue
+
+            name = os.fsencode(entry.name)
+            if stat.S_ISDIR(st.st_mode) and (st.st_dev, st.st_ino) not in visited:
+                visited.add((st.st_dev, st.st_ino))
+                items.append((name + b'/', True, path, entry.path))
+            items.append((name, False, path, entry.path))
+
+        items.sort()
+        return items
+
+    stack = [iter(listing(root, ''))]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+            continue
+        _, contents, relative, path = item
+        if contents:
+            stack.append(iter(listing(path, relative)))
+        else:
+            yield relative, path
+
+def read_tree(root, match=None, exclude=(), symlinks=SYMLINKS_SKIP, stats=None):
+    """
+    Read the xattrs of a live tree, in path order.
+
+    :return: Generator of (relative path, digest (None), xattrs) tuples
+    """
+    follow = (symlinks != SYMLINKS_NOFOLLOW)
+    for relative, path in walk_sorted(root, exclude, symlinks):
+        try:
+            xattrs = read_xattrs(path, follow_symlinks=follow)
+        except OSError as e:
+            if stats is not None:
+                stats['errors'] += 1
+            print("WARNING: cannot read '{}': {}".format(path, e), file=sys.stderr)
+            continue
+        if match:
+            xattrs = {key: value for key, value in xattrs.items() if match.search(key)}
+        yield relative, None, xattrs
+
+def read_snapshot(snapshot, root, match=None, exclude=()):
+    """
+    Read the records below `root` in a Snapshot, in path order.
+
+    Fingerprints cover all keys: with `match`, they're not used.
+
+    :return: Generator of (relative path, digest, xattrs) tuples
+    """
+    for relative, digest, xattrs in snapshot.tree(root):
+        if relative and exclude:
+            # Like walk(): check every folder on the way, too.
+            parts = relative.split(os.sep)
+            if any(matches(exclude, part, os.sep.join(parts[:i + 1])) for i, part in enumerate(parts)):
+                continue
+        if match:
+            xattrs = {key: value for key, value in xattrs.items() if match.search(key)}
+            digest = None
+        yield relative, digest, xattrs
+
+def included(side, include):
+    """Only the files (and folders) of `side` matching one of the glob patterns `include`."""
+    for item in side:
+        relative = item[0]
+        if (not relative) or matches(include, os.path.basename(relative), relative):
+            yield item
+
+def open_side(spec, match=None, include=(), exclude=(), symlinks=SYMLINKS_SKIP, stats=None):
+    """
+    Open one side of the comparison (see the top of this file).
+
+    :return: Tuple (generator of (relative path, digest, xattrs), Snapshot or None)
+    """
+    snapshot = None
+    if os.path.isfile(spec) and is_snapshot(spec):
+        snapshot = Snapshot(spec)
+        # The topmost path: the root of the (first) scan.
+        root = snapshot.read_record(snapshot.record_offset(0))[0] if len(snapshot) else os.sep
+        side = read_snapshot(snapshot, root, match, exclude)
+    elif split_path(spec):
+        filename, root = split_path(spec)
+        snapshot = Snapshot(filename)
+        if snapshot.find(root) is None:
+            # Paths are stored as they were scanned (usually absolute):
+            root = os.sep + root
+        side = read_snapshot(snapshot, root, match, exclude)
+    elif os.path.exists(spec):
+        side = read_tree(spec, match, exclude, symlinks, stats)
+    else:
+        raise FileNotFoundError(2, "No such file, folder or snapshot", spec)
+
+    if include:
+        side = included(side, include)
+    return side, snapshot
+
+
+# --- Comparing:
+
+def new_stats():
+    return make_stats(
+            'files',
+            'same',
+            'fast',             # same fingerprint: values not compared
+            ADDED,
+            REMOVED,
+            CHANGED,
+            )
+
+def diff_xattrs(old, new):
+    """
+    Compare the xattrs of one file.
+
+    :return: Tuple of sorted key lists: (added, removed, changed)
+    """
+    added = sorted(key for key in new if key not in old)
+    removed = sorted(key for key in old if key not in new)
+    changed = sorted(key for key in old if key in new and old[key] != new[key])
+    return added, removed, changed
+
+def diff(old, new, stats=None):
+    """
+    Compare two sides, as returned by open_side(), by merging them in path
+    order.
+
+    :param stats: Statistics to update (see new_stats())
+    :return: Generator of (kind, relative path, old xattrs, new xattrs, keys)
+             for each file that differs. `keys` is (added, removed, changed)
+             for CHANGED files, None otherwise.
+    """
+    if stats is None:
+        stats = new_stats()
+
+    end = object()
+    a = next(old, end)
+    b = next(new, end)
+    while a is not end or b is not end:
+        stats['files'] += 1
+        a_key = os.fsencode(a[0]) if a is not end else None
+        b_key = os.fsencode(b[0]) if b is not end else None
+
+        if b is end or (a is not end and a_key < b_key):
+            stats[REMOVED] += 1
+            yield REMOVED, a[0], a[2], None, None
+            a = next(old, end)
+            continue
+        if a is end or b_key < a_key:
+            stats[ADDED] += 1
+            yield ADDED, b[0], None, b[2], None
+            b = next(new, end)
+            continue
+
+        # On both sides. If only one has a fingerprint (snapshot vs. live
+        # tree), compute the other: that's cheaper than reading the values
+        # of the snapshot.
+        relative, a_digest, a_xattrs = a
+        _, b_digest, b_xattrs = b
+        if a_digest is None and b_digest is not None:
+            a_digest = fingerprint(a_xattrs)
+        elif b_digest is None and a_digest is not None:
+            b_digest = fingerprint(b_xattrs)
+
+        if a_digest is not None and a_digest == b_digest:
+            stats['same'] += 1
+            stats['fast'] += 1
+        else:
+            keys = diff_xattrs(a_xattrs, b_xattrs)
+            if any(keys):
+                stats[CHANGED] += 1
+                yield CHANGED, relative, a_xattrs, b_xattrs, keys
+            else:
+                stats['same'] += 1
+
+        a = next(old, end)
+        b = next(new, end)
+
+    stats['seconds'] = time.monotonic() - stats['start']
+
+
+# --- Output:
+
+def show_value(value):
+    return encode_value(value).decode('utf-8', errors='replace')
+
+def show_diff(kind, relative, old, new, keys, brief=False, verbose=0):
+    name = relative or '.'
+    if kind == ADDED:
+        print("added: {}".format(name))
+        return
+    if kind == REMOVED:
+        print("removed: {}".format(name))
+        return
+
+    print("changed: {}".format(name))
+    if brief:
+        return
+    added, removed, changed = keys
+    for key in added:
+        print("  + {}".format(key) + ("={}".format(show_value(new[key])) if verbose else ""))
+    for key in removed:
+        print("  - {}".format(key) + ("={}".format(show_value(old[key])) if verbose else ""))
+    for key in changed:
+        if verbose:
+            print("  ~ {}: {} -> {}".format(key, show_value(old[key]), show_value(new[key])))
+        else:
+            print("  ~ {}".format(key))
+
+def show_stats(stats):
+    seconds = max(stats['seconds'], 1e-9)
+    print("compared {} files in {:.2f}s ({:.0f} files/s): {} same ({} by fingerprint), {} changed, {} added, {} removed. {} errors.".format(
+        stats['files'],
+        stats['seconds'],
+        stats['files'] / seconds,
+        stats['same'],
+        stats['fast'],
+        stats[CHANGED],
+        stats[ADDED],
+        stats[REMOVED],
+        stats['errors']
+        ), file=sys.stderr)
+
+
+# --- Main function:
+
+def main():
+    parser = parse_args()
+    args = parser.parse_args()
+
+    match = re.compile(args.match) if args.match else None
+    stats = new_stats()
+
+    snapshots = []
+    try:
+        sides = []
+        for spec in (args.old, args.new):
+            side, snapshot = open_side(spec, match, args.include, args.exclude, args.symlinks, stats)
+            sides.append(side)
+            if snapshot is not None:
+                snapshots.append(snapshot)
+
+        differences = 0
+        for kind, relative, old, new, keys in diff(sides[0], sides[1], stats):
+            differences += 1
+            show_diff(kind, relative, old, new, keys, args.brief, args.verbose)
+    except (OSError, ValueError) as e:
+        print("ERROR: {}".format(e), file=sys.stderr)
+        sys.exit(2)
+    finally:
+        for snapshot in snapshots:
+            snapshot.close()
+
+    if not args.quiet:
+        show_stats(stats)
+
+    # Like diff: 0 = same, 1 = different, 2 = trouble.
+    if stats['errors']:
+        sys.exit(2)
+    if differences:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
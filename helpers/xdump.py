@@ -0,0 +1,444 @@
+#!/usr/bin/python3
+# @date: 2026-10-18
+
+# This program dumps the extended attributes (xattrs) of whole directory
+# trees to a text file, and restores them from it - in the same format as
+# `getfattr -d` / `setfattr --restore` (see examples/song.db.xattrs):
+#
+#   # file: path/to/file
+#   user.key="text value"
+#   user.blob=0sAAEC...
+#
+# That's how metadata survives copying to storage without xattr support
+# (or being sent by mail). Unlike calling getfattr/setfattr per file, the
+# whole tree is handled in one process, with buffered I/O.
+
+import argparse
+import base64
+import collections
+import concurrent.futures
+import os
+import re
+import sys
+import time
+
+from j2x import convert_bytes
+from xscan import walk, add_filter_args, make_stats, SYMLINKS_SKIP, SYMLINKS_NOFOLLOW
+from xsnap import Snapshot, is_snapshot
+
+
+# How values are written:
+ENCODING_AUTO = "auto"          # text if printable, base64 otherwise (default)
+ENCODING_TEXT = "text"          # always quoted text, with octal escapes
+ENCODING_HEX = "hex"            # 0x...
+ENCODING_BASE64 = "base64"      # 0s...
+ENCODINGS = (ENCODING_AUTO, ENCODING_TEXT, ENCODING_HEX, ENCODING_BASE64)
+
+# Only these keys are dumped (and cleared on restore) by default. Like
+# getfattr, this leaves out namespaces normal users can't write anyway
+# (security.*, trusted.*, system.*).
+DEFAULT_MATCH = r'^user\.'
+
+FILE_PREFIX = b'# file: '
+
+# Bytes that are written as octal escapes (\ooo), like getfattr does
+# (spaces in keys are not):
+ESCAPE_PATH = re.compile(rb'[\x00-\x1f\x7f\\]')
+ESCAPE_KEY = re.compile(rb'[\x00-\x1f\x7f\\=]')
+ESCAPE_VALUE = re.compile(rb'[\x00-\x1f\x7f\\"]')
+UNESCAPE = re.compile(rb'\\([0-7]{3}|\\)')
+
+# Buffer size for reading and writing dumps:
+BUFFER_SIZE = 1024 * 1024
+
+
+# --- Commandline parameters:
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+            description='XDUMP: Dump xattrs of whole directory trees in getfattr format, or restore them. (part of ⭐️-AHAlodeck-❤️)'
+            )
+    parser.add_argument('paths',
+            nargs='*',
+            help='Directories (or files) to dump.'
+            )
+    parser.add_argument('-r', '--restore',
+            type=str,
+            default=None,
+            help='Restore xattrs from this dump file (or snapshot, see xsnap) instead ("-" for stdin).'
+            )
+    parser.add_argument('-o', '--output',
+            type=str,
+            default='-',
+            help='File to write the dump to. (default: stdout)'
+            )
+    parser.add_argument('-C', '--directory',
+            type=str,
+            default='.',
+            help='Restore: Paths in the dump (or snapshot) are relative to this folder, e.g. "/" to restore them where they were. (default: current folder)'
+            )
+    parser.add_argument('-c', '--clear',
+            action='store_true',
+            default=False,
+            help='Restore: Remove (matching) xattrs that are not in the dump.'
+            )
+    parser.add_argument('-m', '--match',
+            type=str,
+            default=DEFAULT_MATCH,
+            help='Only handle keys matching this regular expression. (default: "{}")'.format(DEFAULT_MATCH)
+            )
+    parser.add_argument('-e', '--encoding',
+            type=str,
+            choices=ENCODINGS,
+            default=ENCODING_AUTO,
+            help='How to write values: text if printable (auto), text, hex or base64. (default: auto)'
+            )
+    parser.add_argument('-a', '--absolute_names',
+            action='store_true',
+            default=False,
+            help='Keep the leading "/" of absolute paths.'
+            )
+    add_filter_args(parser, 'dump')
+    parser.add_argument('-w', '--workers',
+            type=int,
+            default=8,
+            help='Number of threads reading xattrs in parallel. (default: 8)'
+            )
+    parser.add_argument('-v', '--verbose',
+            action='count',
+            default=0,
+            help='Increase verbosity level.'
+            )
+    parser.add_argument('-q', '--quiet',
+            action='store_true',
+            default=False,
+            help='Be as quiet as possible with text output.'
+            )
+
+    return parser
+
+
+# --- Encoding:
+
+def escape(pattern, data):
+    """Replace the bytes matching `pattern` in `data` by octal escapes."""
+    return pattern.sub(lambda m: b'\\%03o' % m.group()[0], data)
+
+def unescape(data):
+    """The opposite of escape()."""
+    def replace(m):
+        code = m.group(1)
+        if code == b'\\':
+            return b'\\'
+        return bytes([int(code, 8)])
+    return UNESCAPE.sub(replace, data)
+
+def is_text(value):
+    """True if `value` is UTF-8 text, without control characters (except whitespace)."""
+    try:
+        text = value.decode('utf-8')
+    except UnicodeDecodeError:
+        return False
+    return text.isprintable() or all(c.isprintable() or c in '\t\n\r' for c in text)
+
+def encode_value(value, encoding=ENCODING_AUTO):
+    """
+    Encode an xattr value (bytes) the way getfattr does.
+
+    :param value: Value to encode (bytes-like)
+    :param encoding: One of ENCODINGS
+    :return: Encoded value (bytes)
+    """
+    value = bytes(value)
+    if encoding == ENCODING_AUTO:
+        encoding = ENCODING_TEXT if is_text(value) else ENCODING_BASE64
+
+    if encoding == ENCODING_HEX:
+        return b'0x' + value.hex().encode()
+    if encoding == ENCODING_BASE64:
+        return b'0s' + base64.b64encode(value)
+    return b'"' + escape(ESCAPE_VALUE, value) + b'"'
+
+def decode_value(data):
+    """The opposite of encode_value(). Also accepts unquoted text."""
+    if data.startswith((b'0x', b'0X')):
+        return bytes.fromhex(data[2:].decode())
+    if data.startswith((b'0s', b'0S')):
+        return base64.b64decode(data[2:])
+    if len(data) >= 2 and data.startswith(b'"') and data.endswith(b'"'):
+        data = data[1:-1]
+    return unescape(data)
+
+
+# --- Dumping:
+
+def dump_name(path, absolute_names=False):
+    """The name of `path` in a dump: like getfattr, without leading "/"."""
+    name = os.fsencode(path)
+    if not absolute_names:
+        name = name.lstrip(b'/') or b'.'
+    return escape(ESCAPE_PATH, name)
+
+def read_matching(path, match, follow_symlinks=True):
+    """
+    Read the xattrs of `path` whose key matches `match` (compiled regex).
+
+    :return: List of (key, value) tuples, sorted by key
+    """
+    xattrs = []
+    for key in sorted(os.listxattr(path, follow_symlinks=follow_symlinks)):
+        if match and not match.search(key):
+            continue
+        try:
+            xattrs.append((key, os.getxattr(path, key, follow_symlinks=follow_symlinks)))
+        except FileNotFoundError:
+            # Removed between list and get.
+            pass
+    return xattrs
+
+def format_file(name, xattrs, encoding=ENCODING_AUTO):
+    """Format the dump of one file (including the blank line after it)."""
+    lines = [FILE_PREFIX + name]
+    for key, value in xattrs:
+        lines.append(escape(ESCAPE_KEY, os.fsencode(key)) + b'=' + encode_value(value, encoding))
+    lines.append(b'')
+    lines.append(b'')
+    return b'\n'.join(lines)
+
+def new_stats():
+    return make_stats('files', 'dumped', 'attrs', 'bytes')
+
+def dump(output, roots, match=DEFAULT_MATCH, encoding=ENCODING_AUTO,
+        absolute_names=False, include=(), exclude=(), symlinks=SYMLINKS_SKIP,
+        workers=8, verbose=0):
+    """
+    Write the xattrs of all files in the trees `roots` to `output`.
+    Files without (matching) xattrs are left out, like getfattr does.
+
+    Reading is done by `workers` threads, in order: the dump lists the
+    files in the order they were walked.
+
+    :param output: Binary stream to write to
+    :return: Statistics (see new_stats())
+    """
+    stats = new_stats()
+    if isinstance(match, str):
+        match = re.compile(match) if match else None
+    follow = (symlinks != SYMLINKS_NOFOLLOW)
+
+    def read(path, relative):
+        try:
+            return path, relative, read_matching(path, match, follow), None
+        except OSError as e:
+            return path, relative, None, e
+
+    def collect(result):
+        path, relative, xattrs, error = result
+        stats['files'] += 1
+        if error is not None:
+            stats['errors'] += 1
+            print("ERROR: cannot read '{}': {}".format(path, error), file=sys.stderr)
+            return
+        if not xattrs:
+            return
+
+        output.write(format_file(dump_name(relative, absolute_names), xattrs, encoding))
+        stats['dumped'] += 1
+        stats['attrs'] += len(xattrs)
+        stats['bytes'] += sum(len(key) + len(value) for key, value in xattrs)
+        if verbose:
+            print("{}: {} attributes".format(path, len(xattrs)), file=sys.stderr)
+
+    def files():
+        for root in roots:
+            # Keep the paths as given (relative or absolute):
+            top = os.path.abspath(root)
+            for path, _ in walk(root, include, exclude, symlinks):
+                yield path, os.path.normpath(os.path.join(root, os.path.relpath(path, top)))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        pending = collections.deque()
+        for path, relative in files():
+            while len(pending) >= max(workers, 1) * 4:
+                collect(pending.popleft().result())
+            pending.append(pool.submit(read, path, relative))
+        while pending:
+            collect(pending.popleft().result())
+
+    output.flush()
+    stats['seconds'] = time.monotonic() - stats['start']
+    return stats
+
+
+# --- Restoring:
+
+def parse(stream):
+    """
+    Read a dump from `stream` (binary), one file at a time.
+
+    :return: Generator of (lineno, path, list of (key, value)) tuples
+    """
+    path = None
+    start = 0
+    xattrs = []
+
+    for lineno, line in enumerate(stream, start=1):
+        line = line.rstrip(b'\r\n')
+
+        if line.startswith(FILE_PREFIX):
+            if path is not None:
+                yield start, path, xattrs
+            path = os.fsdecode(unescape(line[len(FILE_PREFIX):]))
+            start = lineno
+            xattrs = []
+        elif not line.strip() or line.startswith(b'#'):
+            continue
+        elif path is None:
+            raise ValueError("line {}: attribute outside of a '# file:' block".format(lineno))
+        else:
+            key, _, value = line.partition(b'=')
+            try:
+                value = decode_value(value)
+            except ValueError as e:
+                raise ValueError("line {}: invalid value: {}".format(lineno, e))
+            xattrs.append((os.fsdecode(unescape(key)), value))
+
+    if path is not None:
+        yield start, path, xattrs
+
+def restore(stream, directory='.', match=DEFAULT_MATCH, clear=False,
+        follow_symlinks=True, verbose=0):
+    """
+    Set the xattrs read from the dump in `stream` on the files they belong
+    to. Paths are relative to `directory` (absolute ones stay as they are).
+    Files that can't be written are reported and skipped.
+
+    :param match: Only restore (and clear) keys matching this regex
+    :param clear: Also remove (matching) xattrs that are not in the dump
+    :return: Statistics (see new_stats())
+    """
+    return restore_files(parse(stream), directory, match, clear, follow_symlinks, verbose)
+
+def read_snapshot(snapshot):
+    """
+    The files of a Snapshot, like parse() returns them (numbered instead of
+    line numbers). Paths are made relative, like in a dump without
+    --absolute_names, so they're restored below `directory`.
+    """
+    for number, (path, _, xattrs) in enumerate(snapshot, start=1):
+        yield number, path.lstrip(os.sep) or '.', list(xattrs.items())
+
+def restore_files(files, directory='.', match=DEFAULT_MATCH, clear=False,
+        follow_symlinks=True, verbose=0):
+    """
+    Like restore(), but for (lineno, path, xattrs) tuples, as returned by
+    parse() or read_snapshot().
+    """
+    stats = new_stats()
+    if isinstance(match, str):
+        match = re.compile(match) if match else None
+
+    for lineno, path, xattrs in files:
+        target = os.path.join(directory, path)
+        stats['files'] += 1
+        if match:
+            xattrs = [(key, value) for key, value in xattrs if match.search(key)]
+        try:
+            if clear:
+                keep = {key for key, _ in xattrs}
+                for key in os.listxattr(target, follow_symlinks=follow_symlinks):
+                    if key not in keep and (match is None or match.search(key)):
+                        os.removexattr(target, key, follow_symlinks=follow_symlinks)
+
+            for key, value in xattrs:
+                os.setxattr(target, key, value, follow_symlinks=follow_symlinks)
+        except OSError as e:
+            stats['errors'] += 1
+            print("ERROR: line {}: cannot restore '{}': {}".format(lineno, target, e), file=sys.stderr)
+            continue
+
+        stats['dumped'] += 1
+        stats['attrs'] += len(xattrs)
+        stats['bytes'] += sum(len(key) + len(value) for key, value in xattrs)
+        if verbose:
+            print("{}: {} attributes".format(target, len(xattrs)), file=sys.stderr)
+
+    stats['seconds'] = time.monotonic() - stats['start']
+    return stats
+
+def show_stats(stats, action):
+    seconds = max(stats['seconds'], 1e-9)
+    print("{} {} attributes ({}) of {} files in {:.2f}s: {:.0f} files/s, {}/s. {} errors.".format(
+        action,
+        stats['attrs'],
+        convert_bytes(stats['bytes']),
+        stats['dumped'],
+        stats['seconds'],
+        stats['files'] / seconds,
+        convert_bytes(stats['bytes'] / seconds),
+        stats['errors']
+        ), file=sys.stderr)
+
+
+# --- Main function:
+
+def main():
+    parser = parse_args()
+    args = parser.parse_args()
+
+    if args.restore:
+        if args.restore == '-':
+            stream = sys.stdin.buffer
+            files = parse(stream)
+        elif is_snapshot(args.restore):
+            # Binary snapshot, written by `xscan --snapshot`:
+            stream = Snapshot(args.restore)
+            files = read_snapshot(stream)
+        else:
+            stream = open(args.restore, 'rb', buffering=BUFFER_SIZE)
+            files = parse(stream)
+        try:
+            stats = restore_files(files,
+                    directory=args.directory,
+                    match=args.match,
+                    clear=args.clear,
+                    follow_symlinks=(args.symlinks != SYMLINKS_NOFOLLOW),
+                    verbose=args.verbose
+                    )
+        except ValueError as e:
+            print("ERROR: invalid dump: {}".format(e), file=sys.stderr)
+            sys.exit(2)
+        finally:
+            stream.close()
+        action = "restored"
+    else:
+        if not args.paths:
+            parser.error("Give paths to dump, or a file to --restore.")
+        if args.output == '-':
+            output = sys.stdout.buffer
+        else:
+            output = open(args.output, 'wb', buffering=BUFFER_SIZE)
+        try:
+            stats = dump(output, args.paths,
+                    match=args.match,
+                    encoding=args.encoding,
+                    absolute_names=args.absolute_names,
+                    include=args.include,
+                    exclude=args.exclude,
+                    symlinks=args.symlinks,
+                    workers=args.workers,
+                    verbose=args.verbose
+                    )
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        action = "dumped"
+
+    if not args.quiet:
+        show_stats(stats, action)
+
+    if stats['errors']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/python3
+# @date: 2026-10-18
+
+# This program computes fingerprints of the extended attributes (xattrs) of
+# whole trees and, optionally, a hash of each file's contents ("payload"),
+# which it can write back as an xattr (like `user.checksum` in
+# examples/init_file.md, but without running md5sum per file).
+#
+# The fingerprint is computed like the index's (see xscan.fingerprint()):
+# over the sorted keys and raw values, so files with identical metadata
+# have the same fingerprint. That's what --duplicates groups by. Unlike the
+# index's, it leaves out --key (the payload hash), so writing hashes doesn't
+# change it: for files carrying --key, it differs from the fingerprint in
+# an index, snapshot or xdiff.
+#
+# Output, one line per file (like md5sum):
+#   <fingerprint>  [<payload hash, "-" for folders>  ]<path>
+
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import os
+import stat
+import sys
+import time
+
+from j2x import convert_bytes
+from xscan import walk, read_xattrs, fingerprint, add_filter_args, make_stats, SYMLINKS_SKIP, SYMLINKS_NOFOLLOW
+
+
+# Read file contents in chunks this big:
+CHUNK_SIZE = 1024 * 1024
+
+# examples/init_file.md stores the md5 of the contents as user.checksum:
+DEFAULT_ALGORITHM = 'md5'
+DEFAULT_KEY = 'user.checksum'
+
+
+# --- Commandline parameters:
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+            description='XHASH: Fingerprint the xattrs (and hash the contents) of whole trees. (part of ⭐️-AHAlodeck-❤️)'
+            )
+    parser.add_argument('paths',
+            nargs='+',
+            help='Directories (or files) to hash.'
+            )
+    parser.add_argument('-p', '--payload',
+            action='store_true',
+            default=False,
+            help='Also hash the contents of files.'
+            )
+    parser.add_argument('-a', '--algorithm',
+            type=str,
+            choices=sorted(hashlib.algorithms_guaranteed),
+            default=DEFAULT_ALGORITHM,
+            help='Hash algorithm for the contents. (default: {})'.format(DEFAULT_ALGORITHM)
+            )
+    parser.add_argument('-k', '--key',
+            type=str,
+            default=DEFAULT_KEY,
+            help='xattr to store the hash of the contents in. It is not part of the fingerprint. (default: {})'.format(DEFAULT_KEY)
+            )
+    parser.add_argument('-W', '--write',
+            action='store_true',
+            default=False,
+            help='Write the hash of the contents to the xattr --key (implies --payload). Unchanged values are not rewritten.'
+            )
+    parser.add_argument('-d', '--duplicates',
+            action='store_true',
+            default=False,
+            help='Only list groups of files with identical xattrs (same fingerprint, not counting --key).'
+            )
+    add_filter_args(parser, 'hash')
+    parser.add_argument('-w', '--workers',
+            type=int,
+            default=8,
+            help='Number of files hashed in parallel. (default: 8)'
+            )
+    parser.add_argument('-q', '--quiet',
+            action='store_true',
+            default=False,
+            help='Be as quiet as possible with text output: no summary.'
+            )
+
+    return parser
+
+
+# --- Hashing:
+
+def hash_payload(path, algorithm=DEFAULT_ALGORITHM, chunk_size=CHUNK_SIZE):
+    """
+    Hash the contents of `path`, reading it in chunks of `chunk_size`
+    into one reused buffer.
+
+    :return: Tuple (hex digest, number of bytes read)
+    """
+    digest = hashlib.new(algorithm)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    size = 0
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+            size += n
+    return digest.hexdigest(), size
+
+def hash_file(path, st, payload=False, algorithm=DEFAULT_ALGORITHM, key=DEFAULT_KEY,
+        write=False, follow_symlinks=True):
+    """
+    Fingerprint the xattrs of `path` (without `key`) and, if `payload`,
+    hash its contents. With `write`, the hash is stored as xattr `key`,
+    unless it's already there.
+
+    :return: Dict with 'path', 'fingerprint' (hex), 'payload' (hex or None),
+             'size', 'written', 'error' (None or OSError)
+    """
+    result = {'path': path, 'fingerprint': None, 'payload': None, 'size': 0, 'written': False, 'error': None}
+    try:
+        xattrs = read_xattrs(path, follow_symlinks=follow_symlinks)
+        old = xattrs.pop(key, None)
+        result['fingerprint'] = fingerprint(xattrs).hex()
+
+        if (payload or write) and stat.S_ISREG(st.st_mode):
+            result['payload'], result['size'] = hash_payload(path, algorithm)
+            value = result['payload'].encode()
+            if write and value != old:
+                os.setxattr(path, key, value, follow_symlinks=follow_symlinks)
+                result['written'] = True
+    except OSError as e:
+        result['error'] = e
+    return result
+
+def new_stats():
+    return make_stats(
+            'files',
+            'hashed',           # contents hashed
+            'written',          # hash written as xattr
+            'bytes',
+            )
+
+def hash_tree(roots, payload=False, algorithm=DEFAULT_ALGORITHM, key=DEFAULT_KEY,
+        write=False, include=(), exclude=(), symlinks=SYMLINKS_SKIP, workers=8, stats=None):
+    """
+    Hash all files in the trees `roots` with `workers` threads (hashlib
+    and file reads release the GIL, so big files hash in parallel).
+
+    :return: Generator of hash_file() results, in walk order
+    """
+    if stats is None:
+        stats = new_stats()
+    follow = (symlinks != SYMLINKS_NOFOLLOW)
+    workers = max(workers, 1)
+
+    def collect(result):
+        stats['files'] += 1
+        if result['error'] is not None:
+            stats['errors'] += 1
+            print("ERROR: cannot hash '{}': {}".format(result['path'], result['error']), file=sys.stderr)
+        elif result['payload'] is not None:
+            stats['hashed'] += 1
+            stats['bytes'] += result['size']
+            stats['written'] += result['written']
+        return result
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        for root in roots:
+            for path, st in walk(root, include, exclude, symlinks):
+                while len(pending) >= workers * 4:
+                    yield collect(pending.popleft().result())
+                pending.append(pool.submit(hash_file, path, st, payload, algorithm, key, write, follow))
+        while pending:
+            yield collect(pending.popleft().result())
+
+    stats['seconds'] = time.monotonic() - stats['start']
+
+def show_stats(stats):
+    seconds = max(stats['seconds'], 1e-9)
+    print("fingerprinted {} files, hashed {} ({}) in {:.2f}s: {:.0f} files/s, {}/s. wrote {} hashes. {} errors.".format(
+        stats['files'],
+        stats['hashed'],
+        convert_bytes(stats['bytes']),
+        stats['seconds'],
+        stats['files'] / seconds,
+        convert_bytes(stats['bytes'] / seconds),
+        stats['written'],
+        stats['errors']
+        ), file=sys.stderr)
+
+
+# --- Main function:
+
+def main():
+    parser = parse_args()
+    args = parser.parse_args()
+
+    stats = new_stats()
+    results = hash_tree(args.paths,
+            payload=args.payload,
+            algorithm=args.algorithm,
+            key=args.key,
+            write=args.write,
+            include=args.include,
+            exclude=args.exclude,
+            symlinks=args.symlinks,
+            workers=args.workers,
+            stats=stats
+            )
+
+    if args.duplicates:
+        # Fingerprint -> paths. Only objects that have xattrs at all:
+        empty = fingerprint({}).hex()
+        groups = {}
+        for result in results:
+            if result['fingerprint'] not in (None, empty):
+                groups.setdefault(result['fingerprint'], []).append(result['path'])
+        for digest, paths in groups.items():
+            if len(paths) > 1:
+                print(digest)
+                for path in paths:
+                    print("  {}".format(path))
+    else:
+        for result in results:
+            if result['error'] is not None:
+                continue
+            if args.payload or args.write:
+                # Folders etc. have no contents to hash:
+                print("{}  {}  {}".format(result['fingerprint'], result['payload'] or '-', result['path']))
+            else:
+                print("{}  {}".format(result['fingerprint'], result['path']))
+
+    if not args.quiet:
+        show_stats(stats)
+
+    if stats['errors']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,463 @@
+#!/usr/bin/python3
+# @date: 2026-10-18
+
+# This program searches an xattr index (as written by `xscan`) for filesystem
+# objects whose xattrs match a query.
+#
+# Query syntax (one condition per argument, or one string for the API):
+#
+#   KEY             object has KEY (wildcards allowed: "user.exif.*")
+#   KEY=VALUE       value is exactly VALUE
+#   KEY!=VALUE      object has KEY, with a value other than VALUE
+#   KEY~REGEX       value matches the regular expression REGEX
+#   KEY>VALUE       also >=, <, <=: compares as numbers. VALUE must be a
+#                   number, and only numeric values match.
+#
+# Conditions can be combined with "and" (default), "or", "not" and grouped
+# with "(" and ")".
+#
+# Example:
+#   xquery 'user.exif.Artist=XBloome' and not '(' 'user.exif.Genre~^Rock' or 'user.dublincore.date<2000' ')'
+#
+# With --text, the arguments are words to look for in any value instead
+# (full-text search, ranked). A trailing "*" matches words by prefix:
+#   xquery --text -k 'user.dublincore.*' -k 'user.exif.*' xbloo*
+
+import argparse
+import fnmatch
+import math
+import re
+import shlex
+import sys
+import time
+
+from xscan import XattrIndex, tokenize
+
+
+# Operators in the order they have to be looked for (longest first):
+OPERATORS = ('!=', '>=', '<=', '=', '~', '>', '<')
+
+KEYWORDS = ('and', 'or', 'not', '(', ')')
+
+
+# --- Commandline parameters:
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+            description='XQUERY: Search an xattr index for matching files. (part of ⭐️-AHAlodeck-❤️)'
+            )
+    parser.add_argument('query',
+            nargs='+',
+            help='Query conditions, e.g.: "user.exif.Artist=XBloome" and "user.exif.*". With --text: words to search for.'
+            )
+    parser.add_argument('-v', '--verbose',
+            action='count',
+            default=0,
+            help='Increase verbosity level.'
+            )
+    parser.add_argument('-i', '--index',
+            type=str,
+            default='xattrs.db',
+            help='Index database file to search. (default: xattrs.db)'
+            )
+    parser.add_argument('-s', '--show',
+            type=str,
+            action='append',
+            default=[],
+            help='Also print the values of keys matching this pattern. Can be given multiple times.'
+            )
+    parser.add_argument('-c', '--count',
+            default=False,
+            action='store_true',
+            help='Only print the number of matching files.'
+            )
+    parser.add_argument('-t', '--text',
+            default=False,
+            action='store_true',
+            help='Full-text search: find files with all given words in their values, best matches first.'
+            )
+    parser.add_argument('-k', '--keys',
+            type=str,
+            action='append',
+            default=[],
+            help='With --text: only search values of keys matching this pattern (e.g. "user.dublincore.*"). Can be given multiple times.'
+            )
+    parser.add_argument('-l', '--limit',
+            type=int,
+            default=None,
+            help='Print at most this many matching files.'
+            )
+
+    return parser
+
+
+# --- Parsing queries:
+
+class Condition:
+    """A single KEY[OP VALUE] condition."""
+
+    def __init__(self, key, op=None, value=None, regex=None):
+        self.key = key
+        self.op = op
+        self.value = value
+        self.regex = regex      # compiled `value`, for ~
+
+    def __repr__(self):
+        return "Condition({!r}, {!r}, {!r})".format(self.key, self.op, self.value)
+
+class And:
+    def __init__(self, *nodes):
+        self.nodes = nodes
+
+class Or:
+    def __init__(self, *nodes):
+        self.nodes = nodes
+
+class Not:
+    def __init__(self, node):
+        self.node = node
+
+
+def parse_condition(token):
+    """
+    Split a condition string into key, operator and value.
+
+    :param token: e.g. "user.exif.Artist=XBloome"
+    :return: Condition
+    """
+    first = None
+    for op in OPERATORS:
+        pos = token.find(op)
+        if pos > 0 and (first is None or pos < first[0]):
+            first = (pos, op)
+
+    if first is None:
+        return Condition(token)
+
+    pos, op = first
+    value = token[pos + len(op):]
+    if op in ('>', '>=', '<', '<=') and not is_number(value):
+        raise ValueError("'{}' compares numbers, but '{}' is not a number.".format(op, value))
+    regex = None
+    if op == '~':
+        # Here, not in the query (where errors come back as sqlite3 errors):
+        try:
+            regex = re.compile(value)
+        except re.error as e:
+            raise ValueError("Invalid regular expression '{}': {}".format(value, e))
+    return Condition(token[:pos], op, value, regex)
+
+def parse(query):
+    """
+    Parse a query into a tree of Condition/And/Or/Not nodes.
+
+    :param query: Query string, or list of already split tokens
+    :return: Root node of the query
+    """
+    if isinstance(query, str):
+        tokens = shlex.split(query)
+    else:
+        tokens = list(query)
+
+    if not tokens:
+        raise ValueError("Empty query.")
+
+    pos = 0
+
+    def peek():
+        if pos < len(tokens):
+            return tokens[pos].lower()
+        return None
+
+    def expr():
+        nonlocal pos
+        nodes = [term()]
+        while peek() == 'or':
+            pos += 1
+            nodes.append(term())
+        return nodes[0] if len(nodes) == 1 else Or(*nodes)
+
+    def term():
+        nonlocal pos
+        nodes = [factor()]
+        while peek() not in (None, 'or', ')'):
+            if peek() == 'and':
+                pos += 1
+            nodes.append(factor())
+        return nodes[0] if len(nodes) == 1 else And(*nodes)
+
+    def factor():
+        nonlocal pos
+        token = peek()
+        if token is None:
+            raise ValueError("Query ends unexpectedly.")
+        if token == 'not':
+            pos += 1
+            return Not(factor())
+        if token == '(':
+            pos += 1
+            node = expr()
+            if peek() != ')':
+                raise ValueError("Missing ')' in query.")
+            pos += 1
+            return node
+        if token in KEYWORDS:
+            raise ValueError("Unexpected '{}' in query.".format(tokens[pos]))
+        pos += 1
+        return parse_condition(tokens[pos - 1])
+
+    node = expr()
+    if pos < len(tokens):
+        raise ValueError("Unexpected '{}' in query.".format(tokens[pos]))
+    return node
+
+
+# --- Running queries:
+
+def is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+class XattrQuery:
+    """
+    Runs queries against an XattrIndex.
+
+    Each condition becomes a SELECT of matching path ids, using the index on
+    (key_id, value). Boolean combinations become INTERSECT, UNION and EXCEPT
+    of those, so the filesystem is never touched.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.db = index.db
+        self.regexes = {}
+        self.db.create_function("REGEXP", 2, self.regexp, deterministic=True)
+        self.db.create_function("NUMBER", 1, self.number, deterministic=True)
+
+    def regexp(self, pattern, value):
+        regex = self.regexes.get(pattern)
+        if regex is None:
+            regex = self.regexes[pattern] = re.compile(pattern)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', 'replace')
+        return regex.search(value) is not None
+
+    def number(self, value):
+        """The value as a number, or NULL (never matches) if it isn't one."""
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', 'replace')
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    def key_ids(self, pattern):
+        """
+        Get the ids of all keys matching `pattern`.
+
+        :param pattern: Key name, possibly containing wildcards (*, ?, [...])
+        :return: List of key ids
+        """
+        key_ids = self.index.key_ids
+        if not any(c in pattern for c in '*?['):
+            key_id = key_ids.get(pattern)
+            return [key_id] if key_id is not None else []
+
+        return [key_id for key, key_id in key_ids.items() if fnmatch.fnmatchcase(key, pattern)]
+
+    def compile(self, node):
+        """
+        Turn a query node into SQL selecting matching path ids.
+
+        :param node: Condition, And, Or or Not
+        :return: Tuple (sql, params)
+        """
+        if isinstance(node, And):
+            return self.compile_compound(node.nodes, "INTERSECT")
+        if isinstance(node, Or):
+            return self.compile_compound(node.nodes, "UNION")
+        if isinstance(node, Not):
+            sql, params = self.compile(node.node)
+            return "SELECT id FROM paths EXCEPT SELECT * FROM ({})".format(sql), params
+
+        key_ids = self.key_ids(node.key)
+        if not key_ids:
+            return "SELECT id FROM paths WHERE 0", []
+
+        sql = "SELECT path_id FROM xattrs WHERE key_id IN ({})".format(",".join(str(i) for i in key_ids))
+        params = []
+
+        if node.op is None:
+            pass
+        elif node.op in ('=', '!='):
+            sql += " AND value {} ?".format(node.op)
+            params.append(node.value.encode())
+        elif node.op == '~':
+            sql += " AND value REGEXP ?"
+            params.append(node.value)
+            self.regexes[node.value] = node.regex
+        else:
+            sql += " AND NUMBER(value) {} ?".format(node.op)
+            params.append(float(node.value))
+
+        return sql, params
+
+    def compile_compound(self, nodes, operator):
+        parts = []
+        params = []
+        for node in nodes:
+            sql, node_params = self.compile(node)
+            parts.append("SELECT * FROM ({})".format(sql))
+            params += node_params
+        return " {} ".format(operator).join(parts), params
+
+    def search(self, query, limit=None):
+        """
+        Find all indexed paths matching `query`.
+
+        :param query: Query string or list of tokens (see parse())
+        :param limit: Return at most this many paths
+        :return: Sorted list of paths
+        """
+        sql, params = self.compile(parse(query))
+        sql = "SELECT path FROM paths WHERE id IN ({}) ORDER BY path".format(sql)
+        if limit is not None:
+            sql += " LIMIT {:d}".format(limit)
+        return [path for path, in self.db.execute(sql, params)]
+
+    def count(self, query):
+        sql, params = self.compile(parse(query))
+        sql = "SELECT count(*) FROM paths WHERE id IN ({})".format(sql)
+        return self.db.execute(sql, params).fetchone()[0]
+
+    def term_ids(self, word):
+        """
+        Get the ids of all indexed terms matching `word`.
+
+        :param word: A word, or a word prefix ending with "*"
+        :return: List of term ids
+        """
+        if word.endswith('*'):
+            prefix = word[:-1]
+            rows = self.db.execute(
+                    "SELECT id FROM terms WHERE term >= ? AND term < ?",
+                    (prefix, prefix + chr(0x10ffff)))
+        else:
+            rows = self.db.execute("SELECT id FROM terms WHERE term = ?", (word,))
+        return [term_id for term_id, in rows]
+
+    def text_search(self, words, keys=None, limit=50):
+        """
+        Full-text search: Find paths having all `words` in their values.
+
+        Results are ranked by TF-IDF: words occurring often in a file, but
+        only in few files overall, weigh most.
+
+        :param words: String or list of words. A trailing "*" matches by prefix.
+        :param keys: Only search values of keys matching these patterns
+        :param limit: Return at most this many results
+        :return: List of (path, score) tuples, best matches first
+        """
+        if isinstance(words, str):
+            words = words.split()
+
+        # Use the same tokenizer as the index, but keep prefix wildcards:
+        tokens = []
+        for word in words:
+            found = tokenize(word)
+            if found and word.endswith('*'):
+                found[-1] += '*'
+            tokens += found
+        if not tokens:
+            return []
+
+        scope = ""
+        if keys:
+            key_ids = set()
+            for pattern in keys:
+                key_ids.update(self.key_ids(pattern))
+            if not key_ids:
+                return []
+            scope = " AND key_id IN ({})".format(",".join(str(i) for i in key_ids))
+
+        total = self.db.execute("SELECT count(*) FROM paths").fetchone()[0]
+
+        scores = None
+        for token in tokens:
+            term_ids = self.term_ids(token)
+            if not term_ids:
+                return []
+
+            rows = self.db.execute(
+                    "SELECT path_id, sum(tf) FROM postings WHERE term_id IN ({}){} GROUP BY path_id".format(
+                        ",".join(str(i) for i in term_ids), scope)).fetchall()
+            if not rows:
+                return []
+
+            idf = math.log(1 + total / len(rows))
+            if scores is None:
+                scores = dict((path_id, tf * idf) for path_id, tf in rows)
+            else:
+                scores = dict(
+                        (path_id, scores[path_id] + tf * idf)
+                        for path_id, tf in rows if path_id in scores
+                        )
+            if not scores:
+                return []
+
+        best = sorted(scores.items(), key=lambda item: -item[1])
+        if limit is not None:
+            best = best[:limit]
+
+        paths = dict(self.db.execute(
+                "SELECT id, path FROM paths WHERE id IN ({})".format(",".join(str(path_id) for path_id, _ in best))))
+        results = [(paths[path_id], score) for path_id, score in best]
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return results
+
+    def values(self, path, pattern):
+        """
+        Get the indexed values of `path` for keys matching `pattern`.
+
+        :return: Sorted list of (key, value) tuples
+        """
+        xattrs = self.index.get(path) or {}
+        return sorted((key, value) for key, value in xattrs.items() if fnmatch.fnmatchcase(key, pattern))
+
+
+# --- Main function:
+
+def main():
+    parser = parse_args()
+    args = parser.parse_args()
+
+    index = XattrIndex(args.index)
+    query = XattrQuery(index)
+
+    start = time.monotonic()
+    try:
+        if args.text:
+            for path, score in query.text_search(args.query, keys=args.keys, limit=args.limit):
+                print("{:8.2f}  {}".format(score, path))
+        elif args.count:
+            print(query.count(args.query))
+        else:
+            for path in query.search(args.query, limit=args.limit):
+                print(path)
+                for pattern in args.show:
+                    for key, value in query.values(path, pattern):
+                        print("    {} = {}".format(key, value.decode('utf-8', 'replace')))
+    except (ValueError, re.error) as e:
+        print("Invalid query: {}".format(e), file=sys.stderr)
+        sys.exit(2)
+    finally:
+        index.close()
+
+    if (args.verbose > 0):
+        print("query took {:.1f} ms.".format((time.monotonic() - start) * 1000), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
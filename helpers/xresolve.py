@@ -0,0 +1,277 @@
+#!/usr/bin/python3
+# @date: 2026-10-18
+
+# This program finds where a file with a given aha.id (CFID, see idaha) is
+# now, using the xattr index (see xscan) instead of walking the tree and
+# reading every file's xattrs.
+#
+# The index knows each ID's path, device and inode from the last scan.
+# If that path is gone (moved or renamed since), the file is looked for by
+# its inode ("relocate"): folders are listed, but nothing is stat()ed or
+# read, except the one entry with the right inode number. Starting at the
+# nearest folder that still exists, then its parents, up to --root (by
+# default, the mount point: renaming can't move a file to another
+# filesystem). The index is updated with what was found.
+#
+# With --relocate, all IDs in the index whose path is gone are looked for
+# at once, in one walk of the --root trees.
+
+import argparse
+import os
+import sys
+import time
+
+from xscan import XattrIndex, read_xattrs, fingerprint
+
+
+KEY = 'user.aha.id'
+
+
+# --- Commandline parameters:
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+            description='XRESOLVE: Find the current path of files by their aha.id, using an xattr index. (part of ⭐️-AHAlodeck-❤️)'
+            )
+    parser.add_argument('ids',
+            nargs='*',
+            help='IDs to look up.'
+            )
+    parser.add_argument('-i', '--index',
+            type=str,
+            default='xattrs.db',
+            help='Index database file to use and update. (default: xattrs.db)'
+            )
+    parser.add_argument('-k', '--key',
+            type=str,
+            default=KEY,
+            help='xattr holding the ID. (default: {})'.format(KEY)
+            )
+    parser.add_argument('-r', '--root',
+            type=str,
+            action='append',
+            default=[],
+            help='Look for moved files up to this folder. Can be given multiple times. (default: the mount point of their old path)'
+            )
+    parser.add_argument('-R', '--relocate',
+            action='store_true',
+            default=False,
+            help='Find all files in the index whose path is gone, and update it.'
+            )
+    parser.add_argument('-v', '--verbose',
+            action='count',
+            default=0,
+            help='Increase verbosity level.'
+            )
+
+    return parser
+
+
+# --- Looking up IDs:
+
+def has_id(path, key, value):
+    """Check if the object at `path` (still) has the ID `value`."""
+    try:
+        return os.getxattr(path, key, follow_symlinks=False) == value
+    except OSError:
+        return False
+
+def existing_folder(path):
+    """Get the nearest folder above `path` that still exists."""
+    folder = os.path.dirname(path)
+    while not os.path.isdir(folder):
+        folder = os.path.dirname(folder)
+    return folder
+
+def mount_point(folder):
+    """Get the mount point of the filesystem `folder` is on."""
+    folder = os.path.abspath(folder)
+    while not os.path.ismount(folder):
+        folder = os.path.dirname(folder)
+    return folder
+
+def search_folders(path, roots):
+    """
+    Get the folders to look for the moved `path` in, nearest first: its
+    nearest existing folder, then the parents of that, up to `roots` (or
+    up to the mount point, if there are none).
+
+    :return: List of (folder, already searched subfolder or None) tuples
+    """
+    folder = existing_folder(path)
+    if not roots:
+        roots = [mount_point(folder)]
+
+    searches = []
+    roots = [os.path.abspath(root) for root in roots]
+    inner = None
+    while True:
+        if any(folder == root or folder.startswith(root.rstrip(os.sep) + os.sep) for root in roots):
+            searches.append((folder, inner))
+            inner = folder
+        if folder in roots or folder == os.path.dirname(folder):
+            break
+        folder = os.path.dirname(folder)
+    # Roots elsewhere:
+    for root in roots:
+        if not any(root == searched or root.startswith(searched.rstrip(os.sep) + os.sep) for searched, _ in searches):
+            searches.append((root, None))
+    return searches
+
+def find_inodes(folder, inodes, skip=None):
+    """
+    Walk `folder` and find objects by their inode number, which the
+    directory listing already has (no stat() per object).
+
+    :param inodes: Set of inode numbers to look for
+    :param skip: Subfolder not to walk (already searched)
+    :return: Generator of (path, inode) tuples, for all matches
+    """
+    stack = [folder]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.inode() in inodes:
+                yield entry.path, entry.inode()
+            if entry.is_dir(follow_symlinks=False) and entry.path != skip:
+                stack.append(entry.path)
+
+def update_path(index, old, new):
+    """Record in `index` that `old` (and everything below it) moved to `new`."""
+    index.move(old, new)
+    st = os.stat(new, follow_symlinks=False)
+    xattrs = read_xattrs(new, follow_symlinks=False)
+    index.update(new, xattrs, st, fingerprint(xattrs))
+    index.commit()
+
+def relocate(index, key, value, path, dev, ino, roots=()):
+    """
+    Look for the object with ID `value`, which was at `path` (with device
+    `dev` and inode `ino`), by its inode. Update the index if found.
+
+    :return: New path, or None
+    """
+    for folder, skip in search_folders(path, roots):
+        for found, _ in find_inodes(folder, {ino}, skip):
+            st = os.stat(found, follow_symlinks=False)
+            if st.st_dev == dev and has_id(found, key, value):
+                update_path(index, path, found)
+                return found
+    return None
+
+def resolve(index, value, key=KEY, roots=()):
+    """
+    Get the current path of the object with the ID `value`.
+
+    :param index: XattrIndex to look the ID up in
+    :param value: ID (str or bytes)
+    :param roots: Where to look for it, if it moved (see search_folders())
+    :return: Path, or None if not found
+    """
+    if isinstance(value, str):
+        value = os.fsencode(value)
+
+    found = index.find(key, value)
+    for _, path, _, _ in found:
+        if has_id(path, key, value):
+            return path
+
+    # Moved since it was indexed:
+    for _, path, dev, ino in found:
+        if ino is not None:
+            new = relocate(index, key, value, path, dev, ino, roots)
+            if new is not None:
+                return new
+    return None
+
+def relocate_all(index, key=KEY, roots=(), stats=None):
+    """
+    Find all objects with an ID whose indexed path is gone, in one walk
+    (of `roots`, or of the mount points of their paths), and update the
+    index. The walk stops when all have been found.
+
+    :return: Stats dict with 'ids', 'missing', 'relocated'
+    """
+    if stats is None:
+        stats = {'ids': 0, 'missing': 0, 'relocated': 0, 'start': time.monotonic(), 'seconds': 0.0}
+
+    missing = {}    # inode -> [(path, dev, value)]
+    for value in index.values(key):
+        stats['ids'] += 1
+        for _, path, dev, ino in index.find(key, value):
+            if ino is not None and not os.path.lexists(path):
+                missing.setdefault(ino, []).append((path, dev, value))
+    stats['missing'] = sum(len(moved) for moved in missing.values())
+
+    if missing:
+        if roots:
+            folders = [os.path.abspath(root) for root in roots]
+        else:
+            folders = set(mount_point(existing_folder(path)) for moved in missing.values() for path, _, _ in moved)
+        # Don't walk folders twice (one inside another):
+        folders = sorted(folders)
+        folders = [f for i, f in enumerate(folders)
+                if not any(f.startswith(other.rstrip(os.sep) + os.sep) for other in folders[:i])]
+
+        left = stats['missing']
+        for folder in folders:
+            for found, ino in find_inodes(folder, set(missing)):
+                st = os.stat(found, follow_symlinks=False)
+                for entry in list(missing.get(ino, ())):
+                    path, dev, value = entry
+                    if st.st_dev == dev and has_id(found, key, value):
+                        # find_inodes() lists a folder before what's in it.
+                        # If the folder had an ID too, update_path() has
+                        # already moved `path` along with it:
+                        if index.lookup(path) is not None:
+                            update_path(index, path, found)
+                        stats['relocated'] += 1
+                        missing[ino].remove(entry)
+                        left -= 1
+                if not left:
+                    break
+            if not left:
+                break
+
+    stats['seconds'] = time.monotonic() - stats['start']
+    return stats
+
+
+# --- Main function:
+
+def main():
+    parser = parse_args()
+    args = parser.parse_args()
+
+    if not (args.ids or args.relocate):
+        parser.error("give IDs to look up, or --relocate")
+
+    index = XattrIndex(args.index)
+    errors = 0
+    try:
+        if args.relocate:
+            stats = relocate_all(index, args.key, args.root)
+            print("{} IDs, {} paths gone, {} found again in {:.2f}s.".format(
+                stats['ids'], stats['missing'], stats['relocated'], stats['seconds']), file=sys.stderr)
+            errors += stats['missing'] - stats['relocated']
+
+        for value in args.ids:
+            path = resolve(index, value, args.key, args.root)
+            if path is None:
+                errors += 1
+                print("ERROR: ID not found: {}".format(value), file=sys.stderr)
+            elif args.verbose:
+                print("{}  {}".format(value, path))
+            else:
+                print(path)
+    finally:
+        index.close()
+
+    if errors:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,701 @@
+#!/usr/bin/python3
+# @date: 2026-10-18
+
+# This program walks directory trees and collects the extended attributes
+# (xattrs) of every filesystem object into an index (SQLite database).
+# The index is what search/filter tools can then query, instead of reading
+# xattrs from the filesystem over and over again.
+
+import argparse
+import fnmatch
+import hashlib
+import os
+import re
+import sqlite3
+import stat
+import sys
+import time
+
+from j2x import convert_bytes
+
+
+# How to handle symbolic links while walking a tree:
+SYMLINKS_SKIP = "skip"          # ignore them completely (default)
+SYMLINKS_NOFOLLOW = "nofollow"  # index the link itself, don't descend
+SYMLINKS_FOLLOW = "follow"      # index and descend into what they point to
+SYMLINK_POLICIES = (SYMLINKS_SKIP, SYMLINKS_NOFOLLOW, SYMLINKS_FOLLOW)
+
+# Number of files to write to the index per transaction:
+BATCH_SIZE = 1000
+
+# In xattr snapshots (see xsnap), keys are stored as integer ids referring
+# to a dictionary of distinct keys. Bytes per reference:
+KEY_ID_SIZE = 4
+
+# Words in xattr values, for the full-text index:
+TOKEN_PATTERN = re.compile(r'\w+')
+MAX_TOKEN_LENGTH = 64
+
+
+# --- Commandline parameters:
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+            description='XSCAN: Collect xattrs of whole directory trees into an index. (part of ⭐️-AHAlodeck-❤️)'
+            )
+    parser.add_argument('paths',
+            nargs='+',
+            help='Directories (or files) to scan.'
+            )
+    parser.add_argument('-v', '--verbose',
+            action='count',
+            default=0,
+            help='Increase verbosity level.'
+            )
+    parser.add_argument('-q', '--quiet',
+            action='store_true',
+            default=False,
+            help='Be as quiet as possible with text output.'
+            )
+    parser.add_argument('-i', '--index',
+            type=str,
+            default='xattrs.db',
+            help='Index database file to write to. (default: xattrs.db)'
+            )
+    add_filter_args(parser, 'index')
+    parser.add_argument('-x', '--one_file_system',
+            default=False,
+            action='store_true',
+            help='Do not descend into folders on other filesystems.'
+            )
+    parser.add_argument('-f', '--full',
+            default=False,
+            action='store_true',
+            help='Re-read and re-index all objects. By default, only objects whose inode or ctime changed since the last scan are read.'
+            )
+    parser.add_argument('-S', '--snapshot',
+            type=str,
+            default=None,
+            help='Also write all xattrs to this snapshot file (see xsnap), in the same pass.'
+            )
+
+    return parser
+
+def add_filter_args(parser, verb):
+    """
+    Add the options selecting what walk() yields to `parser`: --include,
+    --exclude and --symlinks. `verb` is what's done with the files (e.g.
+    'index'), for the help texts.
+    """
+    parser.add_argument('-in', '--include',
+            type=str,
+            action='append',
+            default=[],
+            help='Only {} files matching this glob pattern (name or relative path). Can be given multiple times.'.format(verb)
+            )
+    parser.add_argument('-ex', '--exclude',
+            type=str,
+            action='append',
+            default=[],
+            help='Skip files and folders matching this glob pattern (name or relative path). Can be given multiple times.'
+            )
+    parser.add_argument('-s', '--symlinks',
+            type=str,
+            choices=SYMLINK_POLICIES,
+            default=SYMLINKS_SKIP,
+            help='How to handle symbolic links: skip them, {} them without following (nofollow), or follow them. (default: skip)'.format(verb)
+            )
+
+
+# --- The index:
+
+class XattrIndex:
+    """
+    An SQLite database holding the xattrs of many filesystem objects.
+
+    Tables:
+      - paths:  one row per indexed filesystem object, with the inode, ctime
+                and xattr fingerprint it had when it was last read.
+      - keys:   one row per distinct xattr key.
+      - xattrs: the key/value pairs of each path.
+      - terms:    one row per distinct word found in values.
+      - postings: which word appears how often in which path's key
+                  (= the inverted index for full-text search).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS paths (
+            id          INTEGER PRIMARY KEY,
+            path        TEXT NOT NULL UNIQUE,
+            dev         INTEGER,
+            ino         INTEGER,
+            ctime_ns    INTEGER,
+            fingerprint BLOB
+        );
+        CREATE TABLE IF NOT EXISTS keys (
+            id      INTEGER PRIMARY KEY,
+            key     TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS xattrs (
+            path_id INTEGER NOT NULL REFERENCES paths(id) ON DELETE CASCADE,
+            key_id  INTEGER NOT NULL REFERENCES keys(id),
+            value   BLOB NOT NULL,
+            PRIMARY KEY (path_id, key_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS xattrs_key_value ON xattrs (key_id, value);
+        CREATE TABLE IF NOT EXISTS terms (
+            id      INTEGER PRIMARY KEY,
+            term    TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS postings (
+            term_id INTEGER NOT NULL REFERENCES terms(id),
+            key_id  INTEGER NOT NULL REFERENCES keys(id),
+            path_id INTEGER NOT NULL REFERENCES paths(id) ON DELETE CASCADE,
+            tf      INTEGER NOT NULL,
+            PRIMARY KEY (term_id, key_id, path_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS postings_path ON postings (path_id);
+        """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(self.SCHEMA)
+
+        # Key name -> id. Keys repeat across files a lot, so don't ask the
+        # database every time:
+        self.key_ids = dict(
+                (key, key_id) for key_id, key in self.db.execute("SELECT id, key FROM keys")
+                )
+        # Term -> id. Filled as terms are used, and emptied when it gets big:
+        self.term_ids = {}
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def commit(self):
+        self.db.commit()
+
+    def key_id(self, key):
+        """
+        Get the id of `key`, adding it to the keys table if it's new.
+
+        :param key: xattr key name
+        :return: Integer id of the key
+        """
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            cursor = self.db.execute("INSERT INTO keys (key) VALUES (?)", (key,))
+            key_id = cursor.lastrowid
+            self.key_ids[key] = key_id
+        return key_id
+
+    def term_id(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            row = self.db.execute("SELECT id FROM terms WHERE term = ?", (term,)).fetchone()
+            if row:
+                term_id = row[0]
+            else:
+                term_id = self.db.execute("INSERT INTO terms (term) VALUES (?)", (term,)).lastrowid
+
+            if len(self.term_ids) > 100000:
+                self.term_ids.clear()
+            self.term_ids[term] = term_id
+        return term_id
+
+    def path_id(self, path):
+        row = self.db.execute("SELECT id FROM paths WHERE path = ?", (path,)).fetchone()
+        if row:
+            return row[0]
+        return None
+
+    def lookup(self, path):
+        """
+        Get what the index knows about `path`, without its xattrs.
+
+        :param path: Path of the filesystem object
+        :return: Tuple (id, dev, ino, ctime_ns, fingerprint), or None
+        """
+        return self.db.execute(
+                "SELECT id, dev, ino, ctime_ns, fingerprint FROM paths WHERE path = ?",
+                (path,)).fetchone()
+
+    def update(self, path, xattrs, st=None, digest=None, path_id=None):
+        """
+        Store (=replace) the xattrs of `path` in the index.
+
+        :param path: Path of the filesystem object
+        :param xattrs: Dict of key (str) -> value (bytes)
+        :param st: os.stat_result of `path`, for incremental scans
+        :param digest: fingerprint() of `xattrs`
+        :param path_id: Id of `path`, if already known
+        :return: Id of `path`
+        """
+        if st is not None:
+            state = (st.st_dev, st.st_ino, st.st_ctime_ns, digest)
+        else:
+            state = (None, None, None, digest)
+
+        if path_id is None:
+            path_id = self.path_id(path)
+
+        if path_id is None:
+            path_id = self.db.execute(
+                    "INSERT INTO paths (path, dev, ino, ctime_ns, fingerprint) VALUES (?, ?, ?, ?, ?)",
+                    (path,) + state).lastrowid
+        else:
+            self.db.execute(
+                    "UPDATE paths SET dev = ?, ino = ?, ctime_ns = ?, fingerprint = ? WHERE id = ?",
+                    state + (path_id,))
+            self.db.execute("DELETE FROM xattrs WHERE path_id = ?", (path_id,))
+            self.db.execute("DELETE FROM postings WHERE path_id = ?", (path_id,))
+
+        rows = []
+        postings = []
+        for key, value in xattrs.items():
+            key_id = self.key_id(key)
+            rows.append((path_id, key_id, value))
+
+            counts = {}
+            for token in tokenize(value):
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.append((self.term_id(token), key_id, path_id, tf))
+
+        self.db.executemany("INSERT INTO xattrs (path_id, key_id, value) VALUES (?, ?, ?)", rows)
+        self.db.executemany("INSERT INTO postings (term_id, key_id, path_id, tf) VALUES (?, ?, ?, ?)", postings)
+        return path_id
+
+    def touch(self, path_id, st):
+        """Remember new inode/ctime of `path_id`, whose xattrs didn't change."""
+        self.db.execute(
+                "UPDATE paths SET dev = ?, ino = ?, ctime_ns = ? WHERE id = ?",
+                (st.st_dev, st.st_ino, st.st_ctime_ns, path_id))
+
+    def prune(self, root, seen):
+        """
+        Remove all paths below (and including) `root` which are not in `seen`
+        and don't exist anymore. Paths that still exist, but weren't
+        scanned this time (e.g. a narrower --include), are kept.
+
+        :param root: Absolute path of a scanned tree
+        :param seen: Set of path ids found while scanning `root`
+        :return: Number of removed paths
+        """
+        root = root.rstrip(os.sep) or os.sep
+        # All paths starting with "root/": '0' is the character after '/'.
+        prefix = root if root == os.sep else root + os.sep
+        rows = self.db.execute(
+                "SELECT id, path FROM paths WHERE path = ? OR (path >= ? AND path < ?)",
+                (root, prefix, prefix[:-1] + chr(ord(os.sep) + 1)))
+
+        gone = [(path_id,) for path_id, path in rows.fetchall()
+                if path_id not in seen and not os.path.lexists(path)]
+        self.db.executemany("DELETE FROM paths WHERE id = ?", gone)
+        return len(gone)
+
+    def remove(self, path):
+        self.db.execute("DELETE FROM paths WHERE path = ?", (path,))
+
+    def get(self, path):
+        """
+        Get the xattrs of `path`, as stored in the index.
+
+        :param path: Path of the filesystem object
+        :return: Dict of key (str) -> value (bytes), or None if not indexed
+        """
+        path_id = self.path_id(path)
+        if path_id is None:
+            return None
+
+        rows = self.db.execute(
+                "SELECT keys.key, xattrs.value FROM xattrs"
+                " JOIN keys ON keys.id = xattrs.key_id"
+                " WHERE xattrs.path_id = ?", (path_id,))
+        return dict(rows)
+
+    def find(self, key, value):
+        """
+        Get the objects whose xattr `key` has the value `value` (e.g. an
+        aha.id), using the index on (key, value): no table scan.
+
+        :return: List of (id, path, dev, ino) tuples
+        """
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            return []
+        return self.db.execute(
+                "SELECT paths.id, paths.path, paths.dev, paths.ino FROM xattrs"
+                " JOIN paths ON paths.id = xattrs.path_id"
+                " WHERE xattrs.key_id = ? AND xattrs.value = ?", (key_id, value)).fetchall()
+
+    def move(self, old, new):
+        """
+        Rename `old` and all paths below it to `new` (e.g. a moved folder),
+        keeping their xattrs. Paths already at `new` are replaced.
+
+        :return: Number of renamed paths
+        """
+        def below(path):
+            prefix = path.rstrip(os.sep) + os.sep
+            return (path, prefix, prefix[:-1] + chr(ord(os.sep) + 1))
+
+        where = "path = ? OR (path >= ? AND path < ?)"
+        self.db.execute("DELETE FROM paths WHERE " + where, below(new))
+        return self.db.execute(
+                "UPDATE paths SET path = ? || substr(path, ?) WHERE " + where,
+                (new, len(old) + 1) + below(old)).rowcount
+
+    def values(self, key):
+        """
+        Get all values of `key` in the index (e.g. IDs already assigned).
+
+        :param key: xattr key name
+        :return: Generator of values (bytes)
+        """
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            return
+        for value, in self.db.execute("SELECT value FROM xattrs WHERE key_id = ?", (key_id,)):
+            yield value
+
+
+# --- Walking directory trees:
+
+def matches(patterns, name, relpath):
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(relpath, pattern):
+            return True
+    return False
+
+def walk(root, include=(), exclude=(), symlinks=SYMLINKS_SKIP, one_file_system=False):
+    """
+    Walk a directory tree with os.scandir() and yield every filesystem
+    object that should be indexed (including `root` itself).
+
+    :param root: Directory (or file) to start at
+    :param include: Glob patterns: only yield files that match one of these
+    :param exclude: Glob patterns: skip files and folders that match one of these
+    :param symlinks: Symlink policy (see SYMLINK_POLICIES)
+    :param one_file_system: Don't descend into other filesystems
+    :return: Generator of (path, stat_result) tuples
+    """
+    root = os.path.abspath(root)
+    root_stat = os.stat(root)
+    yield root, root_stat
+
+    if not stat.S_ISDIR(root_stat.st_mode):
+        return
+
+    # (st_dev, st_ino) of folders already walked: protects against symlink loops.
+    visited = {(root_stat.st_dev, root_stat.st_ino)}
+    stack = [root]
+
+    while stack:
+        folder = stack.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError as e:
+            print("WARNING: cannot read folder '{}': {}".format(folder, e), file=sys.stderr)
+            continue
+
+        for entry in entries:
+            relpath = os.path.relpath(entry.path, root)
+            if exclude and matches(exclude, entry.name, relpath):
+                continue
+
+            is_link = entry.is_symlink()
+            if is_link and symlinks == SYMLINKS_SKIP:
+                continue
+
+            follow = (symlinks == SYMLINKS_FOLLOW)
+            try:
+                st = entry.stat(follow_symlinks=follow)
+            except OSError:
+                # Broken symlink, or gone while walking.
+                continue
+
+            if stat.S_ISDIR(st.st_mode):
+                if one_file_system and st.st_dev != root_stat.st_dev:
+                    continue
+                if (st.st_dev, st.st_ino) in visited:
+                    continue
+                visited.add((st.st_dev, st.st_ino))
+                stack.append(entry.path)
+            elif include and not matches(include, entry.name, relpath):
+                continue
+
+            yield entry.path, st
+
+
+# --- Reading xattrs:
+
+def read_xattrs(path, follow_symlinks=True):
+    """
+    Read all xattrs of `path`.
+
+    :param path: Path of the filesystem object
+    :param follow_symlinks: If False, read the xattrs of a symlink itself
+    :return: Dict of key (str) -> value (bytes)
+    """
+    xattrs = {}
+    for key in os.listxattr(path, follow_symlinks=follow_symlinks):
+        try:
+            xattrs[key] = os.getxattr(path, key, follow_symlinks=follow_symlinks)
+        except FileNotFoundError:
+            # Removed between list and get.
+            pass
+    return xattrs
+
+
+# Splits an xattr value into lowercase words for the full-text index.
+# Values that aren't UTF-8 text (binary data) don't have words.
+def tokenize(value):
+    if isinstance(value, bytes):
+        try:
+            value = value.decode('utf-8')
+        except UnicodeDecodeError:
+            return []
+
+    return [
+            token for token in TOKEN_PATTERN.findall(value.lower())
+            if len(token) <= MAX_TOKEN_LENGTH
+            ]
+
+# Computes a fingerprint over a set of xattrs: same keys and values (in any
+# order) result in the same fingerprint.
+def fingerprint(xattrs):
+    digest = hashlib.blake2b(digest_size=16)
+    for key in sorted(xattrs):
+        bkey = os.fsencode(key)
+        value = xattrs[key]
+        digest.update(len(bkey).to_bytes(4, 'little'))
+        digest.update(bkey)
+        digest.update(len(value).to_bytes(4, 'little'))
+        digest.update(value)
+    return digest.digest()
+
+
+# --- Key dictionary:
+
+def split_key(key):
+    """
+    Split `key` into its namespace (everything up to the last ".", like the
+    j2x --prefix) and its name: "user.exif.Artist" -> ("user.exif.", "Artist")
+    """
+    namespace, dot, name = key.rpartition('.')
+    return namespace + dot, name
+
+def dictionary_size(keys):
+    """
+    Size of the dictionary of `keys` (see xsnap): each namespace stored
+    once (u16 length + bytes), each key as namespace id + name (u32 + u16
+    length + bytes).
+
+    :param keys: Distinct keys
+    :return: Tuple (bytes, number of namespaces)
+    """
+    namespaces = set()
+    size = 0
+    for key in keys:
+        namespace, name = split_key(key)
+        if namespace not in namespaces:
+            namespaces.add(namespace)
+            size += 2 + len(os.fsencode(namespace))
+        size += 4 + 2 + len(os.fsencode(name))
+    return size, len(namespaces)
+
+
+# --- Scanning:
+
+def make_stats(*counters):
+    """
+    Get a stats dict for one run: the `counters` (names) and 'errors' at 0,
+    'start' (time.monotonic()) and 'seconds', to be set at the end.
+    """
+    stats = dict.fromkeys(counters, 0)
+    stats['errors'] = 0
+    stats['start'] = time.monotonic()
+    stats['seconds'] = 0.0
+    return stats
+
+def new_stats():
+    return make_stats(
+            'files',            # objects found in the tree
+            'skipped',          # inode/ctime unchanged: not read at all
+            'unchanged',        # read, but xattrs are the same as before
+            'updated',          # read, and new or changed xattrs stored
+            'removed',          # in the index, but gone from the tree
+            'attrs',
+            'bytes',
+            'keys',             # distinct keys read
+            'namespaces',       # distinct namespaces of those
+            'key_bytes',        # keys of all attributes read, as they are
+            'interned_bytes',   # estimate of the same in a snapshot (dictionary + key ids)
+            'snapshot_keys',        # the snapshot written (if any, see main()): distinct keys,
+            'snapshot_namespaces',  # their namespaces,
+            'snapshot_key_bytes',   # keys of all its attributes, as they are,
+            'stored_key_bytes',     # and as stored (dictionary + key ids)
+            )
+
+def scan(index, roots, include=(), exclude=(), symlinks=SYMLINKS_SKIP,
+        one_file_system=False, full=False, verbose=0, snapshot=None):
+    """
+    Scan `roots` and store every object's xattrs in `index`.
+
+    Setting an xattr changes the ctime of a file. So unless `full` is set,
+    objects with the same inode and ctime as in the index are skipped
+    without reading their xattrs. Objects that vanished from `roots` are
+    removed from the index.
+
+    :param index: XattrIndex to write to
+    :param roots: List of paths to scan
+    :param full: Re-read and re-index all objects
+    :param snapshot: xsnap.SnapshotWriter to also write all xattrs to (in the same pass).
+                     The xattrs of skipped objects are taken from the index.
+    :return: Stats dict (see new_stats())
+    """
+    stats = new_stats()
+    follow = (symlinks == SYMLINKS_FOLLOW)
+    pending = 0
+    keys = set()
+
+    for root in roots:
+        seen = set()
+        for path, st in walk(root, include, exclude, symlinks, one_file_system):
+            stats['files'] += 1
+            try:
+                known = index.lookup(path)
+                if known:
+                    path_id, dev, ino, ctime_ns, digest = known
+                    seen.add(path_id)
+                    if (not full) and (dev, ino, ctime_ns) == (st.st_dev, st.st_ino, st.st_ctime_ns):
+                        stats['skipped'] += 1
+                        if snapshot is not None:
+                            snapshot.add(path, index.get(path) or {}, digest)
+                        continue
+                else:
+                    path_id = digest = None
+
+                xattrs = read_xattrs(path, follow_symlinks=follow)
+                new_digest = fingerprint(xattrs)
+                if (new_digest == digest) and (not full):
+                    index.touch(path_id, st)
+                    stats['unchanged'] += 1
+                else:
+                    path_id = index.update(path, xattrs, st, new_digest, path_id)
+                    seen.add(path_id)
+                    stats['updated'] += 1
+                if snapshot is not None:
+                    snapshot.add(path, xattrs, new_digest)
+            except (OSError, UnicodeEncodeError) as e:
+                stats['errors'] += 1
+                print("WARNING: cannot index '{}': {}".format(path, e), file=sys.stderr)
+                continue
+
+            stats['attrs'] += len(xattrs)
+            stats['bytes'] += sum(len(key) + len(value) for key, value in xattrs.items())
+            stats['key_bytes'] += sum(len(os.fsencode(key)) for key in xattrs)
+            keys.update(xattrs)
+
+            if (verbose > 1):
+                print("{} ({} attributes)".format(path, len(xattrs)))
+
+            pending += 1
+            if pending >= BATCH_SIZE:
+                index.commit()
+                pending = 0
+
+        stats['removed'] += index.prune(os.path.abspath(root), seen)
+
+    index.commit()
+
+    size, stats['namespaces'] = dictionary_size(keys)
+    stats['keys'] = len(keys)
+    stats['interned_bytes'] = size + KEY_ID_SIZE * stats['attrs']
+
+    stats['seconds'] = time.monotonic() - stats['start']
+    return stats
+
+def show_stats(stats):
+    seconds = max(stats['seconds'], 1e-9)
+    print("scanned {} files ({} skipped, {} unchanged, {} updated, {} removed), read {} attributes ({}) in {:.2f}s: {:.0f} files/s, {}/s. {} errors.".format(
+        stats['files'],
+        stats['skipped'],
+        stats['unchanged'],
+        stats['updated'],
+        stats['removed'],
+        stats['attrs'],
+        convert_bytes(stats['bytes']),
+        stats['seconds'],
+        stats['files'] / seconds,
+        convert_bytes(stats['bytes'] / seconds),
+        stats['errors']
+        ))
+    if stats['stored_key_bytes']:
+        print("snapshot: {} distinct keys in {} namespaces: {} of keys stored as {} ({:.1f}:1).".format(
+            stats['snapshot_keys'],
+            stats['snapshot_namespaces'],
+            convert_bytes(stats['snapshot_key_bytes']),
+            convert_bytes(stats['stored_key_bytes']),
+            stats['snapshot_key_bytes'] / stats['stored_key_bytes']
+            ))
+    elif stats['attrs']:
+        # Only for the attributes read in this run, in xsnap's layout (not
+        # the index's):
+        print("read {} distinct keys in {} namespaces: {} of keys, estimated {} in a snapshot ({:.1f}:1).".format(
+            stats['keys'],
+            stats['namespaces'],
+            convert_bytes(stats['key_bytes']),
+            convert_bytes(stats['interned_bytes']),
+            stats['key_bytes'] / stats['interned_bytes']
+            ))
+
+
+# --- Main function:
+
+def main():
+    parser = parse_args()
+    args = parser.parse_args()
+
+    index = XattrIndex(args.index)
+    snapshot = None
+    if args.snapshot:
+        # Import here: xsnap imports this module.
+        from xsnap import SnapshotWriter
+        snapshot = SnapshotWriter(args.snapshot)
+    try:
+        stats = scan(index, args.paths,
+                include=args.include,
+                exclude=args.exclude,
+                symlinks=args.symlinks,
+                one_file_system=args.one_file_system,
+                full=args.full,
+                verbose=args.verbose,
+                snapshot=snapshot
+                )
+    finally:
+        index.close()
+        if snapshot is not None:
+            snapshot.close()
+
+    if snapshot is not None:
+        # What the snapshot actually achieved, instead of an estimate:
+        stats['snapshot_keys'] = len(snapshot.key_ids)
+        stats['snapshot_namespaces'] = snapshot.namespaces
+        stats['snapshot_key_bytes'] = snapshot.key_bytes
+        stats['stored_key_bytes'] = snapshot.stored_key_bytes
+
+    if not args.quiet:
+        show_stats(stats)
+
+    if stats['errors']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,468 @@
+#!/usr/bin/python3
+# @date: 2026-10-18
+
+# Binary snapshots of the extended attributes (xattrs) of whole trees.
+#
+# A snapshot is written in one streaming pass (e.g. by `xscan --snapshot`)
+# and read back through mmap: Looking up a file is a binary search, and
+# values are returned as memoryviews into the file, without parsing or
+# copying anything else. That's what makes comparing or restoring the
+# metadata of millions of files feasible, where text dumps (see xdump) get
+# too slow and too big.
+#
+# File layout (all integers little-endian):
+#
+#   header:   MAGIC
+#   records:  one per file, in the order they were added:
+#               u32 path length, path (bytes),
+#               16 bytes fingerprint of the xattrs (see xscan.fingerprint()),
+#               u32 number of xattrs,
+#               per xattr: u32 key id, u32 value length, value (bytes)
+#   keys:     The dictionary of keys (see xscan.dictionary_size()):
+#             u32 number of namespaces, per namespace: u16 length, prefix (bytes),
+#             u32 number of keys, per key: u32 namespace id, u16 length, name (bytes).
+#             Each key is stored once, its id is its position here; each
+#             namespace ("user.exif.") once, its id is its position.
+#   index:    u64 number of records, u64 offset of each record, sorted by path
+#   footer:   u64 offset of keys, u64 offset of index, MAGIC
+#
+# The file is only ever appended to while writing. Without footer (e.g.
+# the writer was killed), it's not a valid snapshot.
+#
+# A file in a snapshot can be opened in AHAlodeck/mercs (read-only) like a
+# live file, by giving its path inside the snapshot file:
+#   mercs -f backup.xsnap/home/user/music/song.mp3
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+from xscan import fingerprint, split_key, KEY_ID_SIZE
+
+
+MAGIC = b'XSNAP02\n'
+
+RECORD_HEAD = struct.Struct('<I')           # path length
+RECORD_DIGEST_SIZE = 16
+RECORD_COUNT = struct.Struct('<I')          # number of xattrs
+RECORD_XATTR = struct.Struct('<II')         # key id, value length
+KEY_COUNT = struct.Struct('<I')
+NAMESPACE_HEAD = struct.Struct('<H')        # prefix length
+KEY_HEAD = struct.Struct('<IH')             # namespace id, name length
+INDEX_ENTRY = struct.Struct('<Q')
+FOOTER = struct.Struct('<QQ8s')
+
+# Buffer size for writing snapshots:
+BUFFER_SIZE = 1024 * 1024
+
+
+def is_snapshot(filename):
+    """True if `filename` is a snapshot file."""
+    try:
+        with open(filename, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def split_path(filename):
+    """
+    Split a path to a file inside a snapshot (e.g. "backup.xsnap/music/a.mp3")
+    into the snapshot file and the path inside it.
+
+    :return: (snapshot file, path inside), or None if `filename` isn't in a snapshot
+    """
+    if os.path.exists(filename):
+        return None
+
+    snapshot = filename
+    while True:
+        parent = os.path.dirname(snapshot)
+        if parent == snapshot or not parent:
+            return None
+        snapshot = parent
+        if os.path.isfile(snapshot):
+            if not is_snapshot(snapshot):
+                return None
+            return snapshot, os.path.relpath(filename, snapshot)
+
+
+# --- Writing:
+
+class SnapshotWriter:
+    """
+    Writes a snapshot, one file at a time (see add()). Keys and the offset
+    of each record are kept in memory until close(), which writes the key
+    table, the index and the footer.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.stream = open(filename, 'wb', buffering=BUFFER_SIZE)
+        self.stream.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.key_ids = {}
+        self.records = []       # (path, offset)
+        # Keys of all xattrs added, as they are, and as actually stored
+        # (key ids, plus the dictionary once written by close()):
+        self.key_bytes = 0
+        self.stored_key_bytes = 0
+        self.namespaces = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def key_id(self, key):
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            key_id = self.key_ids[key] = len(self.key_ids)
+        return key_id
+
+    def add(self, path, xattrs, digest=None):
+        """
+        Append the xattrs of one file.
+
+        :param path: Path of the file
+        :param xattrs: Dict of key (str) -> value (bytes)
+        :param digest: fingerprint(xattrs), if already known
+        """
+        if digest is None:
+            digest = fingerprint(xattrs)
+        bpath = os.fsencode(path)
+
+        parts = [RECORD_HEAD.pack(len(bpath)), bpath, digest, RECORD_COUNT.pack(len(xattrs))]
+        for key, value in xattrs.items():
+            parts.append(RECORD_XATTR.pack(self.key_id(key), len(value)))
+            parts.append(value)
+            self.key_bytes += len(os.fsencode(key))
+        self.stored_key_bytes += KEY_ID_SIZE * len(xattrs)
+        record = b''.join(parts)
+
+        self.records.append((bpath, self.offset))
+        self.stream.write(record)
+        self.offset += len(record)
+
+    def close(self):
+        if self.stream is None:
+            return
+
+        keys_offset = self.offset
+        namespace_ids = {}
+        names = []
+        for key in self.key_ids:
+            namespace, name = split_key(key)
+            namespace_id = namespace_ids.setdefault(namespace, len(namespace_ids))
+            names.append((namespace_id, os.fsencode(name)))
+
+        parts = [KEY_COUNT.pack(len(namespace_ids))]
+        for namespace in namespace_ids:
+            bnamespace = os.fsencode(namespace)
+            parts.append(NAMESPACE_HEAD.pack(len(bnamespace)))
+            parts.append(bnamespace)
+        parts.append(KEY_COUNT.pack(len(names)))
+        for namespace_id, bname in names:
+            parts.append(KEY_HEAD.pack(namespace_id, len(bname)))
+            parts.append(bname)
+        keys = b''.join(parts)
+        self.stream.write(keys)
+        self.stored_key_bytes += len(keys)
+        self.namespaces = len(namespace_ids)
+
+        index_offset = keys_offset + len(keys)
+        self.records.sort()
+        self.stream.write(INDEX_ENTRY.pack(len(self.records)))
+        for _, offset in self.records:
+            self.stream.write(INDEX_ENTRY.pack(offset))
+
+        self.stream.write(FOOTER.pack(keys_offset, index_offset, MAGIC))
+        self.stream.close()
+        self.stream = None
+
+
+# --- Reading:
+
+class Snapshot:
+    """
+    A snapshot file, mapped into memory.
+
+    Values are memoryviews into the mapping, only valid while the snapshot
+    is open. (If some are still around when closing, the mapping is closed
+    once they're gone.)
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+
+        if self.mm[:len(MAGIC)] != MAGIC or len(self.mm) < len(MAGIC) + FOOTER.size:
+            self.close()
+            raise ValueError("'{}' is not a snapshot.".format(filename))
+        keys_offset, self.index_offset, magic = FOOTER.unpack_from(self.mm, len(self.mm) - FOOTER.size)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("'{}' is incomplete (no footer).".format(filename))
+
+        namespaces = []
+        count, = KEY_COUNT.unpack_from(self.mm, keys_offset)
+        offset = keys_offset + KEY_COUNT.size
+        for _ in range(count):
+            length, = NAMESPACE_HEAD.unpack_from(self.mm, offset)
+            offset += NAMESPACE_HEAD.size
+            namespaces.append(self.mm[offset:offset + length])
+            offset += length
+
+        self.keys = []
+        count, = KEY_COUNT.unpack_from(self.mm, offset)
+        offset += KEY_COUNT.size
+        for _ in range(count):
+            namespace_id, length = KEY_HEAD.unpack_from(self.mm, offset)
+            offset += KEY_HEAD.size
+            self.keys.append(os.fsdecode(namespaces[namespace_id] + self.mm[offset:offset + length]))
+            offset += length
+
+        self.count, = INDEX_ENTRY.unpack_from(self.mm, self.index_offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self.mm is None:
+            return
+        self.view.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            # Values are still in use.
+            pass
+        self.mm = None
+
+    def record_offset(self, i):
+        """Offset of the `i`th record, in path order."""
+        return INDEX_ENTRY.unpack_from(self.mm, self.index_offset + INDEX_ENTRY.size * (i + 1))[0]
+
+    def record_path(self, offset):
+        length, = RECORD_HEAD.unpack_from(self.mm, offset)
+        start = offset + RECORD_HEAD.size
+        return self.mm[start:start + length]
+
+    def read_record(self, offset):
+        """
+        Read the record at `offset`.
+
+        :return: (path (str), digest (bytes), dict of key -> value (memoryview))
+        """
+        length, = RECORD_HEAD.unpack_from(self.mm, offset)
+        offset += RECORD_HEAD.size
+        path = os.fsdecode(self.mm[offset:offset + length])
+        offset += length
+        digest = self.mm[offset:offset + RECORD_DIGEST_SIZE]
+        offset += RECORD_DIGEST_SIZE
+        count, = RECORD_COUNT.unpack_from(self.mm, offset)
+        offset += RECORD_COUNT.size
+
+        xattrs = {}
+        for _ in range(count):
+            key_id, length = RECORD_XATTR.unpack_from(self.mm, offset)
+            offset += RECORD_XATTR.size
+            xattrs[self.keys[key_id]] = self.view[offset:offset + length]
+            offset += length
+        return path, digest, xattrs
+
+    def find(self, path):
+        """Offset of the record of `path` (binary search), or None."""
+        bpath = os.fsencode(path)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = self.record_offset(mid)
+            found = self.record_path(offset)
+            if found == bpath:
+                return offset
+            if found < bpath:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def lower_bound(self, path):
+        """Position (in path order) of the first record not before `path`."""
+        bpath = os.fsencode(path)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.record_path(self.record_offset(mid)) < bpath:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def tree(self, root):
+        """
+        Yield the records of `root` and everything below it, sorted by path.
+
+        :return: Generator of (path relative to `root` ("" for the root
+                 itself), digest, xattrs) tuples
+        """
+        broot = os.fsencode(root)
+        if broot != b'/':
+            broot = broot.rstrip(b'/')
+        prefix = broot if broot.endswith(b'/') else broot + b'/'
+
+        for i in range(self.lower_bound(broot), self.count):
+            offset = self.record_offset(i)
+            bpath = self.record_path(offset)
+            if bpath == broot:
+                relative = ''
+            elif bpath.startswith(prefix):
+                relative = os.fsdecode(bpath[len(prefix):])
+            elif bpath > prefix:
+                break
+            else:
+                # Next to the root, like "music.txt" for "music".
+                continue
+            _, digest, xattrs = self.read_record(offset)
+            yield relative, digest, xattrs
+
+    def get(self, path):
+        """
+        The xattrs of `path`.
+
+        :return: Dict of key -> value (memoryview), or None if `path` isn't in the snapshot
+        """
+        offset = self.find(path)
+        if offset is None:
+            return None
+        return self.read_record(offset)[2]
+
+    def digest(self, path):
+        offset = self.find(path)
+        if offset is None:
+            return None
+        return self.read_record(offset)[1]
+
+    def __contains__(self, path):
+        return self.find(path) is not None
+
+    def __iter__(self):
+        """Yield (path, digest, xattrs) of all files, sorted by path."""
+        for i in range(self.count):
+            yield self.read_record(self.record_offset(i))
+
+
+##
+# The xattrs of one file in a snapshot, with the interface of xattr.xattr,
+# so AHAlodeck can load it like a live file. Read-only.
+#
+class SnapshotFile:
+
+    def __init__(self, filename):
+        split = split_path(filename)
+        if split is None:
+            raise FileNotFoundError(2, "Not in a snapshot", filename)
+        snapshot, path = split
+
+        with Snapshot(snapshot) as snap:
+            # Paths are stored as they were scanned (usually absolute):
+            xattrs = snap.get(path)
+            if xattrs is None:
+                xattrs = snap.get(os.sep + path)
+            if xattrs is None:
+                raise FileNotFoundError(2, "Not in snapshot '{}'".format(snapshot), path)
+            self.xattrs = {key: bytes(value) for key, value in xattrs.items()}
+
+        self.filename = filename
+
+    def list(self):
+        return list(self.xattrs)
+
+    def get(self, key):
+        try:
+            return self.xattrs[key]
+        except KeyError:
+            raise OSError(61, "No data available", key)
+
+    def size(self, key):
+        return len(self.get(key))
+
+    def set(self, key, value):
+        raise OSError(30, "Snapshots are read-only", self.filename)
+
+    def remove(self, key):
+        raise OSError(30, "Snapshots are read-only", self.filename)
+
+
+# --- Commandline parameters:
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+            description='XSNAP: Show the contents of an xattr snapshot (written by `xscan --snapshot`) in getfattr format. (part of ⭐️-AHAlodeck-❤️)'
+            )
+    parser.add_argument('snapshot',
+            help='Snapshot file to read.'
+            )
+    parser.add_argument('paths',
+            nargs='*',
+            help='Only show these files. (default: all)'
+            )
+    parser.add_argument('-e', '--encoding',
+            type=str,
+            choices=('auto', 'text', 'hex', 'base64'),
+            default='auto',
+            help='How to write values: text if printable (auto), text, hex or base64. (default: auto)'
+            )
+
+    return parser
+
+
+# --- Main function:
+
+def main():
+    # xdump imports this module (to restore snapshots), so import it late:
+    from xdump import dump_name, format_file
+
+    parser = parse_args()
+    args = parser.parse_args()
+
+    try:
+        snapshot = Snapshot(args.snapshot)
+    except (OSError, ValueError) as e:
+        print("ERROR: {}".format(e), file=sys.stderr)
+        sys.exit(2)
+
+    output = sys.stdout.buffer
+    missing = 0
+    with snapshot:
+        if args.paths:
+            records = []
+            for path in args.paths:
+                offset = snapshot.find(os.path.abspath(path))
+                if offset is None:
+                    print("ERROR: '{}' is not in the snapshot.".format(path), file=sys.stderr)
+                    missing += 1
+                else:
+                    records.append(snapshot.read_record(offset))
+        else:
+            records = snapshot
+
+        for path, digest, xattrs in records:
+            if xattrs:
+                output.write(format_file(dump_name(path), sorted(xattrs.items()), args.encoding))
+        output.flush()
+
+    if missing:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+#!/usr/bin/python3
+# @date: 2026-10-18
+
+# This program keeps an xattr index (see xscan) up to date while files
+# change: It watches the trees with inotify, and re-reads the xattrs of
+# what changed (IN_ATTRIB: setting an xattr changes the ctime), was created,
+# moved or deleted.
+#
+# Events are coalesced: Changes are collected until the trees have been
+# quiet for a moment (--delay), so writing 100 keys to a file (e.g. j2x)
+# updates the index once, not 100 times.
+#
+# inotify is used through ctypes (Linux only), no extra packages needed.
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import stat
+import struct
+import sys
+import time
+
+from xscan import XattrIndex, walk, matches, read_xattrs, fingerprint, scan, add_filter_args, make_stats, SYMLINKS_SKIP, SYMLINKS_FOLLOW
+
+
+# inotify constants (see <sys/inotify.h>):
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+# What a watched folder reports, about itself and its entries:
+WATCH_MASK = IN_ATTRIB | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT = struct.Struct('iIII')       # wd, mask, cookie, length of name
+
+# Coalescing: wait until no events came for DELAY seconds, but not longer
+# than MAX_DELAY in total (for trees that never get quiet):
+DELAY = 0.5
+MAX_DELAY = 5.0
+
+
+# --- Commandline parameters:
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+            description='XWATCH: Keep an xattr index up to date, by watching directory trees with inotify. (part of ⭐️-AHAlodeck-❤️)'
+            )
+    parser.add_argument('paths',
+            nargs='+',
+            help='Directories to watch.'
+            )
+    parser.add_argument('-i', '--index',
+            type=str,
+            default='xattrs.db',
+            help='Index database file to update. (default: xattrs.db)'
+            )
+    parser.add_argument('-d', '--delay',
+            type=float,
+            default=DELAY,
+            help='Wait for this many seconds without changes before updating the index. (default: {})'.format(DELAY)
+            )
+    add_filter_args(parser, 'index')
+    parser.add_argument('-v', '--verbose',
+            action='count',
+            default=0,
+            help='Increase verbosity level.'
+            )
+
+    return parser
+
+
+# --- inotify:
+
+class Inotify:
+    """Minimal inotify binding: add watches, read events."""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.paths = {}     # wd -> path
+        self.wds = {}       # path -> wd
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        # A folder watched before, under another path (moved):
+        old = self.paths.get(wd)
+        if old is not None and old != path:
+            self.wds.pop(old, None)
+        self.paths[wd] = path
+        self.wds[path] = wd
+        return wd
+
+    def read(self, timeout=None):
+        """
+        Wait up to `timeout` seconds for events.
+
+        :return: List of (path, mask) tuples. path is the watched folder, or
+                 the entry in it the event is about.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            folder = self.paths.get(wd)
+            if mask & IN_IGNORED:
+                # Watch removed (folder deleted or moved away):
+                if folder is not None:
+                    del self.paths[wd]
+                    self.wds.pop(folder, None)
+                continue
+            if folder is None and not (mask & IN_Q_OVERFLOW):
+                continue
+            path = os.path.join(folder, os.fsdecode(name)) if (folder and name) else folder
+            events.append((path, mask))
+        return events
+
+
+class Watcher:
+    """
+    Watches all folders of some trees, and collects what changed in them,
+    coalesced (see changes()).
+    """
+
+    def __init__(self, roots, exclude=(), symlinks=SYMLINKS_SKIP):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.exclude = exclude
+        self.symlinks = symlinks
+        self.inotify = Inotify()
+        for root in self.roots:
+            self.add_tree(root)
+
+    def close(self):
+        self.inotify.close()
+
+    def add_tree(self, path):
+        """Watch `path` and all folders below it."""
+        for found, st in walk(path, exclude=self.exclude, symlinks=self.symlinks):
+            if stat.S_ISDIR(st.st_mode) and found not in self.inotify.wds:
+                try:
+                    self.inotify.add_watch(found)
+                except OSError as e:
+                    print("WARNING: cannot watch '{}': {}".format(found, e), file=sys.stderr)
+
+    def changes(self, delay=DELAY, max_delay=MAX_DELAY, timeout=None):
+        """
+        Wait for changes, then collect more of them until there were none
+        for `delay` seconds (or `max_delay` passed).
+
+        :param timeout: Seconds to wait for the first change (None: forever)
+        :return: Dict of path -> (OR'ed) inotify event mask. Empty on timeout.
+        """
+        changed = {}
+        for path, mask in self.inotify.read(timeout):
+            changed[path] = changed.get(path, 0) | mask
+        if not changed:
+            return changed
+
+        start = time.monotonic()
+        while time.monotonic() - start < max_delay:
+            events = self.inotify.read(delay)
+            if not events:
+                break
+            for path, mask in events:
+                changed[path] = changed.get(path, 0) | mask
+        return changed
+
+
+# --- Updating the index:
+
+def new_stats():
+    return make_stats('events', 'updated', 'unchanged', 'removed')
+
+def root_of(roots, path):
+    for root in roots:
+        if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+            return root
+    return None
+
+def apply_changes(index, watcher, changes, include=(), stats=None, verbose=0):
+    """
+    Update `index` with what changed (see Watcher.changes()).
+
+    :return: Stats dict (see new_stats())
+    """
+    if stats is None:
+        stats = new_stats()
+    stats['events'] += len(changes)
+    follow = (watcher.symlinks == SYMLINKS_FOLLOW)
+
+    if any(mask & IN_Q_OVERFLOW for mask in changes.values()):
+        # Events were lost: fall back to an (incremental) scan.
+        print("WARNING: inotify queue overflow, rescanning.", file=sys.stderr)
+        for root in watcher.roots:
+            watcher.add_tree(root)
+        result = scan(index, watcher.roots, include, watcher.exclude, watcher.symlinks)
+        stats['updated'] += result['updated']
+        stats['removed'] += result['removed']
+        return stats
+
+    for path, mask in sorted(changes.items()):
+        if path is None:
+            continue
+        root = root_of(watcher.roots, path)
+        if root is None:
+            continue
+        relpath = os.path.relpath(path, root)
+        name = os.path.basename(path)
+        if watcher.exclude and path != root and matches(watcher.exclude, name, relpath):
+            continue
+
+        try:
+            st = os.stat(path, follow_symlinks=follow)
+        except FileNotFoundError:
+            # Deleted or moved away: it and everything below it.
+            removed = index.prune(path, set())
+            stats['removed'] += removed
+            if verbose and removed:
+                print("removed: {}".format(path))
+            continue
+        except OSError as e:
+            stats['errors'] += 1
+            print("WARNING: cannot index '{}': {}".format(path, e), file=sys.stderr)
+            continue
+
+        if stat.S_ISLNK(st.st_mode) and watcher.symlinks == SYMLINKS_SKIP:
+            continue
+
+        if stat.S_ISDIR(st.st_mode) and mask & (IN_CREATE | IN_MOVED_TO):
+            # A new folder (maybe with contents, if moved here):
+            watcher.add_tree(path)
+            result = scan(index, [path], include, watcher.exclude, watcher.symlinks)
+            stats['updated'] += result['updated']
+            if verbose:
+                print("added: {} ({} objects)".format(path, result['files']))
+            continue
+
+        if include and not stat.S_ISDIR(st.st_mode) and not matches(include, name, relpath):
+            continue
+
+        try:
+            xattrs = read_xattrs(path, follow_symlinks=follow)
+        except FileNotFoundError:
+            stats['removed'] += index.prune(path, set())
+            continue
+        except (OSError, UnicodeEncodeError) as e:
+            stats['errors'] += 1
+            print("WARNING: cannot index '{}': {}".format(path, e), file=sys.stderr)
+            continue
+
+        digest = fingerprint(xattrs)
+        known = index.lookup(path)
+        if known and known[4] == digest:
+            index.touch(known[0], st)
+            stats['unchanged'] += 1
+        else:
+            index.update(path, xattrs, st, digest, known[0] if known else None)
+            stats['updated'] += 1
+            if verbose:
+                print("updated: {} ({} attributes)".format(path, len(xattrs)))
+
+    index.commit()
+    return stats
+
+
+# --- Main function:
+
+def main():
+    parser = parse_args()
+    args = parser.parse_args()
+
+    index = XattrIndex(args.index)
+    watcher = None
+    try:
+        # Start watching first, so nothing gets lost while scanning:
+        watcher = Watcher(args.paths, args.exclude, args.symlinks)
+        stats = scan(index, args.paths, args.include, args.exclude, args.symlinks)
+        print("indexed {} files, watching {} folders.".format(stats['files'], len(watcher.inotify.wds)))
+
+        while True:
+            changes = watcher.changes(delay=args.delay)
+            stats = apply_changes(index, watcher, changes, args.include, verbose=args.verbose)
+            if args.verbose:
+                print("{} changes: {} updated, {} unchanged, {} removed. {} errors.".format(
+                    stats['events'], stats['updated'], stats['unchanged'], stats['removed'], stats['errors']))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print("ERROR: {}".format(e), file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if watcher is not None:
+            watcher.close()
+        index.close()
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,7 @@
 
 a = Analysis(
     ['src/mercs.py'],
-    pathex=[],
+    pathex=['helpers'],
     binaries=[],
     datas=[('src/mainwindow.ui', '.')],
     hiddenimports=[],
@@ -1,20 +1,237 @@
 # This Python file uses the following encoding: utf-8
+import os
+import ctypes
+import ctypes.util
 import xattr
-from pprint import pprint
+import concurrent.futures
+
+try:
+    # Files in xattr snapshots (see helpers/xsnap.py):
+    import xsnap
+except ImportError:
+    xsnap = None
+
+
+##
+# Returns the size (in bytes) of the value of xattr 'key' of 'filename',
+# without reading it: getxattr(2) with an empty buffer returns just the size.
+# Where libc has no getxattr(), the value is read after all.
+#
+def xattrSize(filename, key):
+    global _getxattr
+    if _getxattr is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        _getxattr = getattr(libc, 'getxattr', False)
+        if _getxattr:
+            _getxattr.argtypes = (ctypes.c_char_p, ctypes.c_char_p, ctypes.c_void_p, ctypes.c_size_t)
+            _getxattr.restype = ctypes.c_ssize_t
+    if not _getxattr:
+        return len(os.getxattr(filename, key))
+
+    size = _getxattr(os.fsencode(filename), os.fsencode(key), None, 0)
+    if size == -1:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno), filename)
+    return size
+
+_getxattr = None
+
+
+##
+# Raised by long running operations (load, save) when asked to stop.
+#
+class Cancelled(Exception):
+    pass
+
+
+##
+# The value of a key whose value differs between the files of a session
+# (or which some files don't have). A marker object, not bytes, so no real
+# value can be mistaken for it. How it's shown is up to the view.
+#
+class Mixed():
+    __slots__ = ()
+
+    def __repr__(self):
+        return "MIXED"
+
+MIXED = Mixed()
+
+
+##
+# One attribute: key, raw value (bytes) and its text form.
+#
+# The value is decoded only once, when 'text' is first asked for. Values
+# that aren't valid in 'encoding' are shown as hex ('status' HEX). Values
+# not loaded yet (None, see AHAlodeck.lazy) have neither text nor status.
+# MIXED stays MIXED as text.
+#
+# Entries are shared between XattrSets (working copy, snapshots), so don't
+# change them: a changed value is a new entry. The only exception is
+# load(), which fills in a value that wasn't loaded yet.
+#
+class XattrEntry():
+    __slots__ = ('key', 'value', 'encoding', '_text', '_status')
+
+    TEXT = "text"
+    HEX = "hex"
+
+    def __init__(self, key, value, encoding="utf-8"):
+        self.key = key
+        self.value = value
+        self.encoding = encoding
+        self._text = None
+        self._status = None
+
+    def decode(self):
+        if self.value is None or self._status:
+            return
+        if self.value is MIXED:
+            self._text = MIXED
+            self._status = self.TEXT
+            return
+        try:
+            self._text = self.value.decode(self.encoding)
+            self._status = self.TEXT
+        except UnicodeDecodeError:
+            print("Non-Unicode binary sequence found: %s" % (self.key))
+            self._text = self.value.hex()
+            self._status = self.HEX
+
+    ##
+    # Sets the value of an entry that wasn't loaded (lazy mode).
+    #
+    def load(self, value):
+        if self.value is None:
+            self.value = value
+
+    @property
+    def text(self):
+        self.decode()
+        return self._text
+
+    @property
+    def status(self):
+        self.decode()
+        return self._status
+
+
+##
+# The attributes of a file (or a merged view of several), in order.
+#
+# Iterating yields (key, value) tuples, so it can be used wherever a list
+# of pairs is expected: dict(xattrs), sorted(xattrs), ...
+#
+# snapshot() is cheap: Both sets share their entries until one of them is
+# changed, which then copies the key -> entry table (not the entries).
+#
+class XattrSet():
+    __slots__ = ('_entries', '_shared', 'encoding')
+
+    ##
+    # 'metadata': (key, value) pairs or XattrEntry objects. Text values are
+    # encoded with 'encoding'.
+    #
+    def __init__(self, metadata=(), encoding="utf-8"):
+        self._entries = {}
+        self._shared = False
+        self.encoding = encoding
+        for item in metadata:
+            self.add(item)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        for entry in self._entries.values():
+            yield (entry.key, entry.value)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __repr__(self):
+        return "XattrSet({!r})".format(list(self))
+
+    def entries(self):
+        return self._entries.values()
+
+    def entry(self, key):
+        return self._entries.get(key)
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        return entry.value
+
+    ##
+    # Adds (or replaces) an entry: an XattrEntry or a (key, value) pair.
+    #
+    def add(self, item):
+        if not isinstance(item, XattrEntry):
+            key, value = item
+            if value is not None and value is not MIXED and not isinstance(value, bytes):
+                value = value.encode(self.encoding)
+            item = XattrEntry(key, value, self.encoding)
+        self._own()
+        self._entries[item.key] = item
+
+    def set(self, key, value):
+        self.add((key, value))
+
+    def remove(self, key):
+        self._own()
+        del self._entries[key]
+
+    ##
+    # Returns a copy, sharing everything until either of them is changed.
+    #
+    def snapshot(self):
+        other = XattrSet(encoding=self.encoding)
+        other._entries = self._entries
+        other._shared = self._shared = True
+        return other
+
+    def _own(self):
+        if self._shared:
+            self._entries = dict(self._entries)
+            self._shared = False
 
 
 class AHAlodeck():
     encoding = "utf-8"                  # Default text encoding
+    workers = 8                         # Threads for reading/writing many files
+
+    # Value of a key whose value differs between the files of a session (or
+    # which some files don't have). Saving it leaves each file's own value
+    # as it is.
+    MIXED = MIXED
+
+    # Lazy mode: Only the keys are read when loading a file. Values are read
+    # when they're needed (e.g. shown), and until then are None in the
+    # metadata lists. Saving an unloaded value leaves it as it is.
+    # Values bigger than 'lazyLimit' bytes are only read when forced to
+    # (e.g. when edited), since they're usually binary blobs.
+    lazy = False
+    lazyLimit = 4096
 
     def __init__(self):
-        self.metadata: list = []
+        self.metadata = XattrSet()
+        self._metadata = XattrSet()
+        self.files: dict = {}           # filename -> {'xattrs': ..., 'original': XattrSet}
+        self.sizes: dict = {}           # (filename, key) -> value size, see valueSize()
+        self.metadata_utf = None        # Text view of 'metadata', see getMetadataText()
+        self._kv_list = None
         # super().__init__(parent)
         print("Roger: Init AHAlodeck.")
         #print("Window: {}".format(window.windowTitle()))
 
     def longestWord(self, data):
         maximum = 0
+        word = ""
         for i in data:
+            if not isinstance(i, str):
+                continue            # value not loaded (yet), or MIXED
             length = len(i)
             if length > maximum:
                 maximum = length
@@ -24,42 +241,55 @@ class AHAlodeck():
     def getMetadata(self):
         return self.metadata
 
+    ##
+    # Returns 'metadata' as list of [key, text] (see BinToUnicode()).
+    #
+    # The text view is kept until the metadata changes (setMetadata(),
+    # revertMetadata(), loading), so asking again is free. Don't modify it.
+    #
     def getMetadataText(self):
-        self.metadata_utf = self.BinToUnicode(self.metadata)
+        if self.metadata_utf is None:
+            self.metadata_utf = self.BinToUnicode(self.metadata)
         return self.metadata_utf
 
     ##
-    # Converts byte-sequence list to unicode.
+    # Returns 'metadata' as XattrSet (which it may already be).
     #
-    def BinToUnicode(self, metadata):
-        text = []
-        for key, value in metadata:
-            try:
-                keyvalue = [
-                        key,
-                        value.decode(self.encoding)
-                        ]
-            except UnicodeDecodeError as e:
-                print("Non-Unicode binary sequence found: %s" % (key))
-                keyvalue = [
-                        key,
-                        value.hex()
-                        ]
+    def toSet(self, metadata):
+        if isinstance(metadata, XattrSet):
+            return metadata
+        return XattrSet(metadata, self.encoding)
+
+    ##
+    # Forgets the text view of 'metadata', after it has changed.
+    #
+    def invalidateText(self):
+        self.metadata_utf = None
+        self._kv_list = None
 
-            text.append(keyvalue)
-        return text
+    ##
+    # Converts byte-sequence list to unicode: a list of (key, text).
+    # Values that aren't loaded (lazy mode) stay None.
+    #
+    def BinToUnicode(self, metadata):
+        return [(entry.key, entry.text) for entry in self.toSet(metadata).entries()]
 
     ##
-    # The opposite of BinToUnicde().
+    # The opposite of BinToUnicde(): Returns an XattrSet.
+    # Text that's unchanged from the working copy keeps its entry (and so
+    # the original bytes), so binary values shown as hex survive a save and
+    # unchanged values aren't duplicated.
     #
     def UnicodeToBin(self, metadata):
-        byte = []
+        byte = XattrSet(encoding=self.encoding)
         for key, value in metadata:
-            keyvalue = [
-                    key,
-                    value.encode(self.encoding)
-                    ]
-            byte.append(keyvalue)
+            entry = self.metadata.entry(key)
+            if value is None or value is self.MIXED:
+                byte.add((key, value))
+            elif entry is not None and entry.value is not None and entry.text == value:
+                byte.add(entry)
+            else:
+                byte.add((key, value.encode(self.encoding)))
 
         return byte
 
@@ -77,76 +307,389 @@ class AHAlodeck():
     # in:  [(key1,value1), (key2,value2), ...]
     # out: [(key1, key2, key3, ...), (value1, value2, value3, ...)]
     #
+    # The result for the text view (getMetadataText()) is kept, like the
+    # view itself.
+    #
     def get_kv_list(self, metadata):
-        #pprint(metadata) # DEBUG DELME
+        if metadata is self.metadata_utf and self._kv_list is not None:
+            return self._kv_list
+
         kv_list = list(zip(*metadata))  # 😘️ to Python! this is beautiful.
-        pprint(kv_list) # DEBUG DELME
 
         if not (kv_list):
             return None
 
+        if metadata is self.metadata_utf:
+            self._kv_list = kv_list
         return kv_list
 
     def setMetadata(self, metadata):
-        self.metadata = metadata
+        self.metadata = self.toSet(metadata)
+        self.invalidateText()
+
+    ##
+    # Compares 'metadata' against the snapshot taken in loadXattrs() (or
+    # 'original', if given) and sorts the keys into what has to be written.
+    # Returns a tuple of dicts/lists: (changed, added, removed)
+    #
+    def diffMetadata(self, metadata, original=None):
+        if original is None:
+            original = self._metadata
 
-    def writeMetadata(self, metadata):
-        filename = self.filename  # TODO: currently it can only do 1 at a time.
-        xattrs = self.xattrs
+        # Compare byte sequences, since that's what's on disk:
+        metadata = self.toSet(metadata)
+        original = self.toSet(original)
 
-        #TODO: Write all changes atomically? meaning: delete everything
-        #first, then write again from 'metadata' variable?
-        print("Removing all existing attributes first...")
-        xattrs.clear()
+        changed = {}
+        added = {}
+        for entry in metadata.entries():
+            old = original.entry(entry.key)
+            if old is None:
+                added[entry.key] = entry.value
+            elif old is not entry and old.value != entry.value:
+                changed[entry.key] = entry.value
+
+        removed = [key for key, _ in original if key not in metadata]
+
+        return changed, added, removed
+
+    ##
+    # Writes only what differs from the snapshot read from the filesystem:
+    # Changed and added keys are set, deleted keys are removed. Unchanged
+    # attributes are not touched at all.
+    #
+    # With several files loaded, 'metadata' is the merged view (see
+    # mergeMetadata()): Every key is written to all files, except those with
+    # the value MIXED, which keep each file's own value. The files are
+    # written in parallel. ValueError is raised (before writing anything)
+    # for a MIXED key that's not in any of the files, or a key whose value
+    # isn't loaded (None) that's not in all of them.
+    #
+    # Returns the number of keys per kind of change (summed over all files).
+    #
+    # 'progress(done, total)' is called after each key (or file, if there
+    # are several), if given.
+    # 'cancelled()' is checked before each key, if given: If it returns True,
+    # Cancelled is raised. What's written so far stays written, so reload
+    # from disk afterwards.
+    #
+    def writeMetadata(self, metadata, progress=None, cancelled=None):
+        metadata = self.toSet(metadata)
+
+        # MIXED keeps each file's own value: a key no file has (e.g. renamed)
+        # has none to keep.
+        for entry in metadata.entries():
+            if entry.value is self.MIXED and not any(entry.key in state['original'] for state in self.files.values()):
+                raise ValueError("'{}' has different values per file, and no file has it.".format(entry.key))
+            # Not loaded (lazy mode) is the same for a key without a value:
+            if entry.value is None and not all(entry.key in state['original'] for state in self.files.values()):
+                raise ValueError("The value of '{}' is not loaded, and not all files have it.".format(entry.key))
+
+        jobs = []
+        for filename, state in self.files.items():
+            own = state['original']
+            target = XattrSet(encoding=self.encoding)
+            for entry in metadata.entries():
+                if entry.value is None or entry.value is self.MIXED:
+                    if entry.key in own:
+                        target.add(own.entry(entry.key))
+                else:
+                    old = own.entry(entry.key)
+                    if old is not None and old.value is None:
+                        # Not loaded (lazy mode): compare with what's on disk.
+                        old.load(state['xattrs'].get(entry.key))
+                    target.add(entry)
+            jobs.append((filename, state, target))
+
+        count = {'changed': 0, 'added': 0, 'removed': 0}
+
+        if len(jobs) == 1:
+            filename, state, target = jobs[0]
+            results = [self.writeFile(filename, state, target, progress, cancelled)]
+        else:
+            results = []
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [
+                        pool.submit(self.writeFile, filename, state, target, None, cancelled)
+                        for filename, state, target in jobs
+                        ]
+                for done, future in enumerate(futures, start=1):
+                    results.append(future.result())
+                    if progress:
+                        progress(done, len(futures))
+
+        for result in results:
+            for kind in count:
+                count[kind] += result[kind]
+        print("done saving {} files: {changed} changed, {added} added, {removed} removed.".format(len(jobs), **count))
+
+        # What we've just written is now the state on disk:
+        self._metadata = self.mergeMetadata()
+
+        return count
+
+    ##
+    # Writes the difference between 'metadata' and the snapshot of a single
+    # file (see writeMetadata()).
+    #
+    def writeFile(self, filename, state, metadata, progress=None, cancelled=None):
+        xattrs = state['xattrs']
+
+        changed, added, removed = self.diffMetadata(metadata, state['original'])
 
         print("Storing metadata with '{}':".format(filename))
-        count = 0
-        for key, value in metadata:
-            #print("  '{} = {}'".format(key, value))
 
-            # Actually write the xattr pair:
-            # set() expects value to be a byte sequence (not string).
-            if not isinstance(value, bytes):
-                    value = value.encode(self.encoding)
+        total = len(changed) + len(added) + len(removed)
+        done = 0
 
+        # Write first, remove later: this way the file is never left without
+        # its metadata while saving.
+        for key, value in {**changed, **added}.items():
+            if cancelled and cancelled():
+                raise Cancelled("Saving '{}' cancelled.".format(filename))
+            # set() expects value to be a byte sequence (not string).
             xattrs.set(key, value)
-            count += 1
+            done += 1
+            if progress:
+                progress(done, total)
+
+        for key in removed:
+            if cancelled and cancelled():
+                raise Cancelled("Saving '{}' cancelled.".format(filename))
+            xattrs.remove(key)
+            done += 1
+            if progress:
+                progress(done, total)
+
+        state['original'] = metadata
+
+        return {
+                'changed': len(changed),
+                'added': len(added),
+                'removed': len(removed)
+                }
+
+    ##
+    # Merges the snapshots of all loaded files into one XattrSet:
+    # Keys with the same value in all files show that value, all others
+    # show MIXED.
+    #
+    def mergeMetadata(self):
+        states = list(self.files.values())
+        if len(states) == 1:
+            return states[0]['original'].snapshot()
+
+        found = {}
+        for state in states:
+            for entry in state['original'].entries():
+                found.setdefault(entry.key, []).append(entry)
+
+        merged = XattrSet(encoding=self.encoding)
+        for key, entries in found.items():
+            value = entries[0].value
+            if len(entries) == len(states) and all(e.value == value for e in entries):
+                merged.add(entries[0])
+            else:
+                merged.add((key, self.MIXED))
+        return merged
 
-        print("done saving {} attributes.".format(count))
+    ##
+    # Returns the keys shown as MIXED in the current view.
+    #
+    def getMixedKeys(self):
+        return [key for key, value in self.metadata if value is self.MIXED]
 
 
     ##
     # Revert the metadata to its original state.
+    # Only a snapshot: nothing's copied until the working copy is changed.
     #
     def revertMetadata(self):
-        self.metadata = self._metadata.copy()
+        self.metadata = self._metadata.snapshot()
+        self.invalidateText()
 
 
     def setFilename(self, filename):
         self.filename = filename
+        self.filenames = [filename]
+
 
+    ##
+    # Reads all xattrs of 'filename', without changing this object. That's
+    # what makes it safe to run in a background thread.
+    # 'progress' and 'cancelled' work like in writeMetadata().
+    # Returns a tuple: (xattr object, XattrSet)
+    #
+    def readXattrs(self, filename, progress=None, cancelled=None, lazy=False):
+        print("loading xattrs from {}".format(filename))
+
+        xattrs = self.openXattrs(filename)
+        keys = xattrs.list()
+
+        if lazy:
+            # Only the keys, values come later (see fetchValue()):
+            if progress:
+                progress(len(keys), len(keys))
+            return xattrs, XattrSet(((key, None) for key in keys), self.encoding)
+
+        metadata = XattrSet(encoding=self.encoding)
+        for done, key in enumerate(keys, start=1):
+            if cancelled and cancelled():
+                raise Cancelled("Loading '{}' cancelled.".format(filename))
+            try:
+                metadata.add((key, xattrs.get(key)))
+            except OSError:
+                # Removed between list() and get().
+                pass
+            if progress:
+                progress(done, len(keys))
 
-    def loadXattrs(self, filename=None):
+        return xattrs, metadata
+
+    ##
+    # Returns the xattr object of 'filename'. Files inside a snapshot
+    # (e.g. "backup.xsnap/music/song.mp3") are opened (read-only) from there.
+    #
+    def openXattrs(self, filename):
+        if xsnap and xsnap.split_path(filename):
+            return xsnap.SnapshotFile(filename)
+        return xattr.xattr(filename)
+
+    ##
+    # Reads the xattrs of several files in parallel (see readXattrs()).
+    # Returns a list of (filename, xattr object, metadata) tuples.
+    #
+    # A single file is read lazily if 'lazy' is set. Several files are
+    # always read completely, since merging needs their values.
+    #
+    def readFiles(self, filenames, progress=None, cancelled=None):
+        if len(filenames) == 1:
+            xattrs, metadata = self.readXattrs(filenames[0], progress, cancelled, lazy=self.lazy)
+            return [(filenames[0], xattrs, metadata)]
+
+        loaded = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self.readXattrs, filename, None, cancelled) for filename in filenames]
+            for done, (filename, future) in enumerate(zip(filenames, futures), start=1):
+                xattrs, metadata = future.result()
+                loaded.append((filename, xattrs, metadata))
+                if progress:
+                    progress(done, len(filenames))
+        return loaded
+
+    ##
+    # Makes what readFiles() returned the current state: The working copy
+    # is the merged view of all files.
+    #
+    def setFiles(self, loaded):
+        self.files = {}
+        self.sizes = {}
+        for filename, xattrs, metadata in loaded:
+            self.files[filename] = {'xattrs': xattrs, 'original': self.toSet(metadata)}
+
+        # The first file is "the" file, for anything needing just one:
+        self.filename, self.xattrs, _ = loaded[0]
+        self.filenames = [filename for filename, _, _ in loaded]
+
+        metadata = self.mergeMetadata()
+        self._metadata = metadata.snapshot()    # Keep a clone of the original data read from the filesystem.
+        self.metadata = metadata                # This is our working copy.
+        self.invalidateText()
+
+    ##
+    # Returns the size (in bytes) of the value of 'key', without reading it.
+    #
+    # Sizes are remembered until the next setFiles(), since the view asks
+    # for them on every repaint of a value that's not loaded.
+    #
+    def valueSize(self, key, filename=None):
         if not filename:
             filename = self.filename
+        size = self.sizes.get((filename, key))
+        if size is None:
+            xattrs = self.files[filename]['xattrs']
+            if hasattr(xattrs, 'size'):
+                # Not a live file (e.g. in a snapshot):
+                size = xattrs.size(key)
+            else:
+                size = xattrSize(filename, key)
+            self.sizes[(filename, key)] = size
+        return size
 
-        print("loading xattrs from {}".format(filename))
+    ##
+    # Reads the value of 'key' in lazy mode and remembers it, as if it had
+    # been read when loading.
+    # Returns the value (bytes), or None if it's bigger than 'lazyLimit'
+    # and not 'force'd.
+    #
+    def fetchValue(self, key, force=False):
+        if (not force) and self.valueSize(key) > self.lazyLimit:
+            return None
+
+        value = self.xattrs.get(key)
+
+        # Fill in where it's still missing (usually it's the same entry):
+        for metadata in (self.metadata, self._metadata, self.files[self.filename]['original']):
+            entry = metadata.entry(key)
+            if entry is not None:
+                entry.load(value)
+        self.invalidateText()
+
+        return value
+
+    ##
+    # Like fetchValue(), but returns the value as text (see BinToUnicode()).
+    #
+    def fetchValueText(self, key, force=False):
+        value = self.fetchValue(key, force)
+        if value is None:
+            return None
+        return XattrEntry(key, value, self.encoding).text
+
+    ##
+    # Text to show instead of a value that's not loaded.
+    #
+    def placeholderText(self, key):
+        size = self.valueSize(key)
+        return "<not loaded: {} bytes. Edit to load.>".format(size)
+
+    ##
+    # Makes what readXattrs() returned the current state.
+    #
+    def setXattrs(self, filename, xattrs, metadata):
+        self.setFiles([(filename, xattrs, metadata)])
+
+
+    def loadXattrs(self, filename=None, progress=None, cancelled=None):
+        if not filename:
+            filename = self.filename
 
         # Read xattr metadata:
-        self.xattrs = xattr.xattr(filename)
-        metadata = self.xattrs.items()
+        xattrs, metadata = self.readXattrs(filename, progress, cancelled)
+        self.setXattrs(filename, xattrs, metadata)
 
-        self._metadata = metadata.copy()    # Keep a clone of the original data read from the filesystem.
-        self.metadata = metadata            # This is our working copy.
 
+    def loadFiles(self, filenames, progress=None, cancelled=None):
+        self.setFiles(self.readFiles(filenames, progress, cancelled))
 
-    def initParameters(self, args, filename=None):
+
+    ##
+    # Set 'load=False' to leave loading to the caller (e.g. in background).
+    #
+    def initParameters(self, args, filename=None, load=True):
 
         self.args = args;       # Make the args available to the Object
 
         # TODO: Exception handling on given filename resource.
         if not filename:
             filename = self.args.filename   # load from arguments
-        self.filename = filename
 
-        self.loadXattrs()
+        # One or more files:
+        if isinstance(filename, (list, tuple)):
+            self.filenames = list(filename)
+        else:
+            self.filenames = [filename]
+        self.filename = self.filenames[0]
+
+        if load:
+            self.loadFiles(self.filenames)
@@ -0,0 +1,164 @@
+# This Python file uses the following encoding: utf-8
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant
+from PyQt5.QtGui import QBrush, QColor
+
+from AHAlodeck import AHAlodeck
+
+
+##
+# Table model for key/value metadata, as shown in the MERCS main window.
+#
+# The view only asks for the cells it actually displays, so the number of
+# attributes doesn't matter for rendering. Replacing all rows (e.g. on
+# reload) is a single model reset.
+#
+# Values differing between the files of a multi-file session
+# (AHAlodeck.MIXED) are shown as 'mixedText', highlighted. Closing the
+# editor on such a value without changing it keeps it MIXED. Their keys
+# can't be renamed.
+#
+# Values that aren't loaded yet (None, see AHAlodeck.lazy) are read through
+# 'loader(key, force)' the first time they're shown. If that returns None
+# (value too big), 'placeholder(key)' is shown instead, until the value is
+# edited. That is remembered, so repaints don't ask again. Renaming a key
+# loads its value first.
+#
+# Filtering and sorting (see mercs.py) use SortRole, which is the text as
+# it is, so they don't load every value in lazy mode.
+#
+class MetadataModel(QAbstractTableModel):
+    headers = ['Key', 'Value']
+    mixedText = "<different values>"
+    mixedBrush = QBrush(QColor(255, 240, 180))
+    unloadedBrush = QBrush(QColor(128, 128, 128))
+
+    loader = None
+    placeholder = None
+
+    SortRole = Qt.UserRole
+
+    def __init__(self, metadata=None, parent=None):
+        super(MetadataModel, self).__init__(parent)
+        self.rows: list = []
+        self.placeholders: dict = {}    # key -> text shown for a value too big to load
+        if metadata:
+            self.setMetadata(metadata)
+
+    ##
+    # Replaces all rows with 'metadata': a list of (key, value) text pairs.
+    #
+    def setMetadata(self, metadata):
+        self.beginResetModel()
+        self.rows = [[key, value] for key, value in metadata]
+        self.placeholders = {}
+        self.endResetModel()
+
+    ##
+    # Returns all rows as list of (key, value) tuples.
+    # Rows without a key (e.g. added, but never filled in) are left out.
+    #
+    def getMetadata(self):
+        return [(key, value) for key, value in self.rows if key]
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    ##
+    # Returns the value text of 'row', loading it if necessary.
+    # None if it's (still) not loaded.
+    #
+    def valueText(self, row, force=False):
+        key, value = self.rows[row]
+        if value is None and key and self.loader:
+            try:
+                value = self.loader(key, force)
+            except OSError as e:
+                print("Cannot load value of '{}': {}".format(key, e))
+                return None
+            self.rows[row][1] = value
+        return value
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+
+        row = index.row()
+        if index.column() == 1 and self.rows[row][1] is None:
+            # Lazy mode: value not loaded yet.
+            key = self.rows[row][0]
+            if role == Qt.DisplayRole:
+                if key in self.placeholders:
+                    return self.placeholders[key]
+                value = self.valueText(row)
+                if value is None and self.placeholder:
+                    try:
+                        self.placeholders[key] = self.placeholder(key)
+                    except OSError:
+                        self.placeholders[key] = ""
+                    return self.placeholders[key]
+                return value
+            if role == Qt.EditRole:
+                self.placeholders.pop(key, None)
+                return self.valueText(row, force=True) or ""
+            if role == Qt.ForegroundRole:
+                return self.unloadedBrush
+            if role == self.SortRole:
+                return ""
+
+        if role in (Qt.DisplayRole, Qt.EditRole, self.SortRole):
+            value = self.rows[row][index.column()]
+            if value is AHAlodeck.MIXED:
+                return self.mixedText
+            return value
+        if role == Qt.BackgroundRole and self.rows[row][1] is AHAlodeck.MIXED:
+            return self.mixedBrush
+        return QVariant()
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        if self.rows[index.row()][index.column()] is AHAlodeck.MIXED and value == self.mixedText:
+            return True     # not edited
+        if index.column() == 0 and self.rows[index.row()][1] is AHAlodeck.MIXED and value != self.rows[index.row()][0]:
+            # Each file has its own value under the old key:
+            print("Cannot rename '{}': its value differs between the files.".format(self.rows[index.row()][0]))
+            return False
+        if index.column() == 0 and self.rows[index.row()][1] is None and value != self.rows[index.row()][0]:
+            # Lazy mode: the value is read by key, so read it while it's there.
+            self.placeholders.pop(self.rows[index.row()][0], None)
+            if self.valueText(index.row(), force=True) is None:
+                print("Cannot rename '{}': its value can't be loaded.".format(self.rows[index.row()][0]))
+                return False
+        self.rows[index.row()][index.column()] = value
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return super(MetadataModel, self).headerData(section, orientation, role)
+
+    def insertRows(self, row, count, parent=QModelIndex()):
+        self.beginInsertRows(parent, row, row + count - 1)
+        for i in range(count):
+            self.rows.insert(row, ["", ""])
+        self.endInsertRows()
+        return True
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        self.beginRemoveRows(parent, row, row + count - 1)
+        del self.rows[row:row + count]
+        self.endRemoveRows()
+        return True
@@ -0,0 +1,68 @@
+# This Python file uses the following encoding: utf-8
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+from AHAlodeck import Cancelled
+
+
+##
+# Signals of an XattrWorker. (QRunnable is no QObject, so it can't have
+# signals of its own.)
+#
+class WorkerSignals(QObject):
+    progress = pyqtSignal(int, int)     # done, total
+    finished = pyqtSignal(object)       # whatever the job returned
+    failed = pyqtSignal(str)            # error message
+    cancelled = pyqtSignal()
+
+
+##
+# Runs a load/save job of AHAlodeck in a QThreadPool, so the GUI stays
+# responsive, e.g. on slow network mounts.
+#
+# The job is called with two extra keyword arguments:
+#   progress(done, total): report progress
+#   cancelled():           True if the job should stop (raise Cancelled)
+#
+# Signals are delivered to the GUI thread.
+#
+class XattrWorker(QRunnable):
+    # Emit progress at most every n steps (and at the end), so thousands of
+    # attributes don't flood the GUI with events:
+    progress_step = 50
+
+    def __init__(self, job, *args, **kwargs):
+        super(XattrWorker, self).__init__()
+        self.job = job
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self._cancel = threading.Event()
+
+        # The GUI keeps a reference while the job runs, so don't let the
+        # pool delete it underneath:
+        self.setAutoDelete(False)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def isCancelled(self):
+        return self._cancel.is_set()
+
+    def progress(self, done, total):
+        if (done % self.progress_step == 0) or (done == total):
+            self.signals.progress.emit(done, total)
+
+    def run(self):
+        try:
+            result = self.job(*self.args,
+                    progress=self.progress,
+                    cancelled=self.isCancelled,
+                    **self.kwargs)
+        except Cancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
@@ -7,17 +7,29 @@ import sys
 import argparse
 
 from os import path
+
+# The helpers (j2x, xscan, xquery, ...) are plain modules next to src/:
+sys.path.append(path.abspath(path.join(path.dirname(__file__), '..', 'helpers')))
+
 from AHAlodeck import AHAlodeck
+from MetadataModel import MetadataModel
+from XattrWorker import XattrWorker
+from xscan import XattrIndex
+from xquery import XattrQuery
 
 from PyQt5 import QtWidgets
-from PyQt5.QtWidgets import QFileDialog, QTableWidgetItem, QApplication, QFileDialog, QHeaderView
+from PyQt5.QtWidgets import QFileDialog, QApplication, QFileDialog, QHeaderView, QInputDialog, QMessageBox, QProgressBar, QPushButton
 from PyQt5 import uic
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QFileSystemWatcher, QSortFilterProxyModel, QThreadPool, QTimer
 
 from pprint import pprint
 
 
 class Ui(QtWidgets.QMainWindow):
+    # Changes on disk are collected for this long (ms) before reloading, so
+    # a burst of writes (e.g. j2x setting 100 keys) reloads once:
+    watchDelay = 300
+
     def __init__(self):
         super(Ui, self).__init__()          # Call the inherited classes __init__ method
         uiMainWindow = path.abspath(path.join(path.dirname(__file__), 'mainwindow.ui'))
@@ -29,11 +41,18 @@ class Ui(QtWidgets.QMainWindow):
 
         self.parseArgs()
         pprint(self.args)    # DEBUG
+        self.actionSearch.setEnabled(bool(self.args.index))
 
         aha = AHAlodeck()
-        aha.initParameters(self.args)
+        aha.lazy = self.args.lazy
+        aha.initParameters(self.args, load=False)
         self.aha = aha                      # finally
         self.initProperties()
+        self.initStatusBar()
+        self.initWatcher()
+
+        # Load in background: the window is usable right away.
+        self.loadFiles(aha.filenames)
 
 
     def openFileDialog(self):
@@ -42,20 +61,214 @@ class Ui(QtWidgets.QMainWindow):
         # dialogFileOpen = dfo
         dfo = QtWidgets.QFileDialog(self)
         dfo.setWindowTitle("Select Filesystem Object...")
-        dfo.setFileMode(QFileDialog.FileMode.ExistingFile)
+        dfo.setFileMode(QFileDialog.FileMode.ExistingFiles)
         dfo.setViewMode(QFileDialog.ViewMode.Detail)
 
         if dfo.exec():
             selectedFiles = dfo.selectedFiles()
-            for filename in selectedFiles:
-                self.aha.setFilename(filename)  # TODO: handle multiple. pleeeez ;)
-                self.aha.loadXattrs()
-                self.btnReloadClicked()
+            self.loadFiles(selectedFiles)
             return selectedFiles
 
         return None
 
 
+    ##
+    # Full-text search in the xattr index (see `xscan`), then open the file
+    # picked from the results.
+    #
+    def searchIndexDialog(self):
+        words, ok = QInputDialog.getText(self, "Search Index", "Words to search for (word* matches prefixes):")
+        if not ok or not words.strip():
+            return None
+
+        index = XattrIndex(self.args.index)
+        try:
+            results = XattrQuery(index).text_search(words, limit=500)
+        finally:
+            index.close()
+
+        if not results:
+            QMessageBox.information(self, "Search Index", "Nothing found for '{}'.".format(words))
+            return None
+
+        paths = [found for found, score in results]
+        filename, ok = QInputDialog.getItem(self, "Search Index",
+                "{} files found, best matches first:".format(len(paths)), paths, 0, False)
+        if not ok:
+            return None
+
+        self.loadFiles([filename])
+        return filename
+
+
+    ##
+    # Progress bar and cancel button for background jobs.
+    #
+    def initStatusBar(self):
+        self.threadPool = QThreadPool.globalInstance()
+        self.worker = None
+
+        self.progressBar = QProgressBar(self)
+        self.progressBar.setMaximumWidth(200)
+        self.progressBar.hide()
+        self.btnCancel = QPushButton("Cancel", self)
+        self.btnCancel.clicked.connect(self.btnCancelClicked)
+        self.btnCancel.hide()
+
+        self.statusbar.addPermanentWidget(self.progressBar)
+        self.statusbar.addPermanentWidget(self.btnCancel)
+
+
+    ##
+    # Enables/disables everything that must not run while a job is busy.
+    #
+    def setBusy(self, busy, message=None):
+        for widget in (self.btnAddEntry, self.btnDelEntry, self.btnSave,
+                self.btnReload, self.btnRevert, self.actionOpen_File):
+            widget.setEnabled(not busy)
+        self.actionSearch.setEnabled((not busy) and bool(self.args.index))
+
+        self.progressBar.setVisible(busy)
+        self.btnCancel.setVisible(busy)
+        if busy:
+            # Busy indicator, until the first progress arrives:
+            self.progressBar.setRange(0, 0)
+        else:
+            self.worker = None
+
+        if message:
+            self.statusbar.showMessage(message)
+
+
+    ##
+    # Runs 'worker' in the thread pool. Only one job at a time.
+    # 'finished(result)' and 'cancelled()' are called in the GUI thread.
+    #
+    def startWorker(self, worker, message, finished, cancelled=None):
+        def onFinished(result):
+            self.setBusy(False)
+            finished(result)
+
+        def onCancelled():
+            self.setBusy(False, "Cancelled.")
+            if cancelled:
+                cancelled()
+
+        def onFailed(error):
+            self.setBusy(False, "Failed: {}".format(error))
+            QMessageBox.warning(self, "MERCS", error)
+            if cancelled:
+                cancelled()
+
+        worker.signals.progress.connect(self.workerProgress)
+        worker.signals.finished.connect(onFinished)
+        worker.signals.cancelled.connect(onCancelled)
+        worker.signals.failed.connect(onFailed)
+
+        self.worker = worker
+        self.setBusy(True, message)
+        self.threadPool.start(worker)
+
+
+    ##
+    # Watches the loaded files (inotify, on Linux) for changes of their
+    # xattrs made by other programs, and shows them.
+    #
+    def initWatcher(self):
+        self.watcher = QFileSystemWatcher(self)
+        self.watchTimer = QTimer(self)
+        self.watchTimer.setSingleShot(True)
+        self.watchTimer.setInterval(self.watchDelay)
+        self.watchTimer.timeout.connect(self.filesChangedOnDisk)
+        self.changedOnDisk = False
+        # Our own saves are not changes by others. Their events are ignored
+        # until one 'watchDelay' after saving (for events arriving late):
+        self.saving = False
+        self.savingTimer = QTimer(self)
+        self.savingTimer.setSingleShot(True)
+        self.savingTimer.setInterval(self.watchDelay)
+        self.savingTimer.timeout.connect(self.savingDone)
+        if not self.args.no_watch:
+            self.watcher.fileChanged.connect(self.fileChanged)
+
+
+    def watchFiles(self, filenames):
+        watched = self.watcher.files()
+        if watched:
+            self.watcher.removePaths(watched)
+        existing = [filename for filename in filenames if path.exists(filename)]
+        if existing and not self.args.no_watch:
+            self.watcher.addPaths(existing)
+
+
+    def fileChanged(self, filename):
+        if self.saving:
+            return
+        # (Re)start the timer: events are coalesced until it runs out.
+        self.watchTimer.start()
+
+
+    def savingDone(self):
+        self.saving = False
+
+
+    ##
+    # True if the table has edits that aren't saved yet.
+    #
+    def isModified(self):
+        return self.model.getMetadata() != list(self.aha.getMetadataText())
+
+
+    def filesChangedOnDisk(self):
+        if self.worker:
+            # Loading or saving: try again later.
+            self.watchTimer.start()
+            return
+        if self.isModified():
+            # Don't throw away the user's edits:
+            self.changedOnDisk = True
+            self.statusbar.showMessage("Attributes changed on disk. Save to overwrite them, or Revert to load them.")
+            return
+        self.loadFiles(self.aha.filenames)
+
+
+    def workerProgress(self, done, total):
+        self.progressBar.setRange(0, total)
+        self.progressBar.setValue(done)
+
+
+    def btnCancelClicked(self):
+        if self.worker:
+            self.worker.cancel()
+
+
+    ##
+    # Reads the xattrs of 'filenames' in background, then shows them.
+    # Several files are shown merged: values differing between the files
+    # are flagged, and edits apply to all of them.
+    #
+    def loadFiles(self, filenames):
+        aha = self.aha
+
+        if len(filenames) == 1:
+            name = "'{}'".format(filenames[0])
+        else:
+            name = "{} files".format(len(filenames))
+
+        def loaded(result):
+            aha.setFiles(result)
+            self.changedOnDisk = False
+            self.watchFiles(aha.filenames)
+            message = "Loaded {} attributes from {}.".format(len(aha.getMetadata()), name)
+            if len(filenames) > 1:
+                message += " {} differ between files.".format(len(aha.getMixedKeys()))
+            self.statusbar.showMessage(message)
+            self.btnReloadClicked()
+
+        worker = XattrWorker(aha.readFiles, list(filenames))
+        self.startWorker(worker, "Loading {}...".format(name), loaded)
+
+
     def initProperties(self):
         aha = self.aha
 
@@ -65,9 +278,25 @@ class Ui(QtWidgets.QMainWindow):
         maxWord['value'] = "Empty"
         self.maxWord = maxWord
 
-        table = self.initTable(self.tableWidget)
+        # The table view shows the model through a proxy, which does the
+        # sorting and filtering:
+        self.model = MetadataModel(parent=self)
+        self.model.loader = aha.fetchValueText
+        self.model.placeholder = aha.placeholderText
+        self.proxy = QSortFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.proxy.setFilterKeyColumn(-1)   # filter on keys and values
+        self.proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        # Only values already loaded (see MetadataModel.SortRole):
+        self.proxy.setFilterRole(MetadataModel.SortRole)
+        self.proxy.setSortRole(MetadataModel.SortRole)
+        self.tableView.setModel(self.proxy)
+        self.tableView.setSortingEnabled(True)
+
+        table = self.initTable(self.tableView)
         self.initTableData(table, aha.getMetadataText())
         self.initButtons()
+        self.initFilter()
         self.table = table
 
 
@@ -79,8 +308,24 @@ class Ui(QtWidgets.QMainWindow):
 
         parser.add_argument('-f', '--filename',
             type=str,
+            nargs='+',
             required=True,
-            help='Name of the file/folder to edit metadata of.'
+            help='Name of the file/folder to edit metadata of. Several files are edited together.'
+            )
+        parser.add_argument('-i', '--index',
+            type=str,
+            default=None,
+            help='xattr index database (written by `xscan`) to search in.'
+            )
+        parser.add_argument('-l', '--lazy',
+            action='store_true',
+            default=False,
+            help='Only read the keys when opening a file. Values are read when shown, big ones only when edited. Faster for files with large attributes.'
+            )
+        parser.add_argument('-n', '--no_watch',
+            action='store_true',
+            default=False,
+            help='Don\'t watch the files: changes made by other programs are only shown on reload.'
             )
 
         return parser
@@ -101,12 +346,16 @@ class Ui(QtWidgets.QMainWindow):
         self.btnReload.clicked.connect(self.btnReloadClicked)
         self.btnRevert.clicked.connect(self.btnRevertClicked)
 
+    def initFilter(self):
+        self.filterEdit.textChanged.connect(self.proxy.setFilterFixedString)
+
     ##
     # Initialize menu actions.
     # 
     def initMenu(self):
         self.actionOpen_File.setEnabled(True)
         self.actionOpen_File.triggered.connect(self.openFileDialog)
+        self.actionSearch.triggered.connect(self.searchIndexDialog)
 
 
     def getContentLength(self):
@@ -146,11 +395,6 @@ class Ui(QtWidgets.QMainWindow):
     def initTable(self, table):
         self.maxWord = self.getContentLength()
 
-        #table.setColumnCount(2)
-        table.setRowCount(len(self.aha.getMetadata()))
-
-
-        table.setHorizontalHeaderLabels(['Key', 'Value'])
         # "7" used as multiplier for random char-width (in px)
         table.setColumnWidth(0, self.maxWord['key_limit'] * 7)
         table.setColumnWidth(1, self.maxWord['value_limit'] * 7)
@@ -159,24 +403,32 @@ class Ui(QtWidgets.QMainWindow):
         return table
 
 
+    ##
+    # Swaps all rows of the table model in one go.
+    #
     def initTableData(self, table, metadata):
         print("init Table.")
-        row = 0
-        for key, value in metadata:
-            #print("key: {}, value: {}".format(key, value))
-            table.setItem(row, 0, QTableWidgetItem(key))
-            table.setItem(row, 1, QTableWidgetItem(value))
-            row += 1
-        table.sortItems(0, Qt.AscendingOrder);
+        self.model.setMetadata(metadata)
+        table.sortByColumn(0, Qt.AscendingOrder)
 
     ##
     # Inserts a new, empty row for a new metadata entry.
     #
     def btnAddEntryClicked(self):
         table = self.table
-        self.table.insertRow(table.rowCount())
-        # Scroll to bottom (where new row was inserted):
-        table.verticalScrollBar().setSliderPosition(table.verticalScrollBar().maximum())
+        model = self.model
+
+        # An empty row would be hidden by any filter:
+        self.filterEdit.clear()
+
+        row = model.rowCount()
+        model.insertRows(row, 1)
+
+        # Scroll to where the new row ended up after sorting, and edit it:
+        index = self.proxy.mapFromSource(model.index(row, 0))
+        table.scrollTo(index)
+        table.setCurrentIndex(index)
+        table.edit(index)
 
 
     ##
@@ -184,29 +436,46 @@ class Ui(QtWidgets.QMainWindow):
     #
     def btnDelEntryClicked(self):
         table = self.table
+        model = self.model
 
         # First we create a list of which rows to delete...
+        # (The view shows sorted/filtered rows: map them back to the model.)
         delList : list = []
-        selectedRanges = table.selectedRanges()
-        for r in selectedRanges:
-            for i in range(r.topRow(), r.bottomRow() +1):
-                delList.append(i)
+        for index in table.selectionModel().selectedIndexes():
+            row = self.proxy.mapToSource(index).row()
+            if row not in delList:
+                delList.append(row)
 
         # We need to remove rows from highest index, counting down.
         # otherwise we'll get offset/index issues.
         delList.sort(reverse=True)
         for i in delList:
             #print("deleting row {}".format(i))
-            table.removeRow(i)
-            # TODO: Remove entry from metadata tuple-list, too.
+            model.removeRows(i, 1)
 
 
+    ##
+    # Saves in background. If saving is cancelled or fails, the file may be
+    # written partially: so reload what's actually on disk.
+    #
     def btnSaveClicked(self):
         print("save.")
         aha = self.aha
         metadata = self.getMetadataFromTable()
         aha.setMetadata(metadata)
-        aha.writeMetadata(aha.getMetadata())
+
+        def saved(count):
+            self.savingTimer.start()
+            self.statusbar.showMessage("Saved: {changed} changed, {added} added, {removed} removed.".format(**count))
+
+        def reloadFromDisk():
+            self.savingTimer.start()
+            self.loadFiles(aha.filenames)
+
+        self.savingTimer.stop()
+        self.saving = True
+        worker = XattrWorker(aha.writeMetadata, aha.getMetadata())
+        self.startWorker(worker, "Saving '{}'...".format(aha.filename), saved, reloadFromDisk)
 
 
     def btnReloadClicked(self):
@@ -220,20 +489,19 @@ class Ui(QtWidgets.QMainWindow):
         print("revert.")
         aha = self.aha
 
+        if self.changedOnDisk:
+            self.loadFiles(aha.filenames)
+            return
+
         aha.revertMetadata()
         #print(aha.getMetadata())
         self.btnReloadClicked()
 
 
     def getMetadataFromTable(self):
-        table = self.table
         aha = self.aha
 
-        metadata : list = []
-        for row in range(0, table.rowCount()):
-            key = table.item(row, 0).text()
-            value = table.item(row, 1).text()
-            metadata.append((key, value))
+        metadata = self.model.getMetadata()
 
         return aha.UnicodeToBin(metadata)
 
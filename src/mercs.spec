@@ -3,7 +3,7 @@
 
 a = Analysis(
     ['mercs.py'],
-    pathex=[],
+    pathex=['../helpers'],
     binaries=[],
     datas=[],
     hiddenimports=[],
@@ -0,0 +1,15 @@
+"""Make the standalone modules in src/ and helpers/ importable by the tests.
+
+The helpers import each other as top-level modules (e.g. `from j2x import
+convert_bytes`), just like they do when installed side by side. The tests
+import them the same way (`import xscan`, not `from helpers import xscan`),
+so there's only one copy of each module.
+"""
+
+import pathlib
+import sys
+
+
+ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+sys.path.insert(0, str(ROOT_DIR / "helpers"))
@@ -0,0 +1,178 @@
+"""Enable iterative testing of AHAlodeck."""
+
+import os
+import pathlib
+import pytest
+
+pytest.importorskip("xattr")
+
+from AHAlodeck import AHAlodeck, xattrSize
+
+
+@pytest.fixture
+def aha(tmp_path: pathlib.Path):
+    """Create an AHAlodeck loaded with a file carrying a few xattrs."""
+    path = tmp_path / "file1"
+    path.touch()
+    os.setxattr(path, "user.k1", b"v1")
+    os.setxattr(path, "user.k2", b"v2")
+    os.setxattr(path, "user.k3", b"v3")
+
+    aha = AHAlodeck()
+    aha.setFilename(str(path))
+    aha.loadXattrs()
+    return aha
+
+
+def test_write_metadata_diff(aha: AHAlodeck):
+    """Only changed, added and removed keys are written."""
+    metadata = [
+        ("user.k1", "v1"),
+        ("user.k2", "changed"),
+        ("user.k4", "v4"),
+    ]
+    count = aha.writeMetadata(metadata)
+    assert count == {"changed": 1, "added": 1, "removed": 1}
+
+    stored = dict(
+        (key, os.getxattr(aha.filename, key)) for key in os.listxattr(aha.filename)
+    )
+    assert stored == {
+        "user.k1": b"v1",
+        "user.k2": b"changed",
+        "user.k4": b"v4",
+    }
+
+    # Saving the same data again has nothing left to do:
+    count = aha.writeMetadata(metadata)
+    assert count == {"changed": 0, "added": 0, "removed": 0}
+
+
+def test_multi_file_session(tmp_path: pathlib.Path):
+    """Keys differing between files are merged as MIXED and left alone."""
+    paths = []
+    for i in range(3):
+        path = tmp_path / "track{}".format(i)
+        path.touch()
+        os.setxattr(path, "user.album", b"Done!")
+        os.setxattr(path, "user.title", "title {}".format(i).encode())
+        os.setxattr(path, "user.note", b"<different values>")
+        paths.append(str(path))
+
+    aha = AHAlodeck()
+    aha.loadFiles(paths)
+    # A value that just looks like the placeholder text is not MIXED:
+    assert sorted(aha.getMetadata()) == [
+        ("user.album", b"Done!"),
+        ("user.note", b"<different values>"),
+        ("user.title", AHAlodeck.MIXED),
+    ]
+    assert aha.getMixedKeys() == ["user.title"]
+
+    metadata = [
+        ("user.title", AHAlodeck.MIXED),
+        ("user.note", "<different values>"),
+        ("user.artist", "XBloome"),
+    ]
+    count = aha.writeMetadata(metadata)
+    assert count == {"changed": 0, "added": 3, "removed": 3}
+
+    for i, path in enumerate(paths):
+        assert sorted(os.listxattr(path)) == ["user.artist", "user.note", "user.title"]
+        assert os.getxattr(path, "user.title") == "title {}".format(i).encode()
+        assert os.getxattr(path, "user.note") == b"<different values>"
+        assert os.getxattr(path, "user.artist") == b"XBloome"
+
+
+def test_rename_mixed(tmp_path: pathlib.Path):
+    """A renamed MIXED key has no values to keep: nothing is written."""
+    paths = []
+    for i in range(2):
+        path = tmp_path / "track{}".format(i)
+        path.touch()
+        os.setxattr(path, "user.title", "title {}".format(i).encode())
+        paths.append(str(path))
+
+    aha = AHAlodeck()
+    aha.loadFiles(paths)
+    metadata = aha.UnicodeToBin([("user.name", AHAlodeck.MIXED)])
+    with pytest.raises(ValueError):
+        aha.writeMetadata(metadata)
+    for i, path in enumerate(paths):
+        assert os.listxattr(path) == ["user.title"]
+
+
+def test_lazy_loading(tmp_path: pathlib.Path):
+    """In lazy mode, values are read on demand and big ones only if forced."""
+    path = tmp_path / "file1"
+    path.touch()
+    os.setxattr(path, "user.small", b"v1")
+    os.setxattr(path, "user.blob", b"x" * 1000)
+
+    aha = AHAlodeck()
+    aha.lazy = True
+    aha.lazyLimit = 100
+    aha.loadFiles([str(path)])
+    assert sorted(aha.getMetadata()) == [("user.blob", None), ("user.small", None)]
+
+    assert aha.fetchValueText("user.small") == "v1"
+    assert aha.fetchValue("user.blob") is None
+    assert aha.valueSize("user.blob") == 1000
+    assert xattrSize(str(path), "user.blob") == 1000
+    assert dict(aha.getMetadata()) == {"user.small": b"v1", "user.blob": None}
+
+    # Unloaded values survive a save untouched:
+    count = aha.writeMetadata([("user.small", "v2"), ("user.blob", None)])
+    assert count == {"changed": 1, "added": 0, "removed": 0}
+    assert os.getxattr(path, "user.blob") == b"x" * 1000
+    assert aha.fetchValue("user.blob", force=True) == b"x" * 1000
+
+    # Sizes are remembered until the next load:
+    os.setxattr(path, "user.blob", b"x" * 500)
+    assert aha.valueSize("user.blob") == 1000
+    aha.loadFiles([str(path)])
+    assert aha.valueSize("user.blob") == 500
+
+    # Renaming a key whose value isn't loaded would lose the value:
+    with pytest.raises(ValueError):
+        aha.writeMetadata(aha.UnicodeToBin([("user.small", None), ("user.blob2", None)]))
+    assert sorted(os.listxattr(path)) == ["user.blob", "user.small"]
+
+    # A value as it is on disk is not a change, even if it wasn't loaded:
+    count = aha.writeMetadata(aha.UnicodeToBin([("user.small", "v2"), ("user.blob", None)]))
+    assert count == {"changed": 0, "added": 0, "removed": 0}
+
+
+def test_text_view(aha: AHAlodeck):
+    """The decoded view is kept until the metadata changes."""
+    os.setxattr(aha.filename, "user.binary", b"\xff\x00")
+    aha.loadXattrs()
+
+    text = aha.getMetadataText()
+    assert aha.getMetadataText() is text
+    assert ("user.binary", "ff00") in text
+    assert aha.getMetadata().entry("user.binary").status == "hex"
+
+    # Hex shown for binary values is written back as the original bytes:
+    metadata = aha.UnicodeToBin(text)
+    assert metadata.get("user.binary") == b"\xff\x00"
+    count = aha.writeMetadata(metadata)
+    assert count == {"changed": 0, "added": 0, "removed": 0}
+
+    metadata.set("user.new", "v")
+    aha.setMetadata(metadata)
+    assert aha.getMetadataText() is not text
+    assert ("user.new", "v") in aha.getMetadataText()
+
+
+def test_revert_snapshot(aha: AHAlodeck):
+    """Reverting shares the snapshot's entries; changes don't leak into it."""
+    original = aha.getMetadata().entry("user.k1")
+
+    aha.getMetadata().set("user.k1", "changed")
+    aha.getMetadata().remove("user.k2")
+    assert dict(aha._metadata) == {"user.k1": b"v1", "user.k2": b"v2", "user.k3": b"v3"}
+
+    aha.revertMetadata()
+    assert dict(aha.getMetadata()) == {"user.k1": b"v1", "user.k2": b"v2", "user.k3": b"v3"}
+    assert aha.getMetadata().entry("user.k1") is original
@@ -0,0 +1,107 @@
+"""Enable iterative testing of IDAHA."""
+
+import argparse
+import os
+import pathlib
+import pytest
+
+import idaha
+import xscan
+
+
+KEY = idaha.PREFIX + idaha.KEY
+
+
+@pytest.fixture
+def generator():
+    args = argparse.Namespace(t=6, c=100, r=0, m=127, b=None, s="abc", w=False, j=False)
+    return idaha.CFIDGenerator(args)
+
+
+@pytest.fixture
+def tree(tmp_path: pathlib.Path):
+    """Create files with the same name and creation time in two folders."""
+    root = tmp_path / "tree"
+    for folder in ("a", "b"):
+        (root / folder).mkdir(parents=True)
+        path = root / folder / "same.txt"
+        path.write_bytes(b"")
+        os.utime(path, (1700000000, 1700000000))
+    return root
+
+
+def test_unique_cfid(generator, tree: pathlib.Path):
+    """Colliding IDs get a random string, until they are unique."""
+    seen = set()
+    first, collisions = generator.uniqueCFID(str(tree / "a" / "same.txt"), seen)
+    assert collisions == 0
+    second, collisions = generator.uniqueCFID(str(tree / "b" / "same.txt"), seen)
+    assert collisions == 1
+    assert second.startswith(first[:-len(generator.HEART)] + "-")
+    assert seen == {os.fsencode(first), os.fsencode(second)}
+
+
+def test_assign_tree(generator, tree: pathlib.Path):
+    """IDs are written once to every file, and existing ones are kept."""
+    os.setxattr(tree / "b", KEY, b"existing")
+    stats = idaha.new_stats()
+    assigned = dict(idaha.assign_tree(generator, [str(tree)], stats=stats))
+    assert (stats["files"], stats["assigned"], stats["skipped"], stats["errors"]) == (2, 2, 0, 0)
+    assert stats["collisions"] == 1
+    assert sorted(assigned) == [str(tree / "a" / "same.txt"), str(tree / "b" / "same.txt")]
+    for path, cfid in assigned.items():
+        assert os.getxattr(path, KEY) == os.fsencode(cfid)
+    assert KEY not in os.listxattr(tree / "a")
+
+    # Folders only if asked for:
+    stats = idaha.new_stats()
+    assigned = dict(idaha.assign_tree(generator, [str(tree)], folders=True, stats=stats))
+    assert sorted(assigned) == [str(tree), str(tree / "a")]
+    assert (stats["files"], stats["skipped"]) == (5, 3)
+    assert os.getxattr(tree / "b", KEY) == b"existing"
+
+    stats = idaha.new_stats()
+    assert list(idaha.assign_tree(generator, [str(tree)], folders=True, stats=stats)) == []
+    assert stats["skipped"] == 5
+
+
+def test_index_ids(generator, tree: pathlib.Path, tmp_path: pathlib.Path):
+    """IDs in the index are not assigned again."""
+    path = str(tree / "a" / "same.txt")
+    index = xscan.XattrIndex(str(tmp_path / "xattrs.db"))
+    index.update("/elsewhere", {KEY: os.fsencode(generator.mkCFID(path))})
+    index.close()
+
+    seen = idaha.read_index_ids(str(tmp_path / "xattrs.db"), KEY)
+    assigned = dict(idaha.assign_tree(generator, [path], seen=seen, write=False))
+    assert os.fsencode(assigned[path]) not in idaha.read_index_ids(str(tmp_path / "xattrs.db"), KEY)
+    assert KEY not in os.listxattr(path)
+
+
+def trim_loop(generator, parts, max_length):
+    """The old way: remove one character at a time."""
+    parts = list(parts)
+    while generator.cfid_length(parts, len) > max_length and any(parts):
+        i = next(i for i, part in enumerate(parts) if part)
+        parts[i] = parts[i][:-1]
+    return parts
+
+
+@pytest.mark.parametrize("max_length", range(0, 40))
+def test_fit_parts(generator, max_length: int):
+    """Parts are cut in one step, exactly like removing one character at a time."""
+    parts = ["20240102T030405", "Ünïcödé name.txt", "abcdef"]
+    fitted = generator.fit_parts(parts, max_length, len, generator.trim_string)
+    assert fitted == trim_loop(generator, parts, max_length)
+
+
+@pytest.mark.parametrize("max_bytes", range(12, 60, 4))
+def test_max_bytes(generator, tmp_path: pathlib.Path, max_bytes: int):
+    """A byte budget is kept in UTF-8, without cutting characters in half."""
+    generator.max_total_bytes = max_bytes
+    path = tmp_path / "Ünïcödé ⭐.txt"
+    path.write_bytes(b"")
+    cfid = generator.mkCFID(str(path), 1700000000, random_length=4)
+    assert len(cfid.encode()) <= max_bytes
+    assert cfid.startswith(generator.STAR) and cfid.endswith(generator.HEART)
+    assert generator.trim_bytes("Ü⭐x", 4) == "Ü"
@@ -1,35 +1,27 @@
 """Enable iterative testing of J2X."""
 
-import argparse
+import errno
+import functools
+import io
+import json
+import os
 import pathlib
 import pytest
+import threading
 
 from dataclasses import dataclass
 from typing import Final
 
-from helpers import j2x
+import j2x
 
 
 DEFAULT_PREFIX: Final[str] = "user."
 
 
 @pytest.fixture
-def args():
-    """Create an args object to be used by functions requiring this.
-
-    NB. Eventually it would be good to remove this to avoid use of
-        globals.
-    """
-    parser = argparse.ArgumentParser(description="")
-    parser.add_argument(
-        "-v",
-        "--verbose",
-        action="count",
-        default=0,
-        help="Increase verbosity level.",
-    )
-    args = parser.parse_args()
-    return args
+def writer():
+    """Create a writer object with default configuration."""
+    return j2x.XattrWriter(prefix=DEFAULT_PREFIX)
 
 
 @dataclass
@@ -60,7 +52,7 @@ write_attr_tests = [
 @pytest.mark.parametrize("file_name, input_attrs, stored_attrs", write_attr_tests)
 def test_write_xtattr(
     tmp_path: pathlib.Path,
-    args: argparse.Namespace,
+    writer: j2x.XattrWriter,
     file_name: str,
     input_attrs: KeyValue,
     stored_attrs: list,
@@ -70,9 +62,181 @@ def test_write_xtattr(
         assert False, "test hasn't been configured correctly"
     path = tmp_path / file_name
     path.touch()
-    j2x.args = args
     for attr in input_attrs:
-        j2x.write_xattr(path, attr.key, attr.value, DEFAULT_PREFIX)
+        writer.write_xattr(path, attr.key, attr.value)
     res = j2x.read_xattrs(path)
     assert len(res) == len(stored_attrs)
     assert set(res) == set(stored_attrs)
+
+
+@pytest.mark.parametrize("workers, ordered", [(1, True), (4, True), (4, False)])
+def test_write_bulk(
+    tmp_path: pathlib.Path, writer: j2x.XattrWriter, workers: int, ordered: bool
+):
+    """Test bulk mode: one NDJSON stream, many targets, per-record errors."""
+    for name in ("file1", "file2"):
+        (tmp_path / name).touch()
+    records = [
+        '{{"target": "{}", "attrs": {{"k1": "v1"}}}}'.format(tmp_path / "file1"),
+        "",
+        '{{"target": "{}", "attrs": {{"k1": "v1", "k2": "v2"}}}}'.format(
+            tmp_path / "file2"
+        ),
+        '{{"target": "{}", "attrs": {{"k1": "v1"}}}}'.format(tmp_path / "missing"),
+        "not json",
+    ]
+    summary = j2x.write_bulk(
+        writer, records, workers=workers, ordered=ordered, max_inflight=2
+    )
+    assert summary["records"] == 4
+    assert summary["failed"] == 2
+    assert summary["keys"] == len("user.k1") * 2 + len("user.k2")
+    assert summary["values"] == 6
+    assert set(j2x.read_xattrs(tmp_path / "file2")) == {"user.k1", "user.k2"}
+
+
+def test_write_bulk_same_target(
+    tmp_path: pathlib.Path, writer: j2x.XattrWriter, monkeypatch
+):
+    """Records for the same target are written one after another, in order."""
+    written = {}
+
+    def record(target, data, report=True):
+        written.setdefault(target, []).append((data["n"], threading.get_ident()))
+        return {"keys": 0, "values": 0}
+
+    monkeypatch.setattr(writer, "write_xattrs", record)
+    records = [
+        json.dumps({"target": str(tmp_path / "file{}".format(i % 3)), "attrs": {"n": i}})
+        for i in range(30)
+    ]
+    summary = j2x.write_bulk(writer, records, workers=4, ordered=False)
+    assert summary["failed"] == 0
+    for target, calls in written.items():
+        assert [n for n, _ in calls] == sorted(n for n, _ in calls)
+        assert len({thread for _, thread in calls}) == 1
+
+
+def test_error_policy_skip(tmp_path: pathlib.Path):
+    """Keys that can't be written are collected and skipped."""
+    path = tmp_path / "file1"
+    path.touch()
+    writer = j2x.XattrWriter(prefix=DEFAULT_PREFIX, on_error=j2x.XattrWriter.SKIP)
+    data = {"k1": "v1", "k2": "x" * (os.XATTR_SIZE_MAX + 1), "k3": "v3"}
+    total = writer.write_xattrs(path, data)
+    assert [key for key, _ in total["errors"]] == ["k2"]
+    assert len(writer.errors) == 1
+    assert set(j2x.read_xattrs(path)) == {"user.k1", "user.k3"}
+
+
+def test_error_policy_retry(tmp_path: pathlib.Path, monkeypatch):
+    """Only transient errors are retried, until all attempts have failed."""
+    writer = j2x.XattrWriter(
+        prefix=DEFAULT_PREFIX, on_error=j2x.XattrWriter.RETRY, retries=2, backoff=0
+    )
+    calls = []
+    write_xattr = writer.write_xattr
+
+    def counted(*args):
+        calls.append(args)
+        return write_xattr(*args)
+
+    monkeypatch.setattr(writer, "write_xattr", counted)
+    with pytest.raises(FileNotFoundError):
+        writer.write_xattrs(tmp_path / "missing", {"k1": "v1"})
+    assert len(calls) == 1
+
+    def busy(*args):
+        calls.append(args)
+        raise OSError(errno.EBUSY, "busy")
+
+    calls.clear()
+    monkeypatch.setattr(writer, "write_xattr", busy)
+    with pytest.raises(OSError):
+        writer.write_xattrs(tmp_path / "missing", {"k1": "v1"})
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_iter_json(chunk_size: int):
+    """JSON is parsed value by value, no matter where chunks end."""
+    data = [{"k1": "v" * 100, "n": [1, 2.5, None]}, 12345, "text", []]
+    parse = lambda text: list(j2x.iter_json(io.StringIO(text), chunk_size=chunk_size))
+    assert parse(json.dumps(data, indent=2)) == data
+    assert parse(json.dumps(data[0])) == [data[0]]
+    assert parse("\n".join(json.dumps(value) for value in data)) == data
+    with pytest.raises(json.JSONDecodeError):
+        parse('[{"k1": "v1"} {"k2": "v2"}]')
+    with pytest.raises(json.JSONDecodeError):
+        parse('[{"k1": "v1"},')
+
+
+def test_iter_json_boundaries():
+    """Numbers cut by a chunk boundary are read on, broken input fails early."""
+    text = "[" + " " * (j2x.CHUNK_SIZE - 5) + "2.5e3]"
+    assert list(j2x.iter_json(io.StringIO(text))) == [2500.0]
+
+    stream = io.StringIO('[{"k1": x}' + " " * 100000 + "]")
+    with pytest.raises(json.JSONDecodeError):
+        list(j2x.iter_json(stream, chunk_size=100))
+    assert stream.tell() == 100
+
+    with pytest.raises(json.JSONDecodeError):
+        list(j2x.iter_json(io.StringIO('["' + "x" * 5000 + '"]'), chunk_size=100, max_size=1000))
+
+
+def test_read_json_first():
+    """Only the first element of an array is read."""
+    stream = io.StringIO('[{"k1": "v1"}, ' + '{"k2": "' + "x" * 100000 + '"}]')
+    assert j2x.read_json_first(stream) == {"k1": "v1"}
+    assert stream.tell() <= j2x.CHUNK_SIZE
+
+
+def test_write_bulk_array(tmp_path: pathlib.Path, writer: j2x.XattrWriter):
+    """Bulk input can be a JSON array of records, too."""
+    for name in ("file1", "file2"):
+        (tmp_path / name).touch()
+    records = [
+        {"target": str(tmp_path / "file1"), "attrs": {"k1": "v1"}},
+        {"target": str(tmp_path / "missing"), "attrs": {"k1": "v1"}},
+        {"target": str(tmp_path / "file2"), "attrs": {"k2": "v2"}},
+    ]
+    summary = j2x.write_bulk(writer, io.StringIO("\n " + json.dumps(records, indent=1)))
+    assert (summary["records"], summary["failed"]) == (3, 1)
+    assert set(j2x.read_xattrs(tmp_path / "file2")) == {"user.k2"}
+
+
+def test_flatten():
+    """Nested objects become dotted keys, lists of objects are numbered."""
+    data = {"format": {"tags": {"title": "t"}}, "streams": [{"codec": "mp3"}], "list": [1, 2]}
+    assert list(j2x.flatten(data)) == [
+        ("format.tags.title", "t"),
+        ("streams.0.codec", "mp3"),
+        ("list", [1, 2]),
+    ]
+
+
+def test_media_record():
+    """Records are routed to the file they describe, below their namespace."""
+    exif = {"SourceFile": "src/a.jpg", "EXIF": {"Make": "X"}}
+    record = j2x.media_record(exif, mapping=("src", "copy"))
+    assert record == {"target": "copy/a.jpg", "attrs": [
+        ("exiftool.SourceFile", "src/a.jpg"), ("exiftool.EXIF.Make", "X")]}
+
+    probe = {"format": {"filename": "b.mp3"}}
+    namespaces = j2x.media_namespaces(["ffprobe=av."])
+    assert j2x.media_record(probe, namespaces=namespaces)["attrs"] == [("av.format.filename", "b.mp3")]
+    assert j2x.media_record(probe, target="c")["target"] == "c"
+    with pytest.raises(ValueError):
+        j2x.media_record({"streams": []}, j2x.FFPROBE)
+
+
+def test_write_bulk_exiftool(tmp_path: pathlib.Path, writer: j2x.XattrWriter):
+    """One `exiftool -json -r` array is written to all of its files in one pass."""
+    for name in ("a.jpg", "b.mp3"):
+        (tmp_path / name).touch()
+    data = [{"SourceFile": str(tmp_path / name), "Title": name} for name in ("a.jpg", "b.mp3")]
+    convert = functools.partial(j2x.media_record, fmt=j2x.EXIFTOOL)
+    summary = j2x.write_bulk(writer, io.StringIO(json.dumps(data)), workers=2, convert=convert)
+    assert (summary["records"], summary["failed"]) == (2, 0)
+    assert os.getxattr(tmp_path / "b.mp3", "user.exiftool.Title") == b"b.mp3"
@@ -0,0 +1,32 @@
+"""Enable iterative testing of the MERCS table model."""
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from AHAlodeck import AHAlodeck
+from MetadataModel import MetadataModel
+
+
+def test_mixed():
+    """MIXED is shown as text, and stays MIXED unless really edited."""
+    model = MetadataModel([("user.title", AHAlodeck.MIXED), ("user.note", "<different values>")])
+    assert model.data(model.index(0, 1)) == model.mixedText
+    assert model.setData(model.index(0, 1), model.mixedText)
+    assert model.getMetadata()[0] == ("user.title", AHAlodeck.MIXED)
+
+    # Renaming would lose each file's own value:
+    assert not model.setData(model.index(0, 0), "user.name")
+    assert model.getMetadata()[0] == ("user.title", AHAlodeck.MIXED)
+    assert model.setData(model.index(1, 0), "user.comment")
+
+
+def test_rename_unloaded():
+    """Renaming a key loads its value first, or fails."""
+    values = {"user.small": "v1"}
+    model = MetadataModel([("user.small", None), ("user.blob", None)])
+    model.loader = lambda key, force: values.get(key)
+    assert model.setData(model.index(0, 0), "user.renamed")
+    assert model.getMetadata()[0] == ("user.renamed", "v1")
+    assert not model.setData(model.index(1, 0), "user.blob2")
+    assert model.getMetadata()[1] == ("user.blob", None)
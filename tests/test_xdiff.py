@@ -0,0 +1,97 @@
+"""Enable iterative testing of XDIFF."""
+
+import os
+import pathlib
+import re
+import pytest
+
+import xdiff
+import xscan
+import xsnap
+
+
+def make_tree(root: pathlib.Path, files: dict):
+    """Create files (relative path -> xattrs) below `root`."""
+    for name, xattrs in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+        for key, value in xattrs.items():
+            os.setxattr(path, key, value)
+    return root
+
+
+@pytest.fixture
+def trees(tmp_path: pathlib.Path):
+    """An original tree, and a copy that lost and changed some xattrs."""
+    old = make_tree(tmp_path / "old", {
+        "a.txt": {"user.k": b"2"},
+        "a/b": {},
+        "ab": {"user.k": b"3", "user.gone": b"x"},
+    })
+    new = make_tree(tmp_path / "new", {
+        "a.txt": {"user.k": b"2"},
+        "a/b": {"user.new": b"!"},
+        "ab": {"user.k": b"changed"},
+        "c": {},
+    })
+    return old, new
+
+
+def diff(old: str, new: str, **kwargs):
+    stats = xdiff.new_stats()
+    a, _ = xdiff.open_side(old, **kwargs)
+    b, _ = xdiff.open_side(new, **kwargs)
+    found = [(kind, relative, keys) for kind, relative, _, _, keys in xdiff.diff(a, b, stats)]
+    return found, stats
+
+
+def test_walk_sorted(trees):
+    """Live trees are walked in the order of their sorted paths."""
+    old, _ = trees
+    found = [relative for relative, _ in xdiff.walk_sorted(old)]
+    assert found == ["", "a", "a.txt", "a/b", "ab"]
+    assert found == sorted(found, key=os.fsencode)
+
+
+def test_diff_trees(trees):
+    """Added, removed and changed keys are found between live trees."""
+    old, new = trees
+    found, stats = diff(str(old), str(new))
+    assert found == [
+        ("changed", "a/b", (["user.new"], [], [])),
+        ("changed", "ab", ([], ["user.gone"], ["user.k"])),
+        ("added", "c", None),
+    ]
+    assert stats["same"] == 3
+
+    # Only user.k, and no files called "c":
+    found, _ = diff(str(old), str(new), match=re.compile(r"^user\.k$"), exclude=["c"])
+    assert found == [("changed", "ab", ([], [], ["user.k"]))]
+
+
+def test_diff_snapshots(tmp_path: pathlib.Path, trees):
+    """Snapshots compare like trees, same files by fingerprint."""
+    old, new = trees
+    snapshots = []
+    for tree in (old, new):
+        filename = str(tmp_path / (tree.name + ".xsnap"))
+        index = xscan.XattrIndex(str(tmp_path / (tree.name + ".db")))
+        with xsnap.SnapshotWriter(filename) as writer:
+            xscan.scan(index, [str(tree)], snapshot=writer)
+        index.close()
+        snapshots.append(filename)
+
+    expected, _ = diff(str(old), str(new))
+
+    found, stats = diff(snapshots[0], str(new))
+    assert found == expected
+    assert stats["fast"] == 3
+
+    found, stats = diff(snapshots[0], snapshots[1])
+    assert found == expected
+    assert stats["fast"] == 3
+
+    # A folder inside a snapshot:
+    found, _ = diff(snapshots[0] + str(old / "a"), str(new / "a"))
+    assert found == [("changed", "b", (["user.new"], [], []))]
@@ -0,0 +1,49 @@
+"""Enable iterative testing of XHASH."""
+
+import hashlib
+import os
+import pathlib
+import pytest
+
+import xhash
+import xscan
+
+
+@pytest.fixture
+def tree(tmp_path: pathlib.Path):
+    """Create files with contents, two of them with the same xattrs."""
+    root = tmp_path / "tree"
+    root.mkdir()
+    for name, content in (("a", b"mercs\n"), ("b", b"x" * 3000), ("c", b"")):
+        path = root / name
+        path.write_bytes(content)
+        os.setxattr(path, "user.title", b"same" if name != "c" else b"other")
+    return root
+
+
+def test_hash_payload(tree: pathlib.Path):
+    """Contents are hashed in chunks, like hashing them at once."""
+    data = (tree / "b").read_bytes()
+    assert xhash.hash_payload(tree / "b", "sha256", chunk_size=1000) == (
+        hashlib.sha256(data).hexdigest(), len(data))
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_hash_tree(tree: pathlib.Path, workers: int):
+    """Fingerprints ignore the checksum key, which is written only if changed."""
+    stats = xhash.new_stats()
+    results = list(xhash.hash_tree([str(tree)], write=True, workers=workers, stats=stats))
+    assert stats["files"] == 4
+    assert (stats["hashed"], stats["written"], stats["errors"]) == (3, 3, 0)
+
+    by_name = {os.path.basename(r["path"]): r for r in results}
+    assert os.getxattr(tree / "a", "user.checksum") == hashlib.md5(b"mercs\n").hexdigest().encode()
+    assert by_name["a"]["fingerprint"] == by_name["b"]["fingerprint"] != by_name["c"]["fingerprint"]
+    assert by_name["a"]["fingerprint"] == xscan.fingerprint({"user.title": b"same"}).hex()
+    assert by_name["tree"]["payload"] is None
+
+    # Nothing changed, nothing to write:
+    stats = xhash.new_stats()
+    again = list(xhash.hash_tree([str(tree)], write=True, workers=workers, stats=stats))
+    assert stats["written"] == 0
+    assert [r["fingerprint"] for r in again] == [r["fingerprint"] for r in results]
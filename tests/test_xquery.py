@@ -0,0 +1,83 @@
+"""Enable iterative testing of XQUERY."""
+
+import pathlib
+import pytest
+
+import xquery
+import xscan
+
+
+@pytest.fixture
+def query(tmp_path: pathlib.Path):
+    """Create an index with a few songs, without touching the filesystem."""
+    index = xscan.XattrIndex(str(tmp_path / "index.db"))
+    songs = {
+        "/a.mp3": {"user.exif.Artist": b"XBloome", "user.dublincore.date": b"2008"},
+        "/b.mp3": {"user.exif.Artist": b"XBloome", "user.dublincore.date": b"1999"},
+        "/c.mp3": {"user.exif.Artist": b"Other", "user.exif.Genre": b"Rock"},
+        "/d.txt": {"user.checksum": b"abc", "user.dublincore.date": b"unknown"},
+    }
+    for path, xattrs in songs.items():
+        index.update(path, xattrs)
+    index.commit()
+    yield xquery.XattrQuery(index)
+    index.close()
+
+
+search_tests = [
+    ("user.exif.*", ["/a.mp3", "/b.mp3", "/c.mp3"]),
+    ("user.exif.Artist=XBloome", ["/a.mp3", "/b.mp3"]),
+    ("user.exif.Artist!=XBloome", ["/c.mp3"]),
+    ("user.exif.Artist~^X.*e$", ["/a.mp3", "/b.mp3"]),
+    ("user.dublincore.date>=2000", ["/a.mp3"]),
+    ("user.dublincore.date<2000", ["/b.mp3"]),
+    ("user.exif.Artist=XBloome and not user.dublincore.date<2000", ["/a.mp3"]),
+    ("user.exif.Genre=Rock or user.checksum", ["/c.mp3", "/d.txt"]),
+    ("not ( user.exif.* or user.checksum )", []),
+    ("user.missing", []),
+]
+
+
+@pytest.mark.parametrize("query_string, expected", search_tests)
+def test_search(query: xquery.XattrQuery, query_string: str, expected: list):
+    """Test key patterns, value operators and boolean combinations."""
+    assert query.search(query_string) == expected
+    assert query.count(query_string) == len(expected)
+
+
+@pytest.mark.parametrize("query_string", ["", "and", "( user.a", "user.a )", "user.a>=abc", "user.exif.Artist~("])
+def test_parse_errors(query_string: str):
+    """Broken queries raise ValueError."""
+    with pytest.raises(ValueError):
+        xquery.parse(query_string)
+
+
+def test_search_bad_regex(query: xquery.XattrQuery):
+    """An invalid ~ pattern is a ValueError, not an sqlite3 error."""
+    with pytest.raises(ValueError):
+        query.search("user.exif.Artist~(")
+
+
+text_search_tests = [
+    ("xbloome", None, ["/a.mp3", "/b.mp3"]),
+    ("XBLOOME 2008", None, ["/a.mp3"]),
+    ("xbl*", None, ["/a.mp3", "/b.mp3"]),
+    ("rock", ["user.dublincore.*"], []),
+    ("rock", ["user.exif.*"], ["/c.mp3"]),
+    ("nothing", None, []),
+]
+
+
+@pytest.mark.parametrize("words, keys, expected", text_search_tests)
+def test_text_search(query: xquery.XattrQuery, words: str, keys: list, expected: list):
+    """Test full-text search with key scoping and prefixes."""
+    results = query.text_search(words, keys=keys)
+    assert sorted(path for path, _ in results) == expected
+
+
+def test_text_search_ranking(query: xquery.XattrQuery):
+    """Rare words weigh more than common ones."""
+    index = query.index
+    index.update("/e.mp3", {"user.exif.Comment": b"rock rock rock"})
+    results = query.text_search("rock")
+    assert [path for path, _ in results] == ["/e.mp3", "/c.mp3"]
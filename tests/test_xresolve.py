@@ -0,0 +1,68 @@
+"""Enable iterative testing of XRESOLVE."""
+
+import os
+import pathlib
+import pytest
+
+import xresolve
+import xscan
+
+
+KEY = xresolve.KEY
+
+
+@pytest.fixture
+def tree(tmp_path: pathlib.Path):
+    """Create files with IDs in nested folders."""
+    root = tmp_path / "tree"
+    (root / "a" / "deep").mkdir(parents=True)
+    (root / "b").mkdir()
+    for name in ("a", "a/one", "a/deep/two", "b/three"):
+        if not (root / name).exists():
+            (root / name).write_bytes(b"")
+        os.setxattr(root / name, KEY, name.encode())
+    return root
+
+
+@pytest.fixture
+def index(tree: pathlib.Path, tmp_path: pathlib.Path):
+    index = xscan.XattrIndex(str(tmp_path / "xattrs.db"))
+    xscan.scan(index, [str(tree)])
+    yield index
+    index.close()
+
+
+def test_resolve(index, tree: pathlib.Path):
+    """IDs are looked up in the index."""
+    assert xresolve.resolve(index, "a/deep/two") == str(tree / "a" / "deep" / "two")
+    assert xresolve.resolve(index, "unknown") is None
+
+
+def test_resolve_moved(index, tree: pathlib.Path):
+    """A moved file is found by its inode, and the index updated."""
+    os.rename(tree / "a" / "one", tree / "b" / "renamed")
+    # Not below --root:
+    assert xresolve.resolve(index, "a/one", roots=[str(tree / "a")]) is None
+    # Parents are searched too, up to the mount point by default:
+    new = str(tree / "b" / "renamed")
+    assert xresolve.resolve(index, "a/one") == new
+    assert index.find(KEY, b"a/one")[0][1] == new
+    assert index.lookup(str(tree / "a" / "one")) is None
+
+
+def test_relocate_all(index, tree: pathlib.Path):
+    """Moved folders are found in one walk, with everything in them."""
+    os.rename(tree / "a", tree / "b" / "moved")
+    stats = xresolve.relocate_all(index, roots=[str(tree)])
+    assert (stats["ids"], stats["missing"], stats["relocated"]) == (4, 3, 3)
+    assert index.find(KEY, b"a/deep/two")[0][1] == str(tree / "b" / "moved" / "deep" / "two")
+    assert index.get(str(tree / "b" / "moved" / "deep")) == {}
+    assert index.lookup(str(tree / "a")) is None
+
+
+def test_search_folders(tree: pathlib.Path):
+    """The nearest existing folder first, then its parents."""
+    searches = xresolve.search_folders(str(tree / "a" / "gone" / "file"), [str(tree)])
+    assert searches == [(str(tree / "a"), None), (str(tree), str(tree / "a"))]
+    searches = xresolve.search_folders(str(tree / "a" / "file"), [])
+    assert searches[-1][0] == xresolve.mount_point(str(tree))
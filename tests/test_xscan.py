@@ -0,0 +1,96 @@
+"""Enable iterative testing of XSCAN."""
+
+import os
+import pathlib
+import pytest
+
+import xscan
+
+
+@pytest.fixture
+def tree(tmp_path: pathlib.Path):
+    """Create a small tree of files carrying xattrs."""
+    root = tmp_path / "tree"
+    (root / "sub").mkdir(parents=True)
+    (root / "skip").mkdir()
+    for name in ("a.mp3", "b.jpg", "sub/c.mp3", "skip/d.mp3"):
+        path = root / name
+        path.touch()
+        os.setxattr(path, "user.name", name.encode())
+    os.symlink(root / "a.mp3", root / "link.mp3")
+    return root
+
+
+def test_walk_filters(tree: pathlib.Path):
+    """Include/exclude patterns and symlink policy are applied."""
+    found = [
+        os.path.relpath(path, tree)
+        for path, _ in xscan.walk(tree, include=["*.mp3"], exclude=["skip"])
+    ]
+    assert sorted(found) == [".", "a.mp3", "sub", "sub/c.mp3"]
+
+    found = [
+        os.path.relpath(path, tree)
+        for path, _ in xscan.walk(tree, symlinks=xscan.SYMLINKS_NOFOLLOW)
+    ]
+    assert "link.mp3" in found
+
+
+def test_scan(tmp_path: pathlib.Path, tree: pathlib.Path):
+    """Every object's xattrs end up in the index."""
+    index = xscan.XattrIndex(str(tmp_path / "index.db"))
+    stats = xscan.scan(index, [str(tree)])
+    assert stats["files"] == 7
+    assert stats["attrs"] == 4
+    assert stats["errors"] == 0
+    assert (stats["keys"], stats["namespaces"]) == (1, 1)
+    assert stats["key_bytes"] == 4 * len("user.name")
+    assert stats["interned_bytes"] < stats["key_bytes"]
+    assert index.get(str(tree / "sub" / "c.mp3")) == {"user.name": b"sub/c.mp3"}
+    assert index.get(str(tree / "missing")) is None
+    index.close()
+
+
+def test_scan_incremental(tmp_path: pathlib.Path, tree: pathlib.Path):
+    """Only changed objects are read again, vanished ones are removed."""
+    index = xscan.XattrIndex(str(tmp_path / "index.db"))
+    xscan.scan(index, [str(tree)])
+
+    os.setxattr(tree / "b.jpg", "user.new", b"1")
+    (tree / "sub" / "c.mp3").unlink()
+    stats = xscan.scan(index, [str(tree)])
+    assert stats["updated"] == 1
+    assert stats["unchanged"] == 1  # folder "sub": ctime changed, xattrs didn't
+    assert stats["removed"] == 1
+    assert stats["skipped"] == stats["files"] - 2
+    assert index.get(str(tree / "b.jpg")) == {
+        "user.name": b"b.jpg",
+        "user.new": b"1",
+    }
+    assert index.get(str(tree / "sub" / "c.mp3")) is None
+
+    stats = xscan.scan(index, [str(tree)], full=True)
+    assert stats["skipped"] == 0
+    assert stats["updated"] == stats["files"]
+    index.close()
+
+
+def test_scan_narrower_filter(tmp_path: pathlib.Path, tree: pathlib.Path):
+    """Files left out by a narrower filter stay in the index, if they exist."""
+    index = xscan.XattrIndex(str(tmp_path / "index.db"))
+    xscan.scan(index, [str(tree)])
+    stats = xscan.scan(index, [str(tree)], include=["*.mp3"], exclude=["skip"])
+    assert stats["removed"] == 0
+    assert index.get(str(tree / "b.jpg")) == {"user.name": b"b.jpg"}
+    assert index.get(str(tree / "skip" / "d.mp3")) == {"user.name": b"skip/d.mp3"}
+    index.close()
+
+
+@pytest.mark.parametrize("key, expected", [
+    ("user.exif.Audio Bitrate", ("user.exif.", "Audio Bitrate")),
+    ("user.title", ("user.", "title")),
+    ("nodots", ("", "nodots")),
+])
+def test_split_key(key: str, expected: tuple):
+    """Keys are split into namespace and name at the last dot."""
+    assert xscan.split_key(key) == expected
@@ -0,0 +1,127 @@
+"""Enable iterative testing of XSNAP."""
+
+import io
+import os
+import pathlib
+import pytest
+
+import xdump
+import xscan
+import xsnap
+
+
+@pytest.fixture
+def tree(tmp_path: pathlib.Path):
+    """Create a small tree of files carrying xattrs."""
+    root = tmp_path / "tree"
+    (root / "sub").mkdir(parents=True)
+    for name in ("a.mp3", "b.jpg", "sub/c.mp3"):
+        path = root / name
+        path.touch()
+        os.setxattr(path, "user.name", name.encode())
+    os.setxattr(root / "a.mp3", "user.blob", b"\x00\xff")
+    os.setxattr(root / "b.jpg", "user.exif.Audio Bitrate", b"128 kbps")
+    return root
+
+
+@pytest.fixture
+def snapshot(tmp_path: pathlib.Path, tree: pathlib.Path):
+    """Scan the tree, writing a snapshot along with the index."""
+    filename = str(tmp_path / "tree.xsnap")
+    index = xscan.XattrIndex(str(tmp_path / "index.db"))
+    with xsnap.SnapshotWriter(filename) as writer:
+        stats = xscan.scan(index, [str(tree)], snapshot=writer)
+    assert stats["errors"] == 0
+
+    # A second (incremental) scan takes skipped files from the index:
+    with xsnap.SnapshotWriter(filename) as writer:
+        stats = xscan.scan(index, [str(tree)], snapshot=writer)
+    assert stats["skipped"] == stats["files"]
+    index.close()
+    return filename
+
+
+def test_key_sizes(tmp_path: pathlib.Path):
+    """The writer reports how big the keys are, as they are and as stored."""
+    with xsnap.SnapshotWriter(str(tmp_path / "keys.xsnap")) as writer:
+        for i in range(10):
+            writer.add("/file{}".format(i), {"user.name": b"x", "user.exif.Artist": b"y"})
+    assert writer.key_bytes == 10 * len("user.nameuser.exif.Artist")
+    assert writer.namespaces == 2
+    # Dictionary: 2 namespaces ("user.", "user.exif."), 2 names, plus counts:
+    dictionary = (4 + 2 + 5 + 2 + 10) + (4 + 6 + 4 + 6 + 6)
+    assert writer.stored_key_bytes == dictionary + 20 * xscan.KEY_ID_SIZE
+
+
+def test_read(snapshot: str, tree: pathlib.Path):
+    """Every file is in the snapshot, values are read without copying."""
+    assert xsnap.is_snapshot(snapshot)
+    with xsnap.Snapshot(snapshot) as snap:
+        assert len(snap) == 5
+        paths = [path for path, _, _ in snap]
+        assert paths == sorted(paths)
+
+        xattrs = snap.get(str(tree / "a.mp3"))
+        assert isinstance(xattrs["user.name"], memoryview)
+        assert {key: bytes(value) for key, value in xattrs.items()} == {
+            "user.name": b"a.mp3",
+            "user.blob": b"\x00\xff",
+        }
+        assert snap.digest(str(tree / "a.mp3")) == xscan.fingerprint(xscan.read_xattrs(tree / "a.mp3"))
+        assert bytes(snap.get(str(tree / "b.jpg"))["user.exif.Audio Bitrate"]) == b"128 kbps"
+        assert sorted(snap.keys) == ["user.blob", "user.exif.Audio Bitrate", "user.name"]
+        assert snap.get(str(tree / "sub")) == {}
+        assert snap.get(str(tree / "missing")) is None
+
+
+def test_incomplete(tmp_path: pathlib.Path):
+    """A snapshot whose writer didn't finish is refused."""
+    filename = str(tmp_path / "broken.xsnap")
+    writer = xsnap.SnapshotWriter(filename)
+    writer.add("/x", {"user.a": b"1"})
+    writer.stream.close()
+    with pytest.raises(ValueError):
+        xsnap.Snapshot(filename)
+
+
+def test_restore(tmp_path: pathlib.Path, snapshot: str, tree: pathlib.Path):
+    """xdump restores a snapshot like a text dump."""
+    for name in ("a.mp3", "b.jpg", "sub/c.mp3"):
+        for key in os.listxattr(tree / name):
+            os.removexattr(tree / name, key)
+
+    with xsnap.Snapshot(snapshot) as snap:
+        stats = xdump.restore_files(xdump.read_snapshot(snap), directory="/")
+    assert stats["errors"] == 0
+    assert os.getxattr(tree / "sub/c.mp3", "user.name") == b"sub/c.mp3"
+    assert os.getxattr(tree / "a.mp3", "user.blob") == b"\x00\xff"
+
+
+def test_restore_directory(tmp_path: pathlib.Path, snapshot: str, tree: pathlib.Path):
+    """Snapshot paths are restored below --directory, not where they were."""
+    copy = tmp_path / "copy"
+    target = copy / str(tree).lstrip("/")
+    (target / "sub").mkdir(parents=True)
+    for name in ("a.mp3", "b.jpg", "sub/c.mp3"):
+        (target / name).touch()
+    os.removexattr(tree / "a.mp3", "user.name")
+
+    with xsnap.Snapshot(snapshot) as snap:
+        stats = xdump.restore_files(xdump.read_snapshot(snap), directory=str(copy))
+    assert stats["errors"] == 0
+    assert os.getxattr(target / "sub/c.mp3", "user.name") == b"sub/c.mp3"
+    assert "user.name" not in os.listxattr(tree / "a.mp3")
+
+
+def test_open_in_ahalodeck(snapshot: str, tree: pathlib.Path):
+    """A file in a snapshot can be loaded like a live one, read-only."""
+    pytest.importorskip("xattr")
+    from AHAlodeck import AHAlodeck
+
+    aha = AHAlodeck()
+    aha.loadFiles([snapshot + str(tree / "a.mp3")])
+    assert dict(aha.getMetadata()) == {"user.name": b"a.mp3", "user.blob": b"\x00\xff"}
+    assert aha.valueSize("user.blob") == 2
+
+    with pytest.raises(OSError):
+        aha.writeMetadata([("user.name", "changed")])
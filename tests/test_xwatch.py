@@ -0,0 +1,70 @@
+"""Enable iterative testing of XWATCH."""
+
+import os
+import pathlib
+import pytest
+
+import xscan
+import xwatch
+
+
+@pytest.fixture
+def watched(tmp_path: pathlib.Path):
+    """An indexed tree, and a watcher on it."""
+    root = tmp_path / "tree"
+    (root / "sub").mkdir(parents=True)
+    (root / "a.mp3").touch()
+    index = xscan.XattrIndex(str(tmp_path / "index.db"))
+    watcher = xwatch.Watcher([str(root)])
+    xscan.scan(index, [str(root)])
+    yield root, index, watcher
+    watcher.close()
+    index.close()
+
+
+def test_coalescing(watched):
+    """Many writes to one file are one change."""
+    root, index, watcher = watched
+    for i in range(100):
+        os.setxattr(root / "a.mp3", "user.k{}".format(i), b"v")
+
+    changes = watcher.changes(delay=0.2, timeout=2)
+    assert list(changes) == [str(root / "a.mp3")]
+    assert changes[str(root / "a.mp3")] & xwatch.IN_ATTRIB
+
+    stats = xwatch.apply_changes(index, watcher, changes)
+    assert stats["updated"] == 1
+    assert len(index.get(str(root / "a.mp3"))) == 100
+
+
+def test_created_and_removed(watched):
+    """New folders are indexed and watched, deleted objects removed."""
+    root, index, watcher = watched
+    new = root / "sub" / "new"
+    new.mkdir()
+    (new / "b.mp3").touch()
+    os.setxattr(new / "b.mp3", "user.title", b"B")
+    (root / "a.mp3").unlink()
+
+    changes = watcher.changes(delay=0.2, timeout=2)
+    xwatch.apply_changes(index, watcher, changes)
+    assert index.get(str(new / "b.mp3")) == {"user.title": b"B"}
+    assert index.get(str(root / "a.mp3")) is None
+    assert str(new) in watcher.inotify.wds
+
+    # The new folder is watched, too:
+    os.setxattr(new / "b.mp3", "user.title", b"changed")
+    changes = watcher.changes(delay=0.2, timeout=2)
+    xwatch.apply_changes(index, watcher, changes)
+    assert index.get(str(new / "b.mp3")) == {"user.title": b"changed"}
+
+
+def test_overflow(watched):
+    """Lost events lead to a rescan, with the same filters."""
+    root, index, watcher = watched
+    (root / "b.jpg").touch()
+    (root / "c.mp3").touch()
+    changes = {None: xwatch.IN_Q_OVERFLOW}
+    xwatch.apply_changes(index, watcher, changes, include=["*.mp3"])
+    assert index.get(str(root / "c.mp3")) == {}
+    assert index.get(str(root / "b.jpg")) is None